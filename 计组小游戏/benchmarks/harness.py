@@ -0,0 +1,131 @@
+"""
+基准测试公用工具
+
+负责无显示环境设置、计时、统计(中位数和百分位数)以及基线的保存与比较。
+"""
+import json
+import os
+import platform
+import sys
+import time
+
+# 无显示的Linux机器上使用SDL的dummy视频驱动
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+# 让基准测试可以直接导入 game 包
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import numpy as np
+import pygame
+
+
+def init_pygame(size=(800, 600)):
+    """初始化pygame并返回一个屏幕大小的离屏surface"""
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+    return pygame.Surface(size)
+
+
+def percentile(sorted_values, p):
+    """计算已排序序列的百分位数(线性插值)"""
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100.0
+    low = int(k)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (k - low)
+
+
+def summarize(samples):
+    """
+    汇总一组耗时样本
+
+    Args:
+        samples: 每次调用的耗时(秒)
+
+    Returns:
+        stats: 以毫秒为单位的 median/p90/p99/min/mean，以及样本数
+    """
+    values = sorted(samples)
+    return {
+        "n": len(values),
+        "median_ms": percentile(values, 50) * 1000.0,
+        "p90_ms": percentile(values, 90) * 1000.0,
+        "p99_ms": percentile(values, 99) * 1000.0,
+        "min_ms": values[0] * 1000.0 if values else 0.0,
+        "mean_ms": sum(values) / len(values) * 1000.0 if values else 0.0,
+    }
+
+
+def measure(fn, repeat, warmup=1, setup=None):
+    """
+    重复调用fn并返回每次调用的耗时
+
+    Args:
+        fn: 被测函数
+        repeat: 计时次数
+        warmup: 不计时的预热次数
+        setup: 每次调用前执行且不计时的函数(例如清空缓存)
+    """
+    for _ in range(warmup):
+        if setup:
+            setup()
+        fn()
+
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def environment_info():
+    """记录运行环境，便于比较不同机器上的基线"""
+    return {
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+    }
+
+
+def save_baseline(path, results):
+    """把结果保存为JSON基线"""
+    with open(path, "w") as f:
+        json.dump({"environment": environment_info(), "results": results}, f, indent=2, sort_keys=True)
+
+
+def load_baseline(path):
+    """读取JSON基线中的结果部分"""
+    with open(path) as f:
+        return json.load(f)["results"]
+
+
+def compare(results, baseline, threshold):
+    """
+    与基线比较中位数
+
+    Args:
+        results: 本次运行结果 {名称: stats}
+        baseline: 基线结果 {名称: stats}
+        threshold: 允许的相对变慢比例，例如0.15表示15%
+
+    Returns:
+        rows: (名称, 基线中位数, 当前中位数, 变化比例, 是否回归) 列表
+    """
+    rows = []
+    for name, stats in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]["median_ms"]
+        new = stats["median_ms"]
+        change = (new - old) / old if old > 0 else 0.0
+        rows.append((name, old, new, change, change > threshold))
+    return rows
@@ -0,0 +1,849 @@
+"""
+热点路径基准测试
+
+覆盖寻路(AStar.find_path，heapq与桶队列，按帧分配预算的 PathScheduler)、净空距离场(Map.get_clearance)、分块世界(ChunkedWorld)、订单日志读取(game.orders)、随时间变化的最早到达查询(game.time_routing)、渲染(Map.draw / render_terrain / Minimap / PackageManager.draw / SpriteRenderer)、
+包裹模拟(PackageManager.update)、无界面的 GameManager.update
+以及向量化多环境 VectorEnv.step 的吞吐量。
+
+用法:
+    python benchmarks/run_benchmarks.py                      # 运行全部基准
+    python benchmarks/run_benchmarks.py --quick astar        # 只运行astar组的小规模基准
+    python benchmarks/run_benchmarks.py --save-baseline baseline.json
+    python benchmarks/run_benchmarks.py --compare baseline.json --threshold 0.15
+
+与基线比较时，任一基准的中位数变慢超过阈值则以退出码1结束。
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import harness
+from harness import np, pygame
+
+from game.map import Map
+from game.pathfinding import AStar
+from game.package_manager import Package, PackageManager
+from game.player import Player
+from game.sprites import SpriteRenderer
+
+# 已注册的基准: (名称前缀, 函数)
+BENCHMARKS = []
+
+
+def benchmark(prefix):
+    """注册一个基准组，函数需返回 (名称, 样本, 附加信息) 的列表"""
+    def decorator(fn):
+        BENCHMARKS.append((prefix, fn))
+        return fn
+    return decorator
+
+
+def make_map(width, height, density, seed, lakes=0):
+    """
+    生成带随机障碍的地图
+
+    在默认校园地图的草地上按density比例随机放置建筑物，再放置lakes个8x6的水域，
+    道路、起点和配送点保持不变。
+    """
+    game_map = Map(width, height)
+    rng = np.random.default_rng(seed)
+    obstacles = (rng.random((height, width)) < density) & (game_map.grid == Map.GRASS)
+    game_map.grid[obstacles] = Map.BUILDING
+    for _ in range(lakes):
+        x = rng.integers(0, width - 8)
+        y = rng.integers(0, height - 6)
+        area = game_map.grid[y:y + 6, x:x + 8]
+        area[area == Map.GRASS] = Map.WATER
+    game_map.version += 1
+    return game_map
+
+
+def random_queries(game_map, count, seed):
+    """在可行走格子中随机选取起终点对，优先选择相距较远的点"""
+    rng = random.Random(seed)
+    ys, xs = np.nonzero((game_map.grid != Map.BUILDING) & (game_map.grid != Map.WATER))
+    cells = list(zip(xs.tolist(), ys.tolist()))
+    min_distance = (game_map.width + game_map.height) // 2
+    queries = []
+    while len(queries) < count:
+        a = rng.choice(cells)
+        b = rng.choice(cells)
+        if abs(a[0] - b[0]) + abs(a[1] - b[1]) >= min_distance:
+            queries.append((a, b))
+    return queries
+
+
+def corner_queries(game_map):
+    """跨越整张地图的远距离查询: 四组对角和对边的起终点(取离角落最近的可行走格子)"""
+    ys, xs = np.nonzero(game_map.get_walkable_mask())
+
+    def nearest(x, y):
+        i = np.argmin((xs - x) ** 2 + (ys - y) ** 2)
+        return (int(xs[i]), int(ys[i]))
+
+    w, h = game_map.width - 1, game_map.height - 1
+    return [(nearest(0, 0), nearest(w, h)), (nearest(w, 0), nearest(0, h)),
+            (nearest(0, h // 2), nearest(w, h // 2)), (nearest(w // 2, 0), nearest(w // 2, h))]
+
+
+def make_packages(game_map, count, seed):
+    """生成count个包裹，一半在快递站等待，一半已被拾取"""
+    random.seed(seed)
+    manager = PackageManager(game_map)
+    for i in range(count):
+        destination = game_map.delivery_points[i % len(game_map.delivery_points)]
+        package = Package(game_map.start_point, destination, random.randint(120, 240), 10)
+        manager.packages.append(package)
+        if i % 2:
+            package.pick_up(0)
+            manager.active_packages.append(package)
+    return manager
+
+
+@benchmark("astar")
+def bench_astar(quick):
+    sizes = [(25, 18), (50, 36), (100, 72)] if quick else [(25, 18), (50, 36), (100, 72), (200, 144)]
+    densities = [0.0, 0.2] if quick else [0.0, 0.1, 0.2, 0.3]
+    results = []
+    for width, height in sizes:
+        for density in densities:
+            game_map = make_map(width, height, density, seed=width * 1000 + int(density * 100))
+            pathfinder = AStar(game_map)
+            queries = random_queries(game_map, 5 if quick else 10, seed=width)
+            expanded = []
+
+            def run():
+                for start, end in queries:
+                    pathfinder.find_path(start, end)
+                    expanded.append(pathfinder.last_expanded)
+
+            samples = harness.measure(run, repeat=3 if quick else 7, setup=pathfinder.clear_cache)
+            samples = [s / len(queries) for s in samples]
+            results.append((f"astar.find_path[{width}x{height},d={density}]", samples,
+                            {"expanded": sum(expanded) / len(expanded)}))
+    return results
+
+
+@benchmark("heuristics")
+def bench_heuristics(quick):
+    """octile 与 ALT 启发式在有建筑和水域的大地图上的对比(ALT的地标预处理单独计时)"""
+    results = []
+    for width, height in [(100, 72)] if quick else [(100, 72), (200, 144)]:
+        game_map = make_map(width, height, 0.2, seed=width, lakes=width // 10)
+        queries = random_queries(game_map, 5 if quick else 20, seed=width)
+        for name in ("octile", "alt"):
+            pathfinder = AStar(game_map, name)
+            started = time.perf_counter()
+            pathfinder.find_path(*queries[0])
+            build_ms = (time.perf_counter() - started) * 1000
+            expanded = []
+
+            def run():
+                for start, end in queries:
+                    pathfinder.find_path(start, end)
+                    expanded.append(pathfinder.last_expanded)
+
+            samples = harness.measure(run, repeat=3 if quick else 5, setup=pathfinder.clear_cache)
+            samples = [s / len(queries) for s in samples]
+            results.append((f"heuristic.{name}[{width}x{height}]", samples,
+                            {"expanded": sum(expanded) / len(expanded), "first_query_ms": build_ms}))
+    return results
+
+
+@benchmark("routes")
+def bench_routes(quick):
+    """多对多路线查询: 逐对调用 find_path 与按起点分组的批量查询(当前进程和进程池)"""
+    from game.route_batch import RouteBatch
+
+    width, height = (100, 72) if quick else (200, 144)
+    game_map = make_map(width, height, 0.2, seed=width, lakes=width // 10)
+    rng = random.Random(width)
+    ys, xs = np.nonzero(game_map.get_walkable_mask())
+    cells = list(zip(xs.tolist(), ys.tolist()))
+    sources = rng.sample(cells, 4 if quick else 8)
+    targets = rng.sample(cells, 16 if quick else 32)
+    pairs = [(source, target) for source in sources for target in targets]
+    pathfinder = AStar(game_map)
+    repeat = 3 if quick else 5
+    results = []
+
+    def naive():
+        for source, target in pairs:
+            pathfinder.find_path(source, target, any_angle=False)
+
+    samples = harness.measure(naive, repeat=repeat, setup=pathfinder.clear_cache)
+    results.append((f"routes.find_path_each[{len(pairs)}]", samples,
+                    {"pairs_per_s": len(pairs) / sorted(samples)[len(samples) // 2]}))
+
+    for workers in sorted({0, os.cpu_count() or 1}):
+        with RouteBatch(game_map, workers=workers, min_parallel_groups=2) as batch:
+            samples = harness.measure(lambda: batch.query(pairs), repeat=repeat)
+        results.append((f"routes.batch[{len(pairs)},workers={workers}]", samples,
+                        {"pairs_per_s": len(pairs) / sorted(samples)[len(samples) // 2]}))
+    return results
+
+
+@benchmark("smoothing")
+def bench_smoothing(quick):
+    results = []
+    for width, height in [(50, 36), (100, 72)] if quick else [(50, 36), (100, 72), (200, 144)]:
+        game_map = make_map(width, height, 0.2, seed=width)
+        pathfinder = AStar(game_map)
+        paths = [pathfinder.find_path(start, end) for start, end in random_queries(game_map, 10, seed=width)]
+        paths = [path for path in paths if path]
+        smoothed = [pathfinder.smooth_path(path) for path in paths]
+
+        def run():
+            for path in paths:
+                pathfinder.smooth_path(path)
+
+        samples = harness.measure(run, repeat=5 if quick else 15)
+        samples = [s / len(paths) for s in samples]
+        results.append((f"astar.smooth_path[{width}x{height}]", samples,
+                        {"waypoints": sum(map(len, paths)) / len(paths),
+                         "smoothed": sum(map(len, smoothed)) / len(smoothed)}))
+    return results
+
+
+@benchmark("clearance")
+def bench_clearance(quick):
+    """
+    按格子的净空距离场的完整构建、单格地形修改后的局部更新、圆形碰撞检测和带半径的寻路
+
+    clearance.build 的 kb 为中心净空距离和邻域位掩码占用的内存(每个格子6字节，与格子的像素尺寸无关)。
+    """
+    results = []
+    repeat = 3 if quick else 7
+    for width, height in [(50, 36), (100, 72)] if quick else [(50, 36), (100, 72), (200, 144)]:
+        game_map = make_map(width, height, 0.2, seed=width)
+
+        def build():
+            game_map._clearance = None
+            game_map.get_clearance()
+
+        samples = harness.measure(build, repeat=repeat)
+        results.append((f"clearance.build[{width}x{height}]", samples,
+                        {"kb": sum(field.nbytes for field in game_map._clearance_fields()) / 1024}))
+
+        ys, xs = np.nonzero(game_map.grid == Map.GRASS)
+        cells = list(zip(xs.tolist(), ys.tolist()))[:20]
+
+        def edit():
+            for x, y in cells:
+                game_map.set_terrain(x, y, Map.BUILDING)
+                game_map.set_terrain(x, y, Map.GRASS)
+
+        samples = harness.measure(edit, repeat=repeat)
+        samples = [s / (2 * len(cells)) for s in samples]
+        results.append((f"clearance.set_terrain[{width}x{height}]", samples, {}))
+
+        rng = np.random.default_rng(width)
+        points = rng.random((1000, 2)) * (width * game_map.cell_size, height * game_map.cell_size)
+        points = points.tolist()
+
+        def collide():
+            for x, y in points:
+                game_map.is_walkable(x, y, 10)
+
+        samples = harness.measure(collide, repeat=repeat)
+        results.append((f"clearance.is_walkable[1000,{width}x{height}]", samples, {}))
+
+        pathfinder = AStar(game_map)
+        queries = random_queries(game_map, 5 if quick else 10, seed=width)
+        for radius in (0, 10):
+            def run():
+                for start, end in queries:
+                    pathfinder.find_path(start, end, any_angle=False, radius=radius)
+
+            samples = harness.measure(run, repeat=repeat, setup=pathfinder.clear_cache)
+            samples = [s / len(queries) for s in samples]
+            results.append((f"astar.find_path.radius{radius}[{width}x{height}]", samples, {}))
+    return results
+
+
+@benchmark("chunks")
+def bench_chunks(quick):
+    """
+    分块世界: 关注点以快递员速度的8倍斜向移动时每帧 update + draw 的耗时(区块在后台线程中加载)，
+    以及跨越多个区块的寻路
+    """
+    from game.world import ChunkedWorld, ChunkPathfinder
+
+    screen = harness.init_pygame()
+    results = []
+    frames = 300 if quick else 1200
+    with ChunkedWorld(seed=1, chunks=(64, 64), memory_budget=48 * 1024 * 1024) as world:
+        samples = []
+        x, y = 15.0, 15.0
+        for _ in range(frames):
+            started = time.perf_counter()
+            world.update([(x, y)])
+            world.draw(screen, (x - 400, y - 300))
+            samples.append(time.perf_counter() - started)
+            x += 20.0
+            y += 7.5
+            time.sleep(0.001)  # 模拟帧的其余部分，让加载线程运行
+        results.append((f"chunks.frame[{frames}]", samples,
+                        {"loaded": world.loaded_count, "evicted": world.evicted_count,
+                         "resident_mb": world.memory_used / 1e6}))
+
+    with ChunkedWorld(seed=1, chunks=(16, 16)) as world:
+        world.request(world.wanted_chunks([(0, 0)]) + [(cx, cy) for cy in range(4) for cx in range(4)])
+        world.wait()
+        pathfinder = ChunkPathfinder(world)
+        queries = [((0, 0), (120, 100)), ((8, 120), (120, 8)), ((64, 0), (64, 127))]
+        for start, end in queries:
+            pathfinder.find_path(start, end)  # 预先拼接各查询的区块窗口
+
+        def run():
+            for start, end in queries:
+                pathfinder.find_path(start, end)
+
+        samples = harness.measure(run, repeat=3 if quick else 7,
+                                  setup=lambda: setattr(pathfinder, "_window", None))
+        samples = [s / len(queries) for s in samples]
+        results.append(("chunks.find_path[4x4 chunks]", samples, {}))
+    return results
+
+
+@benchmark("orders")
+def bench_orders(quick):
+    """订单日志: CSV解析、二进制读取，以及按游戏时间逐分钟取出订单的吞吐量"""
+    import tempfile
+    from game.orders import AddressIndex, OrderFeed, read_binary, read_csv, write_binary
+
+    count = 200_000 if quick else 2_000_000
+    game_map = Map()
+    index = AddressIndex.for_map(game_map)
+    rng = np.random.default_rng(count)
+    names = np.array(["D0", "D1", "D2", "宿舍3栋", "图书馆", "食堂"], dtype=object)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, "orders.csv")
+        bin_path = os.path.join(directory, "orders.bin")
+        with open(csv_path, "w", encoding="utf-8") as f:
+            f.write("time,order_id,address,deadline,value\n")
+            times = np.sort(rng.random(count) * count / 70.0)  # 每分钟约70单
+            for start in range(0, count, 100_000):
+                stop = min(count, start + 100_000)
+                addresses = names[rng.integers(0, len(names), stop - start)]
+                f.writelines(f"{t:.3f},{i},{a},{d},{v}\n" for t, i, a, d, v in zip(
+                    times[start:stop].tolist(), range(start, stop), addresses,
+                    rng.integers(60, 240, stop - start).tolist(), rng.integers(10, 80, stop - start).tolist()))
+
+        def parse_csv():
+            write_binary(bin_path, read_csv(csv_path, index))
+
+        def feed():
+            orders = OrderFeed(read_binary(bin_path), index)
+            while not orders.exhausted:
+                orders.start_day()
+                for minute in range(481):
+                    for _ in orders.due(minute):
+                        pass
+
+        for name, fn in (("csv_to_binary", parse_csv), ("feed_binary", feed)):
+            samples = harness.measure(fn, repeat=1 if quick else 3, warmup=0 if name == "feed_binary" else 1)
+            results.append((f"orders.{name}[{count}]", samples,
+                            {"k_orders_per_s": count / sorted(samples)[len(samples) // 2] / 1000}))
+    return results
+
+
+@benchmark("time_routing")
+def bench_time_routing(quick):
+    """
+    最早到达时间查询的延迟与时间段数的关系
+
+    每个时间段为三个区域随机设置1到3倍的成本，每一步在倍数为1时耗时0.5分钟，
+    一条路线会跨越许多时间段。
+    """
+    from game.time_routing import CostProfile, TimeDependentRouter
+
+    width, height = (100, 72)
+    game_map = make_map(width, height, 0.2, seed=width, lakes=width // 10)
+    queries = random_queries(game_map, 5 if quick else 20, seed=width)
+    zones = CostProfile.rush_hours(game_map).zones
+    results = []
+    for buckets in [1, 48, 480] if quick else [1, 8, 48, 480, 4800]:
+        rng = np.random.default_rng(buckets)
+        profile = CostProfile(zones, rng.uniform(1.0, 3.0, size=(buckets, 3)), 480 / buckets)
+        router = TimeDependentRouter(game_map, profile, unit_minutes=0.5)
+        expanded = []
+
+        def run():
+            for i, (start, end) in enumerate(queries):
+                router.earliest_arrival(start, end, depart=float(i * 20))
+                expanded.append(router.last_expanded)
+
+        samples = harness.measure(run, repeat=3 if quick else 5)
+        samples = [s / len(queries) for s in samples]
+        results.append((f"time_routing.earliest_arrival[buckets={buckets}]", samples,
+                        {"expanded": sum(expanded) / len(expanded), "profile_kb": profile.nbytes / 1024}))
+    return results
+
+
+@benchmark("queues")
+def bench_queues(quick):
+    """
+    heapq与整数成本桶队列的对比: A*(octile / ALT)、多目标Dijkstra(RouteBatch)和完整距离场
+
+    附加信息中的 ns_per_node 为每展开一个节点的平均耗时，与展开节点数无关地比较两种队列。
+    """
+    from game.search_grid import distance_field
+    from game.route_batch import RouteBatch
+
+    results = []
+    repeat = 3 if quick else 5
+    for width, height in [(100, 72)] if quick else [(100, 72), (200, 144), (400, 288)]:
+        game_map = make_map(width, height, 0.2, seed=width, lakes=width // 10)
+        queries = random_queries(game_map, 5 if quick else 20, seed=width) + corner_queries(game_map)
+        for name in ("octile", "alt"):
+            for queue in ("heapq", "bucket"):
+                pathfinder = AStar(game_map, name, queue=queue)
+                pathfinder.find_path(*queries[0])  # 预处理(ALT地标距离场、整数成本表)不计入
+                expanded = []
+
+                def run():
+                    pathfinder._path_cache.clear()
+                    for start, end in queries:
+                        pathfinder.find_path(start, end, any_angle=False)
+                        expanded.append(pathfinder.last_expanded)
+
+                samples = harness.measure(run, repeat=repeat)
+                samples = [s / len(queries) for s in samples]
+                per_query = sum(expanded) / len(expanded)
+                results.append((f"queues.astar.{name}.{queue}[{width}x{height}]", samples,
+                                {"expanded": per_query,
+                                 "ns_per_node": sorted(samples)[len(samples) // 2] / per_query * 1e9}))
+
+        rng = random.Random(width)
+        ys, xs = np.nonzero(game_map.get_walkable_mask())
+        cells = list(zip(xs.tolist(), ys.tolist()))
+        pairs = [(source, target) for source in rng.sample(cells, 4) for target in rng.sample(cells, 32)]
+        for queue in ("heapq", "bucket"):
+            batch = RouteBatch(game_map, workers=0, queue=queue)
+            batch.query(pairs[:1])
+            samples = harness.measure(lambda: batch.query(pairs), repeat=repeat)
+            results.append((f"queues.routes.{queue}[{width}x{height},{len(pairs)}]", samples,
+                            {"pairs_per_s": len(pairs) / sorted(samples)[len(samples) // 2]}))
+
+            samples = harness.measure(lambda: distance_field(game_map, cells[0], queue=queue), repeat=repeat)
+            results.append((f"queues.distance_field.{queue}[{width}x{height}]", samples,
+                            {"ns_per_cell": sorted(samples)[len(samples) // 2] / len(cells) * 1e9}))
+    return results
+
+
+@benchmark("depots")
+def bench_depots(quick):
+    """
+    多快递站区域: 一次多源Dijkstra(depot_field)与每个快递站各算一次距离场，以及按区域查表分配快递站
+
+    depots.assign 为给一批目的地分配快递站的耗时(每个目的地一次数组下标访问)，
+    depots.assign_search 为不用区域、每次比较所有快递站的距离场的耗时。
+    """
+    from game.depots import assign_depot, depot_field
+    from game.search_grid import distance_field
+
+    results = []
+    repeat = 3 if quick else 7
+    for width, height in [(100, 72)] if quick else [(100, 72), (400, 288)]:
+        game_map = make_map(width, height, 0.1, seed=1)
+        walkable = list(zip(*np.nonzero(game_map.get_walkable_mask())[::-1]))
+        rng = random.Random(width)
+        for x, y in rng.sample(walkable, 7):
+            game_map.add_depot(int(x), int(y))
+        depots = game_map.get_depots()
+
+        def rebuild():
+            game_map.version += 1
+            depot_field(game_map)
+
+        samples = harness.measure(rebuild, repeat=repeat)
+        results.append((f"depots.field[{width}x{height},{len(depots)}]", samples, {}))
+
+        def per_depot():
+            for depot in depots:
+                distance_field(game_map, depot)
+
+        samples = harness.measure(per_depot, repeat=repeat)
+        results.append((f"depots.per_depot_fields[{width}x{height},{len(depots)}]", samples, {}))
+
+        destinations = [(int(x), int(y)) for x, y in rng.choices(walkable, k=1000)]
+        depot_field(game_map)
+        samples = harness.measure(lambda: [assign_depot(game_map, point) for point in destinations], repeat=repeat)
+        results.append((f"depots.assign[{width}x{height},1000]", samples, {}))
+
+        fields = [distance_field(game_map, depot) for depot in depots]
+        samples = harness.measure(lambda: [min(range(len(depots)), key=lambda i: fields[i][y, x])
+                                           for x, y in destinations], repeat=repeat)
+        results.append((f"depots.assign_search[{width}x{height},1000]", samples, {}))
+    return results
+
+
+@benchmark("scheduler")
+def bench_scheduler(quick):
+    """
+    远距离查询在事件处理中一次完成(find_path)与交给 PathScheduler 分帧执行时的单帧耗时
+
+    调度器的样本为每一帧 update 的耗时，附加信息中的 frames 为完成全部查询用的帧数。
+    """
+    from game.path_scheduler import PathScheduler
+
+    results = []
+    for width, height in [(100, 72)] if quick else [(100, 72), (200, 144)]:
+        game_map = make_map(width, height, 0.2, seed=width, lakes=width // 10)
+        queries = corner_queries(game_map)
+        pathfinder = AStar(game_map)
+        pathfinder.any_angle = True
+        pathfinder.find_path(*queries[0])
+        samples = harness.measure(lambda: [pathfinder.find_path(start, end) for start, end in queries],
+                                  repeat=3 if quick else 5, setup=pathfinder.clear_cache)
+        samples = [s / len(queries) for s in samples]
+        results.append((f"scheduler.inline_find_path[{width}x{height}]", samples, {}))
+
+        for budget in (500, 2000):
+            scheduler = PathScheduler(pathfinder, max_expansions=budget)
+            frames = []
+            for _ in range(3 if quick else 5):
+                pathfinder.clear_cache()
+                for start, end in queries:
+                    scheduler.submit(start, end)
+                while len(scheduler):
+                    started = time.perf_counter()
+                    scheduler.update()
+                    frames.append(time.perf_counter() - started)
+            results.append((f"scheduler.frame[{width}x{height},budget={budget}]", frames,
+                            {"frames": len(frames) / (3 if quick else 5)}))
+    return results
+
+
+@benchmark("render")
+def bench_render(quick):
+    harness.init_pygame()
+    results = []
+    for width, height in [(25, 18), (50, 36)] if quick else [(25, 18), (50, 36), (100, 72)]:
+        game_map = make_map(width, height, 0.1, seed=1)
+        surface = pygame.Surface((width * game_map.cell_size, height * game_map.cell_size))
+        samples = harness.measure(lambda: game_map.draw(surface), repeat=10 if quick else 30)
+        results.append((f"render.map_draw[{width}x{height}]", samples, {}))
+
+    game_map = Map()
+    surface = pygame.Surface((game_map.width * game_map.cell_size, game_map.height * game_map.cell_size))
+    for count in [10, 100] if quick else [10, 100, 1000]:
+        manager = make_packages(game_map, count, seed=count)
+        samples = harness.measure(lambda: manager.draw(surface), repeat=10 if quick else 30)
+        results.append((f"render.packages_draw[{count}]", samples, {}))
+
+    # 精灵渲染: 地图、包裹、标记和一个移动中的快递员，每次只重绘改变的区域
+    for count in [100, 1000] if quick else [100, 1000, 5000]:
+        manager = make_packages(game_map, count, seed=count)
+        renderer = SpriteRenderer(game_map)
+        player = Player(game_map)
+        player.y = surface.get_height() - player.radius  # 沿最下面一行移动，不经过快递站
+        renderer.draw(surface, manager, [player])
+
+        def frame():
+            player.x = (player.x + 1) % surface.get_width()
+            renderer.draw(surface, manager, [player])
+        samples = harness.measure(frame, repeat=10 if quick else 30)
+        results.append((f"render.sprites[{count}]", samples, {}))
+    return results
+
+
+@benchmark("ui")
+def bench_ui(quick):
+    """
+    界面每帧的绘制耗时: 游戏中的信息面板(时钟每帧前进)、菜单、游戏结束画面和性能面板(F3)
+
+    控件只在显示的值改变时重新渲染文字，其余都是贴缓存的图像。
+    """
+    from game.profiler import Profiler
+    from game.ui import UI
+
+    screen = harness.init_pygame()
+    ui = UI(screen)
+    frames = 600
+    repeat = 5 if quick else 20
+
+    def info_panel():
+        for i in range(frames):
+            ui.draw(screen, i // 60, 480 - i / 3600.0, "SUNNY")
+
+    samples = harness.measure(info_panel, repeat=repeat)
+    results = [("ui.info_panel", [s / frames for s in samples], {})]
+    samples = harness.measure(lambda: ui.draw_menu(screen), repeat=repeat * 10)
+    results.append(("ui.menu", samples, {}))
+    samples = harness.measure(lambda: ui.draw_game_over(screen, 100, 0, False), repeat=repeat * 10)
+    results.append(("ui.game_over", samples, {}))
+
+    profiler = Profiler()
+    profiler.enable()
+    for i in range(300):
+        profiler.begin_frame()
+        for name in ("handle_event", "update", "update.player", "update.packages", "draw"):
+            profiler.add_time(name, (i % 7 + 1) * 1e-4)
+        profiler.count("astar.expanded", i % 50)
+        profiler.end_frame()
+    profiler.set_gauge("mem.total", 12.5, "MB")
+
+    def profiler_hud():
+        for _ in range(frames):
+            profiler.draw_hud(screen)
+
+    samples = harness.measure(profiler_hud, repeat=repeat)
+    results.append(("ui.profiler_hud", [s / frames for s in samples], {}))
+    return results
+
+
+@benchmark("terrain")
+def bench_terrain(quick):
+    """
+    地形图像的完整重建(render_terrain)、单格修改后的局部重绘和小地图生成
+
+    terrain.rebuild 为地图载入或改变后重新生成整张带网格线的地形图像的耗时，
+    terrain.minimap 从大地图直接取样生成 200x150 的缩略图。
+    """
+    from game.map import render_terrain
+    from game.minimap import Minimap
+
+    harness.init_pygame()
+    results = []
+    repeat = 3 if quick else 7
+    for width, height in [(100, 72)] if quick else [(100, 72), (400, 288)]:
+        game_map = make_map(width, height, 0.1, seed=1)
+        samples = harness.measure(lambda: render_terrain(game_map.grid, game_map.cell_size, grid_lines=True),
+                                  repeat=repeat)
+        results.append((f"terrain.rebuild[{width}x{height}]", samples,
+                        {"mpixels": width * height * game_map.cell_size ** 2 / 1e6}))
+
+        game_map.get_terrain_surface()
+
+        def edit():
+            game_map.set_terrain(3, 3, Map.BUILDING)
+            game_map.set_terrain(3, 3, Map.GRASS)
+            game_map.get_terrain_surface()
+
+        samples = harness.measure(edit, repeat=repeat)
+        results.append((f"terrain.set_terrain[{width}x{height}]", [s / 2 for s in samples], {}))
+
+    for size in [1024] if quick else [1024, 4096]:
+        grid = np.random.default_rng(size).integers(0, len(Map.TERRAIN_COLORS), (size, size))
+        samples = harness.measure(lambda: render_terrain(grid, 1), repeat=repeat)
+        results.append((f"terrain.rebuild_1px[{size}x{size}]", samples, {}))
+
+        game_map = Map(size, size, generate=False)
+        game_map.grid = grid
+        minimap = Minimap(game_map)
+
+        def build_minimap():
+            game_map.version += 1
+            minimap.terrain()
+
+        samples = harness.measure(build_minimap, repeat=repeat)
+        results.append((f"terrain.minimap[{size}x{size}]", samples, {}))
+    return results
+
+
+@benchmark("packages")
+def bench_packages(quick):
+    """
+    包裹模拟: 快递员沿固定路线依次经过快递站、一个配送点和一块空地(每步进入一个新格子，
+    发布 CELL_ENTERED)，游戏时间在路线上推进到超过所有截止时间，拾取、配送和过期都会发生。
+    样本为每步(进入格子 + PackageManager.update)的平均耗时，extra 为一趟路线中各事件的包裹数。
+    """
+    from game.event_bus import EventBus, PACKAGE_PICKED
+
+    game_map = Map()
+    far = (game_map.width - 1, 0)
+    route = []
+    for point in game_map.delivery_points:
+        route += [game_map.start_point, tuple(point), far]
+    results = []
+    for count in [100, 1000] if quick else [100, 1000, 10000]:
+        bus = EventBus()
+        manager = PackageManager(game_map, bus=bus)
+        player = Player(game_map, bus=bus)
+        player.max_packages = count * 3 // 4   # 一半包裹已被拾取，快递站上的包裹只能拾取一部分，其余过期
+        picked = []
+        bus.subscribe(PACKAGE_PICKED, lambda package, player: picked.append(package))
+
+        def setup():
+            fresh = make_packages(game_map, count, seed=count)
+            manager.packages = fresh.packages
+            manager.active_packages = fresh.active_packages
+            manager.delivered_packages = []
+            manager.expired_packages = []
+            manager.invalidate()
+            player.current_packages = len(manager.active_packages)
+            player.cell = None
+            picked.clear()
+
+        def run():
+            for i, cell in enumerate(route):
+                player.x, player.y = game_map.grid_to_pixel(*cell)
+                player.update(0)
+                manager.update(0, player, 300 * (i + 1) / len(route))
+
+        samples = harness.measure(run, repeat=10 if quick else 30, setup=setup)
+        samples = [s / len(route) for s in samples]
+        results.append((f"packages.update[{count}]", samples,
+                        {"picked": len(picked), "delivered": len(manager.delivered_packages),
+                         "expired": len(manager.expired_packages)}))
+    return results
+
+
+@benchmark("memory")
+def bench_memory(quick):
+    """
+    内存统计的一次采样(MemoryAccountant.sample)和已完成包裹归档的耗时
+
+    memory.sample 在包裹列表和寻路缓存都很大时估计各子系统的大小(大容器按样本外推)，
+    extra 中的 estimated_mb 为估计的合计大小。
+    """
+    from game.memory import MemoryAccountant, MB
+
+    results = []
+    repeat = 5 if quick else 20
+    for count in [1000, 10000] if quick else [1000, 10000, 100000]:
+        game_map = make_map(100, 72, 0.1, seed=1)
+        manager = make_packages(game_map, count, seed=count)
+        pathfinder = AStar(game_map)
+        for start, end in random_queries(game_map, 50, seed=count):
+            pathfinder.find_path(start, end)
+        accountant = MemoryAccountant()
+        accountant.register("map", game_map.memory_usage)
+        accountant.register("packages", manager.memory_usage)
+        accountant.register("pathfinding", pathfinder.memory_usage)
+        samples = harness.measure(accountant.sample, repeat=repeat)
+        results.append((f"memory.sample[{count}]", samples,
+                        {"estimated_mb": accountant.last_report["total"] / MB}))
+
+        finished = list(manager.packages)
+
+        def setup():
+            for package in finished:
+                package.status = "DELIVERED"
+            manager.packages = list(finished)
+            manager.delivered_packages = list(finished)
+            manager.active_packages = []
+
+        samples = harness.measure(manager.archive_finished, repeat=repeat, setup=setup)
+        results.append((f"memory.archive[{count}]", samples, {}))
+    return results
+
+
+@benchmark("snapshot")
+def bench_snapshot(quick):
+    """使用订单日志的一局游戏的存档和读档耗时"""
+    screen = harness.init_pygame()
+    from game.game_manager import GameManager
+    from game.snapshot import dump_snapshot, restore_snapshot
+    from tests.helpers import make_order_feed, run_frames
+
+    game_manager = GameManager(screen, seed=3, orders=make_order_feed(Map(), 2000, seed=3, minutes=0.5))
+    run_frames(game_manager, 1800)
+    data = dump_snapshot(game_manager)
+    repeat = 20 if quick else 100
+    return [("snapshot.dump[orders]", harness.measure(lambda: dump_snapshot(game_manager), repeat=repeat),
+             {"kb": len(data) / 1024}),
+            ("snapshot.restore[orders]", harness.measure(lambda: restore_snapshot(game_manager, data),
+                                                         repeat=repeat), {})]
+
+
+@benchmark("game")
+def bench_game(quick):
+    """
+    无界面的整局更新: 固定种子和固定帧时间(1/60秒)，快递员空闲时用路径辅助(P键)前往
+    最近的配送点或快递站，每个样本从新的一局开始，结果可复现。
+    extra 为一个样本中配送的包裹数和经过的游戏分钟数。
+    """
+    screen = harness.init_pygame()
+    from game.game_manager import GameManager
+
+    ticks = 600 if quick else 3600
+    game = {}
+
+    def setup():
+        game["manager"] = GameManager(screen, seed=0)
+
+    def run():
+        game_manager = game["manager"]
+        player = game_manager.player
+        for tick in range(ticks):
+            if tick % 30 == 0 and player.is_idle():
+                player.plan_route()
+            game_manager.update(1 / 60)
+
+    samples = harness.measure(run, repeat=3 if quick else 5, setup=setup)
+    samples = [s / ticks for s in samples]
+    game_manager = game["manager"]
+    return [("game.update_tick", samples,
+             {"delivered": game_manager.package_manager.delivered_count(),
+              "game_minutes": 480 - game_manager.time})]
+
+
+@benchmark("vector_env")
+def bench_vector_env(quick):
+    from game.vector_env import VectorEnv, NUM_ACTIONS
+
+    results = []
+    steps = 50 if quick else 200
+    for num_envs in [1, 256, 4096] if quick else [1, 64, 1024, 16384]:
+        env = VectorEnv(num_envs, seed=num_envs)
+        actions = np.random.default_rng(num_envs).integers(0, NUM_ACTIONS, size=(steps, num_envs))
+
+        def run():
+            for step_actions in actions:
+                env.step(step_actions)
+
+        samples = harness.measure(run, repeat=3 if quick else 5)
+        samples = [s / steps for s in samples]
+        median = sorted(samples)[len(samples) // 2]
+        results.append((f"vector_env.step[{num_envs}]", samples,
+                        {"env_steps_per_s": num_envs / median}))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="热点路径基准测试")
+    parser.add_argument("groups", nargs="*", help="只运行这些组: " + ", ".join(p for p, _ in BENCHMARKS))
+    parser.add_argument("--quick", action="store_true", help="使用较小的规模和重复次数")
+    parser.add_argument("--save-baseline", metavar="FILE", help="把结果保存为JSON基线")
+    parser.add_argument("--compare", metavar="FILE", help="与JSON基线比较")
+    parser.add_argument("--threshold", type=float, default=0.15, help="判定为回归的中位数变慢比例")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'benchmark':<44}{'median':>10}{'p90':>10}{'p99':>10}  extra")
+    for prefix, fn in BENCHMARKS:
+        if args.groups and prefix not in args.groups:
+            continue
+        for name, samples, extra in fn(args.quick):
+            stats = harness.summarize(samples)
+            stats.update(extra)
+            results[name] = stats
+            extra_text = " ".join(f"{k}={v:.1f}" for k, v in extra.items())
+            print(f"{name:<44}{stats['median_ms']:>8.3f}ms{stats['p90_ms']:>8.3f}ms"
+                  f"{stats['p99_ms']:>8.3f}ms  {extra_text}")
+
+    if args.save_baseline:
+        harness.save_baseline(args.save_baseline, results)
+        print(f"基线已保存: {args.save_baseline}")
+
+    if args.compare:
+        rows = harness.compare(results, harness.load_baseline(args.compare), args.threshold)
+        regressions = [row for row in rows if row[4]]
+        print()
+        for name, old, new, change, regressed in rows:
+            flag = "  <-- 回归" if regressed else ""
+            print(f"{name:<44}{old:>8.3f}ms -> {new:>8.3f}ms ({change:+.1%}){flag}")
+        if regressions:
+            print(f"\n{len(regressions)} 个基准变慢超过 {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""
+模拟服务器负载生成器
+
+在子进程中启动 game.server(或连接已有服务器)，通过多个连接创建大量会话，
+周期性发送批量动作，统计动作确认延迟、状态增量吞吐量和服务器每CPU秒模拟的帧数。
+
+用法:
+    python benchmarks/server_load.py --sessions 2000 --connections 4 --duration 10
+    python benchmarks/server_load.py --connect 127.0.0.1:8765 --sessions 500
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import time
+
+import harness
+
+
+def _run_server(port, tick):
+    import logging
+    from game.server import SimulationServer
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(SimulationServer("127.0.0.1", port, tick).serve_forever())
+
+
+async def _connect(host, port, timeout=10.0):
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            return await asyncio.open_connection(host, port, limit=2 ** 24)
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def _client(host, port, sessions, args, latencies, counters, stop_at):
+    reader, writer = await _connect(host, port)
+    writer.write(json.dumps({"op": "create", "n": sessions, "seed": random.randrange(10 ** 6),
+                             "rate": args.rate, "speed": args.speed}).encode() + b"\n")
+    await writer.drain()
+
+    pending = {}
+    ids = []
+    created = asyncio.Event()
+
+    async def read_loop():
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            message = json.loads(line)
+            kind = message["t"]
+            if kind == "d":
+                counters["delta_messages"] += 1
+                counters["session_deltas"] += len(message["d"])
+            elif kind == "ack":
+                sent = pending.pop(message["seq"], None)
+                if sent is not None:
+                    latencies.append(time.perf_counter() - sent)
+            elif kind == "created":
+                ids.extend(message["ids"])
+                created.set()
+
+    reader_task = asyncio.create_task(read_loop())
+    await created.wait()
+
+    rng = random.Random()
+    seq = 0
+    while time.perf_counter() < stop_at:
+        batch = []
+        for session_id in rng.sample(ids, max(1, int(len(ids) * args.action_fraction))):
+            if rng.random() < 0.2:
+                batch.append([session_id, "auto"])
+            else:
+                batch.append([session_id, "move", rng.choice((-1, 0, 1)), rng.choice((-1, 0, 1))])
+        seq += 1
+        pending[seq] = time.perf_counter()
+        writer.write(json.dumps({"op": "act", "seq": seq, "a": batch}).encode() + b"\n")
+        await writer.drain()
+        counters["actions"] += len(batch)
+        await asyncio.sleep(args.interval)
+
+    writer.write(b'{"op": "stats"}\n')
+    await writer.drain()
+    await asyncio.sleep(0.2)
+    reader_task.cancel()
+    writer.close()
+
+
+async def _stats(host, port):
+    reader, writer = await _connect(host, port)
+    writer.write(b'{"op": "stats"}\n')
+    await writer.drain()
+    while True:
+        message = json.loads(await reader.readline())
+        if message["t"] == "stats":
+            writer.close()
+            return message
+
+
+async def _check_errors(host, port):
+    """回归检查: 无效的动作和无法解析的消息得到错误回复，连接和其中的会话保持可用"""
+    reader, writer = await _connect(host, port)
+
+    async def send(line):
+        writer.write(line + b"\n")
+        await writer.drain()
+        while True:
+            message = json.loads(await reader.readline())
+            if message["t"] != "d":
+                return message
+
+    created = await send(b'{"op": "create", "n": 1}')
+    session_id = created["ids"][0]
+    for line in (b'{"op": "act", "a": [[1]], "seq": 1}', b'{"op": "act", "a": [[%d, "move", "x", 0]], "seq": 2}'
+                 % session_id, b'[1, 2]', b'{"op": '):
+        reply = await send(line)
+        assert reply["t"] == "error", f"无效的消息没有得到错误回复: {line!r} -> {reply}"
+    reply = await send(b'{"op": "act", "a": [[%d, "auto"]], "seq": 3}' % session_id)
+    assert reply == {"t": "ack", "seq": 3}, f"出错后连接不可用: {reply}"
+    writer.write(json.dumps({"op": "close", "ids": [session_id]}).encode() + b"\n")
+    writer.close()
+
+
+async def run(args, host, port):
+    await _check_errors(host, port)
+    latencies = []
+    counters = {"actions": 0, "delta_messages": 0, "session_deltas": 0}
+    stop_at = time.perf_counter() + args.duration
+    per_client = args.sessions // args.connections
+    started = time.perf_counter()
+    await asyncio.gather(*(_client(host, port, per_client, args, latencies, counters, stop_at)
+                           for _ in range(args.connections)))
+    elapsed = time.perf_counter() - started
+    stats = await _stats(host, port)
+
+    latency = harness.summarize(latencies)
+    print(f"会话: {per_client * args.connections}  连接: {args.connections}  时长: {elapsed:.1f}s")
+    print(f"服务器模拟帧: {stats['ticks']}  ({stats['ticks_per_s']:.0f}/s, 每CPU秒 {stats['ticks_per_cpu_s']:.0f})")
+    print(f"动作: {counters['actions'] / elapsed:.0f}/s  会话增量: {counters['session_deltas'] / elapsed:.0f}/s")
+    print(f"确认延迟: median {latency['median_ms']:.2f}ms  p90 {latency['p90_ms']:.2f}ms  "
+          f"p99 {latency['p99_ms']:.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟服务器负载生成器")
+    parser.add_argument("--connect", metavar="HOST:PORT", help="连接已有服务器，不启动子进程")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--tick", type=float, default=0.01, help="子进程服务器的节拍间隔")
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--connections", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--rate", type=int, default=60, help="每个会话每秒模拟帧数")
+    parser.add_argument("--speed", type=float, default=1.0, help="模拟时间与真实时间之比")
+    parser.add_argument("--interval", type=float, default=0.05, help="每个连接发送动作批次的间隔(秒)")
+    parser.add_argument("--action-fraction", type=float, default=0.1, help="每批次包含动作的会话比例")
+    args = parser.parse_args()
+
+    server = None
+    if args.connect:
+        host, port = args.connect.rsplit(":", 1)
+        port = int(port)
+    else:
+        host, port = "127.0.0.1", args.port
+        server = multiprocessing.Process(target=_run_server, args=(port, args.tick), daemon=True)
+        server.start()
+    try:
+        asyncio.run(run(args, host, port))
+    finally:
+        if server is not None:
+            server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+多快递站: 按通行时间划分的服务区域
+
+从所有快递站(Map.get_depots)同时出发做一次多源Dijkstra，给每个可行走格子标注离它最近的
+快递站和距离(按通行时间划分的Voronoi区域)，结果按地图版本缓存在地图的派生图层中。
+成本模型与 AStar 相同，进入格子的成本使两个方向的距离不同:
+
+    正向(快递站 -> 格子): 给配送点和新包裹分配快递站
+    反向(格子 -> 快递站): P键返回最近的快递站
+
+之后每次查询只是一次数组下标访问，不再为每个快递站各做一次搜索。
+同样的反向多源搜索也从所有配送点出发，P键前往最近的配送点时只查表，不在输入事件中搜索。
+
+用法:
+    depot, distance = nearest_depot(game_map, cell, reverse=True)
+    point, distance = nearest_delivery_point(game_map, cell)
+    depot = assign_depot(game_map, package.destination)
+    report = load_report(game_map, package_manager)
+"""
+import heapq
+import logging
+
+import numpy as np
+
+from . import search_grid
+
+logger = logging.getLogger(__name__)
+
+UNREACHABLE = -1   # 标签数组中不能到达(或不能从它到达)任何快递站的格子
+
+
+def depot_field(game_map, reverse=False):
+    """
+    多源Dijkstra的标签和距离，按地图版本缓存
+
+    Args:
+        reverse: 为False时为最近的快递站到各格子的距离，为True时为各格子到最近的快递站的距离
+
+    Returns:
+        (labels, distances): labels 为 int32数组 (height, width)，值为 get_depots() 中的下标，
+        不可达为 UNREACHABLE；distances 为 float64数组，不可达为inf
+    """
+    name = "depot_field_reverse" if reverse else "depot_field"
+    return game_map.get_layer(name, lambda: _build(game_map, game_map.get_depots(), reverse))
+
+
+def delivery_field(game_map):
+    """
+    各格子到最近的配送点的标签和距离(反向多源Dijkstra)，按地图版本和配送点列表缓存
+
+    Returns:
+        (labels, distances): labels 为 delivery_points 中的下标，格式同 depot_field
+    """
+    points = tuple(tuple(point) for point in game_map.delivery_points)
+    return game_map.get_layer(("delivery_field", points), lambda: _build(game_map, points, True))
+
+
+def _build(game_map, sources, reverse):
+    stride, costs, offsets = search_grid.grid_layout(game_map)
+    inf = float("inf")
+    dist = [inf] * len(costs)
+    label = [UNREACHABLE] * len(costs)
+    heap = []
+    for i, (x, y) in enumerate(sources):
+        index = (y + 1) * stride + x + 1
+        if costs[index] < 0 or dist[index] == 0.0:
+            continue  # 不可通行或重复的起点
+        dist[index] = 0.0
+        label[index] = i
+        heap.append((0.0, index))
+    heapq.heapify(heap)
+
+    pop, push = heapq.heappop, heapq.heappush
+    while heap:
+        d, current = pop(heap)
+        if d > dist[current]:
+            continue
+        leave = costs[current]
+        owner = label[current]
+        for offset, step in offsets:
+            neighbor = current + offset
+            enter = costs[neighbor]
+            if enter < 0:
+                continue
+            nd = d + step * (leave if reverse else enter)
+            if nd < dist[neighbor]:
+                dist[neighbor] = nd
+                label[neighbor] = owner
+                push(heap, (nd, neighbor))
+
+    shape = (game_map.height + 2, stride)
+    labels = np.array(label, dtype=np.int32).reshape(shape)[1:-1, 1:-1].copy()
+    distances = np.array(dist).reshape(shape)[1:-1, 1:-1].copy()
+    logger.debug("多源距离场已计算: %d 个起点, reverse=%s", len(sources), reverse)
+    return labels, distances
+
+
+def nearest_depot(game_map, cell, reverse=False):
+    """
+    离格子最近的快递站
+
+    Args:
+        reverse: 为False时按快递站到格子的距离，为True时按格子到快递站的距离(例如返回快递站)
+
+    Returns:
+        (depot, distance): 不可达或格子在地图外时为 (None, inf)
+    """
+    x, y = int(cell[0]), int(cell[1])
+    if not (0 <= x < game_map.width and 0 <= y < game_map.height):
+        return None, float("inf")
+    labels, distances = depot_field(game_map, reverse)
+    owner = int(labels[y, x])
+    if owner == UNREACHABLE:
+        return None, float("inf")
+    return game_map.get_depots()[owner], float(distances[y, x])
+
+
+def nearest_delivery_point(game_map, cell):
+    """
+    从格子出发最近的配送点(按通行时间)
+
+    Returns:
+        (point, distance): 不可达或格子在地图外时为 (None, inf)
+    """
+    x, y = int(cell[0]), int(cell[1])
+    if not (0 <= x < game_map.width and 0 <= y < game_map.height):
+        return None, float("inf")
+    labels, distances = delivery_field(game_map)
+    owner = int(labels[y, x])
+    if owner == UNREACHABLE:
+        return None, float("inf")
+    return tuple(game_map.delivery_points[owner]), float(distances[y, x])
+
+
+def assign_depot(game_map, destination):
+    """发往destination的包裹由哪个快递站发出(到达最快的快递站)，不可达时为None"""
+    return nearest_depot(game_map, destination)[0]
+
+
+def delivery_regions(game_map):
+    """
+    每个快递站负责的配送点
+
+    Returns:
+        {快递站: [配送点, ...]}，所有快递站都不能到达的配送点在 None 下
+    """
+    regions = {depot: [] for depot in game_map.get_depots()}
+    for point in game_map.delivery_points:
+        regions.setdefault(assign_depot(game_map, point), []).append(tuple(point))
+    return regions
+
+
+def load_report(game_map, package_manager):
+    """
+    各快递站的负载
+
+    Returns:
+        {快递站: {"delivery_points", "cells", "waiting", "picked", "delivered", "expired",
+                  "mean_distance"}}，cells 为区域中的格子数，mean_distance 为负责的配送点的平均距离
+    """
+    depots = game_map.get_depots()
+    labels, distances = depot_field(game_map)
+    cells = np.bincount(labels[labels != UNREACHABLE].ravel(), minlength=len(depots))
+    report = {}
+    for i, depot in enumerate(depots):
+        report[depot] = {"delivery_points": 0, "cells": int(cells[i]), "waiting": 0, "picked": 0,
+                         "delivered": 0, "expired": 0, "mean_distance": 0.0}
+    for point in game_map.delivery_points:
+        owner = int(labels[point[1], point[0]])
+        if owner != UNREACHABLE:
+            entry = report[depots[owner]]
+            entry["delivery_points"] += 1
+            entry["mean_distance"] += float(distances[point[1], point[0]])
+    for entry in report.values():
+        if entry["delivery_points"]:
+            entry["mean_distance"] /= entry["delivery_points"]
+
+    statuses = {"WAITING": "waiting", "PICKED": "picked", "DELIVERED": "delivered", "EXPIRED": "expired"}
+    seen = set()
+    for packages in (package_manager.packages, package_manager.active_packages,
+                     package_manager.delivered_packages, package_manager.expired_packages):
+        for package in packages:
+            if id(package) in seen:
+                continue
+            seen.add(id(package))
+            entry = report.get(tuple(package.start_point))
+            if entry is not None:
+                entry[statuses[package.status]] += 1
+    return report
@@ -0,0 +1,48 @@
+"""
+进程内的轻量事件总线
+
+子系统之间通过发布/订阅通信，而不是每帧互相轮询状态:
+- Player 进入新的格子时发布 CELL_ENTERED，回到快递站时发布 DEPOT_REACHED
+- PackageManager 只在玩家进入新格子后检查拾取和配送，发布包裹的生成、拾取、配送和过期事件
+- Player 订阅拾取和配送事件更新自己携带的包裹数
+- GameManager 只在包裹事件或回到快递站后检查是否提前完成，发布得分变化、时间用完和提前完成
+- UI 订阅得分变化，只在得分改变时重新渲染得分文字
+
+处理函数在 publish 时按订阅顺序同步调用，事件处理顺序是确定的，录制和回放仍可复现。
+"""
+
+# 事件主题及其参数
+PACKAGE_SPAWNED = "package.spawned"       # package
+PACKAGE_PICKED = "package.picked"         # package, player
+PACKAGE_DELIVERED = "package.delivered"   # package, player, points
+PACKAGE_EXPIRED = "package.expired"       # package
+CELL_ENTERED = "player.cell_entered"      # player, cell
+DEPOT_REACHED = "player.depot_reached"    # player
+SCORE_CHANGED = "game.score_changed"      # score
+TIME_UP = "game.time_up"                  # score
+DAY_COMPLETED = "game.day_completed"      # score, time_bonus
+
+
+class EventBus:
+    """按主题分发事件的总线"""
+
+    def __init__(self):
+        self._handlers = {}
+
+    def subscribe(self, topic, handler):
+        """订阅主题，handler 以关键字参数接收事件数据"""
+        self._handlers.setdefault(topic, []).append(handler)
+
+    def unsubscribe(self, topic, handler):
+        """取消订阅，handler 未订阅时什么也不做"""
+        handlers = self._handlers.get(topic)
+        if handlers and handler in handlers:
+            handlers.remove(handler)
+
+    def publish(self, topic, **payload):
+        """发布事件，同步调用该主题的全部处理函数"""
+        handlers = self._handlers.get(topic)
+        if not handlers:
+            return
+        for handler in tuple(handlers):
+            handler(**payload)
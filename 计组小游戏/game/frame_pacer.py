@@ -0,0 +1,128 @@
+"""
+空闲感知的帧率控制
+
+画面只随时钟变化时(玩家静止、不在跟随路径、没有输入)，主循环不再以60帧空转，
+而是用 pygame.event.wait 阻塞等待输入，超时时间取到下一个计划中的画面变化
+(时钟跳秒、订单到达、包裹过期)为止，最长不超过 1 / idle_fps 秒。
+收到任何事件后立即恢复全帧率，并在 grace 秒内保持全帧率。
+
+两种模式下的帧数、真实时间和进程CPU时间分别统计，退出时输出CPU占用率。
+"""
+import logging
+import math
+import time
+
+import pygame
+
+logger = logging.getLogger(__name__)
+
+MODES = ("active", "idle")
+
+
+class FramePacer:
+    """
+    主循环的帧率控制
+
+    Args:
+        fps: 正常帧率
+        idle_fps: 空闲时的最低重绘频率
+        grace: 收到输入后保持全帧率的时间(秒)
+        enabled: 为False时总是以正常帧率运行(只统计，不降频)
+    """
+
+    def __init__(self, fps=60, idle_fps=1, grace=0.5, enabled=True):
+        self.fps = fps
+        self.idle_fps = idle_fps
+        self.grace = grace
+        self.enabled = enabled
+        self.clock = pygame.time.Clock()
+        self.idle = False
+
+        # 空闲等待时收到的事件，下一帧交给 events()
+        self.pending = []
+        self._active_until = 0.0
+
+        # 每种模式的统计: [帧数, 真实时间(秒), CPU时间(秒)]
+        self.stats = {mode: [0, 0.0, 0.0] for mode in MODES}
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+
+    def start(self):
+        """主循环开始前调用，重置时钟"""
+        self.clock.tick()
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+
+    def events(self):
+        """本帧需要处理的事件(包括空闲等待期间收到的事件)"""
+        events = self.pending + pygame.event.get()
+        self.pending = []
+        if events:
+            self._active_until = time.perf_counter() + self.grace
+        return events
+
+    def tick(self, idle, next_event_delay=None):
+        """
+        结束一帧并等待下一帧
+
+        Args:
+            idle: 游戏当前是否处于静止状态(见 GameManager.is_idle)
+            next_event_delay: 距下一个计划中的画面变化的真实时间(秒)，None表示没有
+
+        Returns:
+            dt_ms: 本帧结束到下一帧开始的时间间隔(毫秒)，包括空闲等待的时间
+        """
+        self.idle = self.enabled and idle and time.perf_counter() >= self._active_until
+        if self.idle:
+            timeout = 1.0 / self.idle_fps
+            if next_event_delay is not None:
+                timeout = min(timeout, next_event_delay)
+            event = pygame.event.wait(max(1, math.ceil(timeout * 1000)))
+            if event.type != pygame.NOEVENT:
+                self.pending.append(event)
+            dt_ms = self.clock.tick()
+        else:
+            dt_ms = self.clock.tick(self.fps)
+        self._account("idle" if self.idle else "active")
+        return dt_ms
+
+    @property
+    def woken(self):
+        """上一次空闲等待是否被事件打断"""
+        return bool(self.pending)
+
+    def _account(self, mode):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        stats = self.stats[mode]
+        stats[0] += 1
+        stats[1] += wall - self._wall
+        stats[2] += cpu - self._cpu
+        self._wall = wall
+        self._cpu = cpu
+
+    def cpu_usage(self):
+        """
+        每种模式的统计
+
+        Returns:
+            {模式: {"frames", "seconds", "fps", "cpu_percent"}}
+        """
+        usage = {}
+        for mode, (frames, wall, cpu) in self.stats.items():
+            usage[mode] = {
+                "frames": frames,
+                "seconds": wall,
+                "fps": frames / wall if wall > 0 else 0.0,
+                "cpu_percent": 100.0 * cpu / wall if wall > 0 else 0.0,
+            }
+        return usage
+
+    def report(self):
+        """返回可读的CPU占用报告"""
+        names = {"active": "全速", "idle": "空闲"}
+        parts = []
+        for mode, usage in self.cpu_usage().items():
+            parts.append(f"{names[mode]} {usage['frames']} 帧 / {usage['seconds']:.1f} 秒"
+                         f" ({usage['fps']:.1f} FPS, CPU {usage['cpu_percent']:.1f}%)")
+        return "; ".join(parts)
@@ -1,56 +1,171 @@
+import logging
+import math
+import os
+import random
 import pygame
 from .map import Map
 from .player import Player
 from .pathfinding import AStar
+from .path_scheduler import PathScheduler
 from .ui import UI
+from .sprites import SpriteRenderer
+from .minimap import Minimap
+from .depots import load_report
 from .package_manager import PackageManager
+from .profiler import profiler
+from .memory import MemoryAccountant, estimate_size
+from .event_bus import (EventBus, DEPOT_REACHED, PACKAGE_DELIVERED, PACKAGE_EXPIRED,
+                        SCORE_CHANGED, TIME_UP, DAY_COMPLETED)
+from . import snapshot
+
+logger = logging.getLogger(__name__)
 
 class GameManager:
-    def __init__(self, screen):
+    # 预览图标题，预览图在第一次显示时才生成
+    PREVIEW_TITLES = ["校园地图与快递路线", "角色与交互界面", "寻路算法演示"]
+    
+    # 预览图磁盘缓存目录，文件名包含屏幕尺寸；修改预览图绘制代码后需递增 PREVIEW_VERSION
+    PREVIEW_CACHE_DIR = os.path.join("assets", "cache")
+    PREVIEW_VERSION = 1
+    
+    # F5/F9 快速存档和读档使用的文件
+    QUICKSAVE_PATH = os.path.join("saves", "quicksave.snap")
+    
+    def __init__(self, screen, seed=None, telemetry=None, orders=None, memory=None, archive=None):
         self.screen = screen
+        
+        # 随机种子，相同种子和相同输入可复现整局游戏
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        self.rng = random.Random(self.seed)
         self.game_state = "GAMEPLAY"  # 可选状态: PREVIEW, MENU, GAMEPLAY, PAUSE, GAMEOVER
         
-        # 游戏组件
+        # 游戏组件，通过事件总线互相通知
+        self.bus = EventBus()
         self.map = Map()
-        self.player = Player(self.map)
+        self.player = Player(self.map, self.bus)
         self.pathfinder = AStar(self.map)
-        self.ui = UI(screen)
-        self.package_manager = PackageManager(self.map)
+        self.ui = UI(screen, self.bus)
+        self.renderer = SpriteRenderer(self.map)
+        self.package_manager = PackageManager(self.map, rng=self.rng, bus=self.bus)
         
-        # 设置Player的pathfinder引用
+        # 设置Player的pathfinder引用，玩家跟随的路径使用任意角度平滑
+        self.pathfinder.any_angle = True
         self.player.set_pathfinder(self.pathfinder)
         
+        # 玩家和包裹生成的路径查询交给调度器，每帧最多展开固定数量的节点
+        # (节点数预算是确定的，不影响录制和回放)
+        self.scheduler = PathScheduler(self.pathfinder)
+        self.player.set_scheduler(self.scheduler)
+        self.package_manager.set_scheduler(self.scheduler)
+        
+        # 性能统计(默认关闭，F3键切换性能面板)
+        self.profiler = profiler
+        
+        # 小地图(M键切换)，地图比屏幕大时默认显示
+        self.minimap = Minimap(self.map)
+        self.show_minimap = (self.map.width * self.map.cell_size > screen.get_width() or
+                             self.map.height * self.map.cell_size > screen.get_height())
+        
+        # F5/F9 快速存档的文件，回放时改为回放自己的临时文件(见 game.replay.replay)
+        self.quicksave_path = self.QUICKSAVE_PATH
+        
+        # 遥测(可选)，每局游戏记为一天
+        self.day = 1
+        self.telemetry = telemetry
+        self.package_manager.telemetry = telemetry
+        if telemetry:
+            telemetry.start_day(self.day)
+        
+        # 订单日志(可选，见 game.orders.OrderFeed)，设置后包裹按订单到达时间生成
+        if orders is not None:
+            self.package_manager.set_order_feed(orders)
+        
+        # 内存统计(见 game.memory)，默认每分钟估计一次各子系统的大小并显示在性能面板中，
+        # 不设预算时不会释放任何数据；超出预算归档的包裹写入archive(CSV，可选)
+        self.memory = memory or MemoryAccountant()
+        self.package_manager.archive_path = archive
+        self._register_memory()
+        
         # 连接UI按钮回调
         self.ui.set_callback("restart", self.start_game)
         
+        # 只在包裹状态改变或回到快递站后检查是否提前完成
+        self._completion_pending = False
+        for topic in (DEPOT_REACHED, PACKAGE_DELIVERED, PACKAGE_EXPIRED):
+            self.bus.subscribe(topic, self._request_completion_check)
+        
         # 游戏变量
         self.score = 0
         self.time = 480  # 以分钟为单位，8小时工作日
         self.weather = "SUNNY"  # 可选: SUNNY, RAINY, FOGGY
         
-        # 定时器设置
+        # 定时器设置，elapsed 为累计的模拟时间(秒)，内存统计按它采样
         self.timer = pygame.time.get_ticks()
+        self.elapsed = 0.0
         
-        # 预览模式设置
-        self.preview_images = []
+        # 预览模式设置(预览图延迟生成，见 get_preview_image)
+        self.preview_images = [None] * len(self.PREVIEW_TITLES)
         self.current_preview = 0
-        self.load_preview_images()
         
         # 开始游戏
         self.package_manager.generate_packages()
+        self.bus.publish(SCORE_CHANGED, score=self.score)
         
         # 记录游戏完成状态(用于显示不同的结束信息)
         self.game_completed = False
         self.time_bonus = 0
     
+    def _register_memory(self):
+        """向内存统计登记各子系统的大小估计和超出预算时的释放函数"""
+        memory = self.memory
+        memory.register("map", self.map.memory_usage, release=self.map.release_caches)
+        memory.register("packages", self.package_manager.memory_usage,
+                        release=self.package_manager.archive_finished)
+        memory.register("pathfinding", self.pathfinder.memory_usage, release=self.pathfinder.release_memory)
+        memory.register("sprites", self.renderer.memory_usage, release=self.renderer.images.clear)
+        memory.register("previews", lambda: estimate_size(self.preview_images), release=self.release_preview_images)
+    
+    def release_preview_images(self):
+        """释放预览图(离开预览画面后不再需要，再次显示时从磁盘缓存读取)"""
+        self.preview_images = [None] * len(self.PREVIEW_TITLES)
+    
     def load_preview_images(self):
-        """加载预览图像，实际开发中应替换为实际游戏截图"""
-        # 创建模拟的预览图像
-        preview1 = self.create_preview_image("校园地图与快递路线")
-        preview2 = self.create_preview_image("角色与交互界面")
-        preview3 = self.create_preview_image("寻路算法演示")
+        """加载全部预览图像，实际开发中应替换为实际游戏截图"""
+        for index in range(len(self.PREVIEW_TITLES)):
+            self.get_preview_image(index)
+    
+    def get_preview_image(self, index):
+        """
+        获取预览图像，第一次使用时才生成
+        
+        优先读取按屏幕尺寸命名的磁盘缓存，没有缓存时绘制并写入缓存。
+        """
+        image = self.preview_images[index]
+        if image is not None:
+            return image
         
-        self.preview_images = [preview1, preview2, preview3]
+        width, height = self.screen.get_size()
+        path = os.path.join(self.PREVIEW_CACHE_DIR,
+                            f"preview_v{self.PREVIEW_VERSION}_{width}x{height}_{index}.png")
+        if os.path.exists(path):
+            try:
+                image = pygame.image.load(path)
+                if pygame.display.get_surface() is not None:
+                    image = image.convert()
+            except pygame.error:
+                logger.warning("预览图缓存无法读取: %s", path)
+                image = None
+        
+        if image is None:
+            image = self.create_preview_image(self.PREVIEW_TITLES[index])
+            try:
+                os.makedirs(self.PREVIEW_CACHE_DIR, exist_ok=True)
+                pygame.image.save(image, path)
+            except (OSError, pygame.error):
+                logger.warning("预览图缓存无法写入: %s", path)
+        
+        self.preview_images[index] = image
+        return image
     
     def create_preview_image(self, title):
         """创建一个模拟的预览图像"""
@@ -158,52 +273,79 @@ class GameManager:
     
     def handle_event(self, event):
         """处理游戏事件"""
+        # F3键在任何状态下切换性能面板
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+            self.profiler.toggle_hud()
+            return
+        
+        # M键切换小地图
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_m and self.game_state == "GAMEPLAY":
+            self.show_minimap = not self.show_minimap
+            return
+        
+        # F5快速存档，F9快速读档
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_F5:
+            self.save_snapshot(self.quicksave_path)
+            return
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_F9:
+            if os.path.exists(self.quicksave_path):
+                self.load_snapshot(self.quicksave_path)
+            return
+        
         if self.game_state == "PREVIEW":
             # 在预览模式中，空格键切换预览图像
             if event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
-                self.current_preview = (self.current_preview + 1) % len(self.preview_images)
+                self.current_preview = (self.current_preview + 1) % len(self.PREVIEW_TITLES)
         else:
             # 在游戏模式中，将事件传递给相应的对象
             self.player.handle_event(event)
             self.ui.handle_event(event)
     
-    def update(self):
-        """更新游戏状态"""
+    def update(self, delta_time=None):
+        """
+        更新游戏状态
+        
+        Args:
+            delta_time: 距上一帧的时间(秒)。为None时根据pygame时钟计算；
+                        录制和回放时由调用方传入，保证结果可复现
+        """
         # 计算时间流逝
         current_time = pygame.time.get_ticks()
-        delta_time = (current_time - self.timer) / 1000.0  # 转换为秒
+        if delta_time is None:
+            delta_time = (current_time - self.timer) / 1000.0  # 转换为秒
         self.timer = current_time
+        self.elapsed += delta_time
+        
+        # 内存统计按模拟时间采样，回放时在相同的帧上执行预算；整屏大小的预览图离开预览画面后立即释放
+        with self.profiler.section("update.memory"):
+            self.memory.update(now=self.elapsed)
+        if self.game_state != "PREVIEW" and any(image is not None for image in self.preview_images):
+            self.release_preview_images()
         
         if self.game_state == "GAMEPLAY":
+            # 继续执行未完成的路径查询，完成的查询在玩家移动前设置路径或生成包裹
+            with self.profiler.section("update.pathfinding"):
+                self.scheduler.update()
+            
             # 更新游戏内容
-            self.player.update(delta_time)
+            with self.profiler.section("update.player"):
+                self.player.update(delta_time)
             
             # 计算游戏已经过的时间（分钟）
             game_time = 480 - self.time
+            if self.telemetry:
+                self.telemetry.sample_position(game_time, self.player.x, self.player.y)
             
             # 将游戏时间传递给包裹管理器
-            score = self.package_manager.update(delta_time, self.player, game_time)
-            self.score += score
+            with self.profiler.section("update.packages"):
+                score = self.package_manager.update(delta_time, self.player, game_time)
+            if score:
+                self._add_score(score)
             
-            # 检查是否所有包裹都已配送完毕
-            all_delivered = True
-            active_packages = len(self.package_manager.active_packages)
-            waiting_packages = sum(1 for p in self.package_manager.packages if p.status == "WAITING")
-            
-            if active_packages > 0 or waiting_packages > 0:
-                all_delivered = False
-                
-            # 如果所有包裹已配送完毕，并且玩家回到起点 - 提前完成任务
-            if all_delivered and not self.player.carrying_package:
-                player_pos = self.map.pixel_to_grid(self.player.x, self.player.y)
-                if player_pos == self.map.start_point:
-                    self.game_state = "GAMEOVER"
-                    # 提前完成奖励
-                    self.time_bonus = int(self.time)
-                    self.score += self.time_bonus
-                    self.game_completed = True
-                    print(f"恭喜！所有包裹配送完成！获得时间奖励: {self.time_bonus}")
-                    print(f"最终得分: {self.score}")
+            # 包裹状态改变或回到快递站后，检查是否提前完成任务
+            if self._completion_pending:
+                self._completion_pending = False
+                self._check_completion()
             
             # 减少游戏时间 - 使用正常的游戏时间流逝速度
             self.time -= delta_time / 60.0  # 换算为游戏内分钟，每60秒真实时间过去1分钟游戏时间
@@ -213,34 +355,144 @@ class GameManager:
                 self.time = 0
                 self.game_state = "GAMEOVER"
                 self.game_completed = False
-                delivered = len(self.package_manager.delivered_packages)
-                remaining = active_packages + waiting_packages
-                print("工作日结束！")
-                print(f"成功配送: {delivered} 个包裹, 未配送: {remaining} 个包裹")
-                print(f"最终得分: {self.score}")
+                delivered = self.package_manager.delivered_count()
+                logger.info("工作日结束！")
+                logger.info("成功配送: %d 个包裹, 未配送: %d 个包裹", delivered, self._remaining_packages())
+                logger.info("最终得分: %d", self.score)
+                self._log_depot_load()
+                self.bus.publish(TIME_UP, score=self.score)
+    
+    def _request_completion_check(self, **event):
+        self._completion_pending = True
+    
+    def _remaining_packages(self):
+        """携带中和等待中的包裹数"""
+        packages = self.package_manager
+        return len(packages.active_packages) + sum(1 for p in packages.packages if p.status == "WAITING")
+    
+    def _check_completion(self):
+        """所有包裹已配送完毕，并且玩家回到起点 - 提前完成任务"""
+        if self._remaining_packages() or self.player.carrying_package:
+            return
+        if self.package_manager.orders_pending() or self.package_manager.spawns_pending():
+            return  # 订单日志中当天还有订单会到达，或者有新包裹正在等待路径查询
+        if self.player.cell is None or not self.map.is_depot(*self.player.cell):
+            return
+        self.game_state = "GAMEOVER"
+        # 提前完成奖励
+        self.time_bonus = int(self.time)
+        self._add_score(self.time_bonus)
+        self.game_completed = True
+        logger.info("恭喜！所有包裹配送完成！获得时间奖励: %d", self.time_bonus)
+        logger.info("最终得分: %d", self.score)
+        self._log_depot_load()
+        self.bus.publish(DAY_COMPLETED, score=self.score, time_bonus=self.time_bonus)
+    
+    def depot_report(self):
+        """各快递站的负载(见 game.depots.load_report)"""
+        return load_report(self.map, self.package_manager)
+    
+    def _log_depot_load(self):
+        """有多个快递站时在一天结束时记录各快递站的负载"""
+        if len(self.map.get_depots()) < 2 or not logger.isEnabledFor(logging.INFO):
+            return
+        for depot, load in self.depot_report().items():
+            logger.info("快递站 %s: 配送点 %d, 已配送 %d, 过期 %d, 平均距离 %.1f", depot, load["delivery_points"],
+                        load["delivered"], load["expired"], load["mean_distance"])
+    
+    def _add_score(self, points):
+        self.score += points
+        self.bus.publish(SCORE_CHANGED, score=self.score)
+    
+    def is_idle(self):
+        """
+        画面是否只会随时钟变化，主循环据此降低帧率(见 FramePacer)
+        
+        非游戏状态(预览、菜单、暂停、结束)的画面是静态的；游戏中玩家静止且不在跟随路径、
+        也没有等待路径查询完成的新包裹时，只有时钟文字会变化。显示性能面板时总是返回False，
+        以便统计全帧率下的数据。
+        """
+        if self.profiler.show_hud:
+            return False
+        if self.game_state != "GAMEPLAY":
+            return True
+        return self.player.is_idle() and not self.package_manager.spawns_pending()
+    
+    def next_event_delay(self):
+        """
+        距下一个计划中的画面变化的真实时间(秒)，没有时返回None
+        
+        时钟显示到秒，剩余的游戏秒数每真实秒减少1，工作日结束发生在时钟跳秒的时刻；
+        订单到达和包裹过期可以发生在任意时刻(例如第3.5分钟)，取两者中较早的一个。
+        到期的变化在醒来后的下一帧才处理，此时返回的等待时间为0。
+        """
+        if self.game_state != "GAMEPLAY":
+            return None
+        seconds = self.time * 60.0
+        delay = seconds - math.floor(seconds) or 1.0
+        change = self.package_manager.next_change()
+        if change is not None:
+            delay = min(delay, max(0.0, (change - (480 - self.time)) * 60.0))
+        return delay + 0.001
     
     def draw(self):
         """绘制游戏画面"""
         if self.game_state == "PREVIEW":
             # 绘制预览画面
-            self.screen.blit(self.preview_images[self.current_preview], (0, 0))
+            self.screen.blit(self.get_preview_image(self.current_preview), (0, 0))
         elif self.game_state == "GAMEPLAY":
             # 绘制游戏画面
-            self.map.draw(self.screen)
-            self.package_manager.draw(self.screen)
-            self.player.draw(self.screen)
-            self.ui.draw(self.screen, self.score, self.time, self.weather)
+            self._draw_world()
+            if self.show_minimap:
+                with self.profiler.section("draw.minimap"):
+                    self.minimap.draw(self.screen, [self.player], self.package_manager.active_packages)
+            with self.profiler.section("draw.ui"):
+                self.ui.draw(self.screen, self.score, self.time, self.weather)
         elif self.game_state == "MENU":
             # 绘制菜单画面
             self.ui.draw_menu(self.screen)
         elif self.game_state == "GAMEOVER":
             # 先绘制游戏场景作为背景
-            self.map.draw(self.screen)
-            self.package_manager.draw(self.screen)
-            self.player.draw(self.screen)
+            self._draw_world()
             
             # 再绘制游戏结束界面
-            self.ui.draw_game_over(self.screen, self.score, int(self.time), self.game_completed)
+            with self.profiler.section("draw.ui"):
+                self.ui.draw_game_over(self.screen, self.score, int(self.time), self.game_completed)
+        
+        # 性能面板绘制在最上层
+        if self.profiler.show_hud:
+            self.profiler.draw_hud(self.screen)
+    
+    def _draw_world(self):
+        """绘制地图、包裹和玩家(精灵只重绘改变的部分，见 SpriteRenderer)"""
+        with self.profiler.section("draw.sprites"):
+            self.renderer.draw(self.screen, self.package_manager, [self.player])
+        with self.profiler.section("draw.path"):
+            self.player.draw_path(self.screen)
+    
+    def state_summary(self):
+        """返回可用于比较两次运行结果的状态摘要"""
+        packages = self.package_manager
+        return {
+            "seed": self.seed,
+            "game_state": self.game_state,
+            "score": self.score,
+            "time": round(self.time, 6),
+            "player": [round(self.player.x, 3), round(self.player.y, 3), self.player.current_packages],
+            "delivered": packages.delivered_count(),
+            "active": len(packages.active_packages),
+            "packages": [[p.id, p.status] for p in packages.packages],
+        }
+    
+    def save_snapshot(self, path):
+        """把完整游戏状态保存为二进制存档"""
+        snapshot.save_snapshot(self, path)
+    
+    def load_snapshot(self, path):
+        """读取二进制存档，恢复地图、包裹、玩家和游戏状态"""
+        snapshot.load_snapshot(self, path)
+        self.timer = pygame.time.get_ticks()  # 重置定时器
+        self.bus.publish(SCORE_CHANGED, score=self.score)
     
     def start_game(self):
         """开始新游戏"""
@@ -249,8 +501,13 @@ class GameManager:
         self.time = 480
         self.weather = "SUNNY"
         self.player.reset()
+        self.day += 1
+        if self.telemetry:
+            self.telemetry.start_day(self.day)
         self.package_manager.generate_packages()
         self.timer = pygame.time.get_ticks()  # 重置定时器
         self.game_completed = False
         self.time_bonus = 0
-        print("开始新游戏！") 
\ No newline at end of file
+        self._completion_pending = False
+        self.bus.publish(SCORE_CHANGED, score=self.score)
+        logger.info("开始新游戏！") 
\ No newline at end of file
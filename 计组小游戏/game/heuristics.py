@@ -0,0 +1,205 @@
+"""
+A*搜索使用的启发式函数
+
+每种启发式通过 bind(goal) 返回一个只接受节点参数的函数，搜索时每个节点调用一次；
+bind_index 返回的函数以搜索使用的扁平下标(见 search_grid.grid_layout)为参数。
+
+- manhattan: 曼哈顿距离(旧版本的启发式，对角线移动时会高估，不可采纳)
+- octile:    八方向距离乘以最小地形成本，可采纳，作为默认启发式
+- alt:       ALT(A*, Landmarks, Triangle inequality)，利用预先计算的地标距离场
+             给出更紧的下界，适合有大片建筑、水域和草地绕行的大地图
+
+桶队列搜索使用的整数启发式见 scale_heuristic，成本表和距离场见 game.search_grid。
+"""
+from collections import OrderedDict
+
+import numpy as np
+
+from .memory import estimate_size
+from .search_grid import DIAGONAL, SCALE, distance_field
+
+
+def scale_heuristic(heuristic):
+    """
+    启发式乘以 SCALE 后向下取整，用于整数成本的搜索
+
+    每一步的整数成本是精确的，向下取整保持可采纳和一致: floor(h(u)) <= c + floor(h(v))。
+    加上很小的量避免浮点误差把整数值舍到下一个整数。
+    """
+    return lambda index: int(heuristic(index) * SCALE + 1e-6)
+
+
+def min_terrain_cost(game_map):
+    """可通行地形的最小成本，是每一步成本的下界"""
+    return min(cost for cost in game_map.TERRAIN_COSTS.values() if cost > 0)
+
+
+class Heuristic:
+    """启发式的基类"""
+    name = None
+
+    def __init__(self, game_map):
+        self.map = game_map
+
+    def bind(self, goal):
+        """返回目标为goal的启发式函数 h((x, y))"""
+        stride = self.map.width + 2
+        heuristic = self.bind_index(goal)
+        return lambda node: heuristic((node[1] + 1) * stride + node[0] + 1)
+
+    def bind_index(self, goal):
+        """返回目标为goal的启发式函数 h(扁平下标)"""
+        raise NotImplementedError
+
+    def clear_cache(self):
+        """清空按目标缓存的数据(没有缓存时什么也不做)"""
+
+    def memory_usage(self):
+        """按目标缓存的数据占用的字节数估计(地图图层中的预处理数据由地图统计)"""
+        return 0
+
+
+class ManhattanHeuristic(Heuristic):
+    name = "manhattan"
+
+    def bind_index(self, goal):
+        stride = self.map.width + 2
+        gy, gx = goal[1] + 1, goal[0] + 1
+
+        def heuristic(index):
+            y, x = divmod(index, stride)
+            return abs(x - gx) + abs(y - gy)
+        return heuristic
+
+
+class OctileHeuristic(Heuristic):
+    name = "octile"
+
+    def bind_index(self, goal):
+        stride = self.map.width + 2
+        gy, gx = goal[1] + 1, goal[0] + 1
+        straight = min_terrain_cost(self.map)
+        diagonal = straight * (DIAGONAL - 2)  # 每走一步对角线比走两步直线节省的成本
+
+        def heuristic(index):
+            y, x = divmod(index, stride)
+            dx = abs(x - gx)
+            dy = abs(y - gy)
+            return straight * (dx + dy) + diagonal * (dx if dx < dy else dy)
+        return heuristic
+
+
+def _lower_bound(a, b):
+    """
+    a - b 作为下界，两者之一不可达(地标与节点或目标不连通)时三角不等式不成立，记为0
+
+    距离以float32保存，减去按数值大小估计的舍入误差，保证结果不会高估
+    """
+    with np.errstate(invalid="ignore"):
+        bound = (a - b) - (a + b) * 1e-6
+    bound[~np.isfinite(bound)] = 0
+    return bound
+
+
+class LandmarkHeuristic(Heuristic):
+    """
+    ALT启发式
+
+    选取若干分布较远的地标L，预先计算 d(L, x) 和 d(x, L)。由三角不等式:
+        d(n, t) >= d(L, t) - d(L, n)
+        d(n, t) >= d(n, L) - d(t, L)
+    对所有地标取最大值，再与 octile 取最大值，结果仍是可采纳的下界。
+
+    距离场以float32保存在地图的派生图层中(随地图版本失效，共享同一地图的寻路器共用)。
+    每个目标点的启发式表按需计算并缓存最近使用的若干个。
+    """
+    name = "alt"
+    GOAL_CACHE_SIZE = 32
+
+    def __init__(self, game_map, num_landmarks=8):
+        super().__init__(game_map)
+        self.num_landmarks = num_landmarks
+        self._goal_cache = OrderedDict()
+        self._goal_version = None
+
+    def landmarks(self):
+        """(地标列表, 正向距离场, 反向距离场)，距离场形状为 (地标数, height, width)"""
+        return self.map.get_layer(f"landmarks{self.num_landmarks}", self._build)
+
+    def _build(self):
+        game_map = self.map
+        walkable = game_map.get_walkable_mask()
+        ys, xs = np.nonzero(walkable)
+        if len(xs) == 0:
+            empty = np.zeros((0, game_map.height, game_map.width), dtype=np.float32)
+            return [], empty, empty
+
+        # 最远点采样: 从离地图中心最近的可行走格子出发，依次选择离已选地标最远的格子
+        center = np.argmin((xs - game_map.width / 2) ** 2 + (ys - game_map.height / 2) ** 2)
+        nearest = distance_field(game_map, (int(xs[center]), int(ys[center])))
+        landmarks, forward, backward = [], [], []
+        for _ in range(self.num_landmarks):
+            candidates = np.where(np.isfinite(nearest), nearest, -1.0)
+            y, x = np.unravel_index(np.argmax(candidates), candidates.shape)
+            if candidates[y, x] <= 0 and landmarks:
+                break  # 没有更多可以选的格子
+            landmark = (int(x), int(y))
+            landmarks.append(landmark)
+            forward.append(distance_field(game_map, landmark))
+            backward.append(distance_field(game_map, landmark, reverse=True))
+            nearest = forward[-1] if len(landmarks) == 1 else np.minimum(nearest, forward[-1])
+        return landmarks, np.array(forward, dtype=np.float32), np.array(backward, dtype=np.float32)
+
+    def clear_cache(self):
+        self._goal_cache.clear()
+
+    def memory_usage(self):
+        return estimate_size(self._goal_cache)
+
+    def goal_table(self, goal):
+        """目标点为goal时每个格子的启发式值，按 search_grid.grid_layout 的扁平下标排列的Python列表"""
+        if self._goal_version != self.map.version:
+            self._goal_cache.clear()
+            self._goal_version = self.map.version
+        table = self._goal_cache.get(goal)
+        if table is not None:
+            self._goal_cache.move_to_end(goal)
+            return table
+
+        _, forward, backward = self.landmarks()
+        gx, gy = goal
+        game_map = self.map
+        ys, xs = np.mgrid[0:game_map.height, 0:game_map.width]
+        dx = np.abs(xs - gx)
+        dy = np.abs(ys - gy)
+        estimate = min_terrain_cost(game_map) * (dx + dy + (DIAGONAL - 2) * np.minimum(dx, dy))
+
+        if len(forward):
+            at_goal = (slice(None), slice(gy, gy + 1), slice(gx, gx + 1))
+            bounds = np.maximum(_lower_bound(forward[at_goal], forward),     # d(L, t) - d(L, n)
+                                _lower_bound(backward, backward[at_goal]))   # d(n, L) - d(t, L)
+            estimate = np.maximum(estimate, bounds.max(axis=0))
+
+        table = np.pad(estimate, 1).ravel().tolist()
+        self._goal_cache[goal] = table
+        if len(self._goal_cache) > self.GOAL_CACHE_SIZE:
+            self._goal_cache.popitem(last=False)
+        return table
+
+    def bind_index(self, goal):
+        return self.goal_table(goal).__getitem__
+
+
+HEURISTICS = {
+    "manhattan": ManhattanHeuristic,
+    "octile": OctileHeuristic,
+    "alt": LandmarkHeuristic,
+}
+
+
+def create(name, game_map):
+    """按名称创建启发式"""
+    try:
+        return HEURISTICS[name](game_map)
+    except KeyError:
+        raise ValueError(f"未知的启发式: {name}，可选: {', '.join(HEURISTICS)}") from None
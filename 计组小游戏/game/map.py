@@ -1,5 +1,7 @@
+import math
 import pygame
 import numpy as np
+from .memory import estimate_size, surface_bytes
 
 class Map:
     # 地形类型常量
@@ -29,8 +31,12 @@ class Map:
         DELIVERY_POINT: (255, 200, 0), # 黄色
         START_POINT: (50, 200, 50)     # 深绿色
     }
+    GRID_LINE_COLOR = (200, 200, 200)
     
-    def __init__(self, width=25, height=18):
+    # 净空距离场的上限(格子数)，更远的障碍不影响半径小于 CLEARANCE_CELLS * cell_size 的圆
+    CLEARANCE_CELLS = 2
+    
+    def __init__(self, width=25, height=18, generate=True):
         self.width = width
         self.height = height
         self.cell_size = 30
@@ -38,10 +44,26 @@ class Map:
         # 创建地图数据
         self.grid = np.zeros((height, width), dtype=int)
         self.delivery_points = []
-        self.start_point = (1, 1)  # 默认起点
+        self.start_point = (1, 1)  # 默认起点(主快递站)，地形为 START_POINT 的其他格子也是快递站
+        
+        # 地图版本号，地形改变时递增，用于使寻路缓存失效
+        self.version = 0
+        
+        # 按版本缓存的派生图层
+        self._layers = {}
+        self._layers_version = None
+        
+        # 按格子的净空距离和邻域位掩码，set_terrain 时局部更新，所以不放在按版本清空的派生图层中
+        self._clearance = None
+        self._clearance_version = None
         
-        # 初始化默认地图
-        self.generate_default_map()
+        # 地形图像(带网格线)，同样在 set_terrain 时局部更新
+        self._terrain_surface = None
+        self._terrain_version = None
+        
+        # 初始化默认地图(generate为False时保持全部草地，由调用者 set_grid)
+        if generate:
+            self.generate_default_map()
     
     def generate_default_map(self):
         """生成默认的校园地图"""
@@ -108,6 +130,23 @@ class Map:
             # 设置配送点
             self.grid[row, col] = self.DELIVERY_POINT
             self.delivery_points.append((col, row))  # 注意：存储为(x,y)格式
+        
+        self.version += 1
+    
+    def set_grid(self, grid, start_point, delivery_points):
+        """
+        用给定的地形数组替换整张地图(例如读取存档时)
+        
+        Args:
+            grid: 地形类型数组 (height, width)
+            start_point: 起点 (x, y)
+            delivery_points: 配送点列表 [(x, y), ...]
+        """
+        self.grid = grid
+        self.height, self.width = grid.shape
+        self.start_point = tuple(start_point)
+        self.delivery_points = [tuple(point) for point in delivery_points]
+        self.version += 1
     
     def _ensure_road_connection(self, row, col):
         """确保给定位置连接到道路网络"""
@@ -152,6 +191,181 @@ class Map:
                 if self.grid[r, col1] not in [self.DELIVERY_POINT, self.START_POINT]:
                     self.grid[r, col1] = self.ROAD
     
+    def get_layer(self, name, build):
+        """获取按地图版本缓存的派生图层，地图改变后重新生成(寻路等模块也用它缓存自己的预处理数据)"""
+        if self._layers_version != self.version:
+            self._layers = {}
+            self._layers_version = self.version
+        layer = self._layers.get(name)
+        if layer is None:
+            layer = build()
+            self._layers[name] = layer
+        return layer
+    
+    def get_cost_grid(self):
+        """每个格子的通行成本数组 (height, width)，不可通行为-1"""
+        def build():
+            lookup = np.full(max(self.TERRAIN_COSTS) + 1, -1.0)
+            for terrain_type, cost in self.TERRAIN_COSTS.items():
+                lookup[terrain_type] = cost
+            return lookup[self.grid]
+        return self.get_layer("cost", build)
+    
+    def get_depots(self):
+        """
+        所有快递站 [(x, y), ...]，起点总是第一个，其余为地形为 START_POINT 的格子(按行优先顺序)
+        
+        快递站由地形确定，随地图版本缓存；用 add_depot 增加快递站。
+        """
+        def build():
+            ys, xs = np.nonzero(self.grid == self.START_POINT)
+            depots = [self.start_point]
+            depots += [cell for cell in zip(xs.tolist(), ys.tolist()) if cell != self.start_point]
+            return depots
+        return self.get_layer("depots", build)
+    
+    def is_depot(self, grid_x, grid_y):
+        """格子是否是快递站"""
+        grid_x, grid_y = int(grid_x), int(grid_y)
+        if (grid_x, grid_y) == self.start_point:
+            return True
+        return 0 <= grid_x < self.width and 0 <= grid_y < self.height and self.grid[grid_y, grid_x] == self.START_POINT
+    
+    def add_depot(self, grid_x, grid_y):
+        """把一个格子设为快递站"""
+        self.set_terrain(grid_x, grid_y, self.START_POINT)
+    
+    def get_walkable_mask(self):
+        """可行走格子的布尔数组 (height, width)"""
+        return self.get_layer("walkable", lambda: self.get_cost_grid() > 0)
+    
+    def set_terrain(self, grid_x, grid_y, terrain_type):
+        """
+        修改一个格子的地形(不维护配送点列表和起点)
+        
+        已经计算过的净空距离和邻域位掩码只在该格子周围 CLEARANCE_CELLS 格的范围内重新计算。
+        """
+        if self.grid[grid_y, grid_x] == terrain_type:
+            return
+        self.grid[grid_y, grid_x] = terrain_type
+        self.version += 1
+        if self._clearance is not None and self._clearance_version == self.version - 1:
+            reach = self.CLEARANCE_CELLS
+            x0, x1 = max(0, grid_x - reach), min(self.width, grid_x + reach + 1)
+            y0, y1 = max(0, grid_y - reach), min(self.height, grid_y + reach + 1)
+            for field, part in zip(self._clearance, self._compute_clearance(x0, y0, x1, y1)):
+                field[y0:y1, x0:x1] = part
+            self._clearance_version = self.version
+        if self._terrain_surface is not None and self._terrain_version == self.version - 1:
+            cell = self.cell_size
+            self._terrain_surface.blit(render_terrain(self.grid[grid_y:grid_y + 1, grid_x:grid_x + 1], cell,
+                                                      grid_lines=True), (grid_x * cell, grid_y * cell))
+            self._terrain_version = self.version
+    
+    def get_clearance(self):
+        """
+        每个格子中心像素的净空距离 (height, width)，float32
+        
+        值为格子中心到最近的不可通行格子(或地图外)的距离，不可通行格子为0，最大为 CLEARANCE_CELLS * cell_size。
+        按格子存储，大小与地形数组相同(不随格子的像素尺寸增大)，set_terrain 时局部更新。
+        """
+        return self._clearance_fields()[0]
+    
+    def _neighbor_mask(self):
+        """
+        每个格子周围3x3范围内不可通行格子(含地图外)的位掩码 (height, width)，uint16
+        
+        偏移 (dx, dy) 对应第 (dy + 1) * 3 + (dx + 1) 位，第4位为格子本身。
+        """
+        return self._clearance_fields()[1]
+    
+    def _clearance_fields(self):
+        """(中心净空距离, 邻域位掩码)，地图改变后重新计算"""
+        if self._clearance is None or self._clearance_version != self.version:
+            self._clearance = self._compute_clearance(0, 0, self.width, self.height)
+            self._clearance_version = self.version
+        return self._clearance
+    
+    def _blocked_window(self, x0, y0, x1, y1):
+        """格子范围 [x0, x1) x [y0, y1) 中不可通行格子的布尔数组，范围可以超出地图(地图外视为不可通行)"""
+        walkable_types = [terrain for terrain, cost in self.TERRAIN_COSTS.items() if cost > 0]
+        blocked = np.ones((y1 - y0, x1 - x0), dtype=bool)
+        ix0, iy0 = max(x0, 0), max(y0, 0)
+        ix1, iy1 = min(x1, self.width), min(y1, self.height)
+        if ix0 < ix1 and iy0 < iy1:
+            blocked[iy0 - y0:iy1 - y0, ix0 - x0:ix1 - x0] = ~np.isin(self.grid[iy0:iy1, ix0:ix1], walkable_types)
+        return blocked
+    
+    def _blocked_padded(self):
+        """不可通行格子的布尔数组，四周各有 CLEARANCE_CELLS 格的边距"""
+        reach = self.CLEARANCE_CELLS
+        return self.get_layer("blocked_padded", lambda: self._blocked_window(
+            -reach, -reach, self.width + reach, self.height + reach))
+    
+    def _compute_clearance(self, x0, y0, x1, y1):
+        """计算格子范围 [x0, x1) x [y0, y1) 的中心净空距离和邻域位掩码，每次处理若干行以限制临时数组的大小"""
+        reach = self.CLEARANCE_CELLS
+        cap = float(reach * self.cell_size) ** 2
+        center = self.cell_size // 2 + 0.5
+        table = _window_distances(self.cell_size, reach, (center, center))
+        clearance = np.empty((y1 - y0, x1 - x0), dtype=np.float32)
+        neighbors = np.zeros((y1 - y0, x1 - x0), dtype=np.uint16)
+        rows = 256
+        for top in range(y0, y1, rows):
+            bottom = min(y1, top + rows)
+            blocked = self._blocked_window(x0 - reach, top - reach, x1 + reach, bottom + reach)
+            best = np.full((bottom - top, x1 - x0), cap)
+            for dx, dy, squared in table:
+                hit = blocked[reach + dy:reach + dy + bottom - top, reach + dx:reach + dx + x1 - x0]
+                best[hit & (best > squared)] = squared
+                if abs(dx) <= 1 and abs(dy) <= 1:
+                    neighbors[top - y0:bottom - y0] |= hit.astype(np.uint16) << ((dy + 1) * 3 + (dx + 1))
+            clearance[top - y0:bottom - y0] = np.sqrt(best)
+        return clearance, neighbors
+    
+    def clearance_at(self, x, y):
+        """
+        一组像素坐标处的净空距离(批量计算)，地图外为0，上限为 CLEARANCE_CELLS * cell_size
+        
+        距离从像素中心算起，与 is_walkable 的判定相同: 半径为r的圆不与障碍重叠当且仅当值大于r。
+        """
+        squared = self._nearest_blocked(np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64),
+                                        self.CLEARANCE_CELLS)
+        return np.minimum(np.sqrt(squared), self.CLEARANCE_CELLS * self.cell_size)
+    
+    def _nearest_blocked(self, x, y, reach):
+        """一组像素坐标(像素中心)到 reach 格以内最近的不可通行格子的距离平方，没有时为inf，地图外为0"""
+        cell = self.cell_size
+        px = np.floor(x)
+        py = np.floor(y)
+        inside = (px >= 0) & (px < self.width * cell) & (py >= 0) & (py < self.height * cell)
+        px = np.clip(px, 0, self.width * cell - 1)
+        py = np.clip(py, 0, self.height * cell - 1)
+        gx = (px // cell).astype(np.intp) + self.CLEARANCE_CELLS
+        gy = (py // cell).astype(np.intp) + self.CLEARANCE_CELLS
+        u = px % cell + 0.5   # 像素中心到所在格子左边的距离
+        v = py % cell + 0.5
+        blocked = self._blocked_padded()
+        best = np.full(px.shape, np.inf)
+        for dy in range(-reach, reach + 1):
+            ddy = _axis_gap(dy, v, cell) ** 2
+            for dx in range(-reach, reach + 1):
+                hit = blocked[gy + dy, gx + dx]
+                np.minimum(best, np.where(hit, _axis_gap(dx, u, cell) ** 2 + ddy, np.inf), out=best)
+        best[~inside] = 0.0
+        return best
+    
+    def segment_clearance(self, x0, y0, x1, y1, step=2.0):
+        """
+        像素坐标线段上净空距离的下界
+        
+        沿线段每隔不超过step像素采样一次；净空距离每移动1像素最多变化1，
+        所以采样最小值减去 step / 2 是整条线段的下界。
+        """
+        count = int(math.hypot(x1 - x0, y1 - y0) / step) + 2
+        t = np.linspace(0.0, 1.0, count)
+        return float(self.clearance_at(x0 + (x1 - x0) * t, y0 + (y1 - y0) * t).min()) - step / 2
+    
     def get_terrain_type(self, x, y):
         """获取指定位置的地形类型"""
         # 将像素坐标转换为网格坐标
@@ -168,10 +382,57 @@ class Map:
         terrain_type = self.get_terrain_type(x, y)
         return self.TERRAIN_COSTS.get(terrain_type, -1)
     
-    def is_walkable(self, x, y):
-        """检查指定位置是否可行走"""
-        cost = self.get_terrain_cost(x, y)
-        return cost > 0
+    def is_walkable(self, x, y, radius=0):
+        """
+        检查以像素坐标 (x, y) 为中心、半径为radius的圆是否不与不可通行格子重叠(radius为0时只检查中心点)
+        
+        距离从像素中心算起，恰好相切也算重叠。半径不超过一个格子时只与周围3x3范围内的格子有关，
+        由格子的邻域位掩码和像素在格子内的位置查表得到；更大的半径检查圆的外接正方形覆盖的格子
+        (与 ChunkedWorld.is_walkable 相同)。
+        """
+        cell = self.cell_size
+        if not (0 <= x < self.width * cell and 0 <= y < self.height * cell):
+            return False
+        grid_x, grid_y = int(x // cell), int(y // cell)
+        if radius <= cell:
+            bits = int(self._neighbor_mask()[grid_y, grid_x])
+            table = _walk_table(cell, max(radius, 0))
+            return bool(table[(bits * cell + int(y) - grid_y * cell) * cell + int(x) - grid_x * cell])
+        
+        walkable = self.get_walkable_mask()
+        if not walkable[grid_y, grid_x]:
+            return False
+        px, py = int(x) + 0.5, int(y) + 0.5
+        limit = radius * radius
+        for gy in range(math.ceil((py - radius) / cell) - 1, int((py + radius) // cell) + 1):
+            for gx in range(math.ceil((px - radius) / cell) - 1, int((px + radius) // cell) + 1):
+                if 0 <= gx < self.width and 0 <= gy < self.height and walkable[gy, gx]:
+                    continue
+                dx = max(gx * cell - px, 0, px - (gx + 1) * cell)
+                dy = max(gy * cell - py, 0, py - (gy + 1) * cell)
+                if dx * dx + dy * dy <= limit:
+                    return False
+        return True
+    
+    def walkable_at(self, x, y, radius):
+        """批量版本的 is_walkable: 一组像素坐标处半径为radius(标量或数组)的圆是否不与障碍重叠"""
+        cell = self.cell_size
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        radius = np.broadcast_to(np.asarray(radius, dtype=np.float64), x.shape)
+        inside = (x >= 0) & (x < self.width * cell) & (y >= 0) & (y < self.height * cell)
+        px = np.clip(np.floor(x), 0, self.width * cell - 1).astype(np.intp)
+        py = np.clip(np.floor(y), 0, self.height * cell - 1).astype(np.intp)
+        gx, gy = px // cell, py // cell
+        index = (self._neighbor_mask()[gy, gx].astype(np.intp) * cell + py - gy * cell) * cell + px - gx * cell
+        result = np.zeros(x.shape, dtype=bool)
+        for r in np.unique(radius):
+            selected = radius == r
+            if r <= cell:
+                result[selected] = _walk_table(cell, max(float(r), 0.0))[index[selected]]
+            else:
+                result[selected] = [self.is_walkable(px_, py_, r) for px_, py_ in zip(x[selected], y[selected])]
+        return inside & result
     
     def grid_to_pixel(self, grid_x, grid_y):
         """将网格坐标转换为像素坐标(中心点)"""
@@ -182,15 +443,120 @@ class Map:
         """将像素坐标转换为网格坐标"""
         return (pixel_x // self.cell_size, pixel_y // self.cell_size)
     
+    def get_terrain_surface(self):
+        """整张地图的地形图像(带网格线)，地图改变后重新生成，set_terrain 只重绘改变的格子"""
+        if self._terrain_surface is None or self._terrain_version != self.version:
+            self._terrain_surface = render_terrain(self.grid, self.cell_size, grid_lines=True)
+            self._terrain_version = self.version
+        return self._terrain_surface
+    
     def draw(self, screen):
         """绘制地图"""
-        # 绘制每个网格单元
-        for y in range(self.height):
-            for x in range(self.width):
-                terrain_type = self.grid[y, x]
-                color = self.TERRAIN_COLORS.get(terrain_type, (0, 0, 0))
-                
-                rect = pygame.Rect(x * self.cell_size, y * self.cell_size, 
-                                  self.cell_size, self.cell_size)
-                pygame.draw.rect(screen, color, rect)
-                pygame.draw.rect(screen, (200, 200, 200), rect, 1)  # 网格线 
\ No newline at end of file
+        screen.blit(self.get_terrain_surface(), (0, 0))
+    
+    def memory_usage(self):
+        """地形数组和各缓存占用的字节数估计(见 game.memory)"""
+        return {
+            "grid": self.grid.nbytes,
+            "layers": sum(estimate_size(layer) for layer in self._layers.values()),
+            "clearance": 0 if self._clearance is None else sum(field.nbytes for field in self._clearance),
+            "terrain": surface_bytes(self._terrain_surface),
+        }
+    
+    def release_caches(self):
+        """丢弃派生图层、净空距离场和地形图像，下次使用时重新生成"""
+        self._layers = {}
+        self._clearance = None
+        self._terrain_surface = None
+
+
+def terrain_palette(surface):
+    """地形类型到surface像素值的查找表(未知地形为黑色)"""
+    palette = np.full(max(Map.TERRAIN_COLORS) + 1, surface.map_rgb((0, 0, 0)), dtype=np.uint32)
+    for terrain_type, color in Map.TERRAIN_COLORS.items():
+        palette[terrain_type] = surface.map_rgb(color)
+    return palette
+
+
+def render_terrain(grid, scale, grid_lines=False, size=None):
+    """
+    把地形网格渲染为surface
+    
+    先按格子查表得到每个格子的颜色，再按像素所在的格子取色(缩小时取最近的格子)，
+    最后通过 surfarray 一次写入，不逐格调用 pygame.draw。只使用numpy和软件surface，
+    可以在后台线程中调用。
+    
+    Args:
+        grid: 地形类型数组 (height, width)
+        scale: 每个格子的像素数，可以小于1(缩略图)
+        grid_lines: 是否画出与 Map.draw 相同的网格线(scale为整数时)
+        size: 图像尺寸 (宽, 高)，默认为网格尺寸乘以scale
+    """
+    height, width = grid.shape
+    if size is None:
+        size = (max(1, int(width * scale)), max(1, int(height * scale)))
+    surface = pygame.Surface(size, depth=32)
+    palette = terrain_palette(surface)
+    if size == (width, height):
+        pixels = palette[grid.T]
+    else:
+        xs = np.arange(size[0]) * width // size[0]
+        ys = np.arange(size[1]) * height // size[1]
+        if size[0] * size[1] < width * height:
+            pixels = palette[grid[ys][:, xs].T]     # 缩小: 先取样再查表
+        else:
+            pixels = palette[grid.T][xs][:, ys]     # 放大: 先按格子查表再展开到像素
+    if grid_lines:
+        cell = int(scale)
+        line = surface.map_rgb(Map.GRID_LINE_COLOR)
+        pixels[::cell, :] = line
+        pixels[cell - 1::cell, :] = line
+        pixels[:, ::cell] = line
+        pixels[:, cell - 1::cell] = line
+    pygame.surfarray.blit_array(surface, pixels)
+    return surface
+
+
+def _axis_gap(offset, position, cell_size):
+    """格子内位置position(到格子左边或上边的距离)沿一个轴到相隔offset格的格子的距离"""
+    if offset > 0:
+        return (offset - 1) * cell_size + (cell_size - position)
+    if offset < 0:
+        return (-offset - 1) * cell_size + position
+    return position * 0
+
+
+def _window_distances(cell_size, reach, point):
+    """格子内的像素位置point (u, v) 到窗口中各格子的距离平方 [(dx, dy, 距离平方)]，按距离排序"""
+    table = []
+    for dy in range(-reach, reach + 1):
+        for dx in range(-reach, reach + 1):
+            gap_x = _axis_gap(dx, point[0], cell_size)
+            gap_y = _axis_gap(dy, point[1], cell_size)
+            table.append((dx, dy, float(gap_x * gap_x + gap_y * gap_y)))
+    table.sort(key=lambda entry: entry[2])
+    return table
+
+
+# 半径不超过一个格子时的可行走查找表，按 (格子尺寸, 半径) 缓存，见 _walk_table
+_WALK_TABLES = {}
+
+
+def _walk_table(cell_size, radius):
+    """
+    半径为radius(不超过一个格子)的圆的可行走查找表，长度为 512 * cell_size ** 2 的布尔数组
+    
+    下标为 (邻域位掩码 * cell_size + v) * cell_size + u，(u, v) 为像素在格子内的位置，
+    位掩码见 Map._neighbor_mask。每个半径的表约0.5MB，与地图大小无关。
+    """
+    key = (cell_size, radius)
+    table = _WALK_TABLES.get(key)
+    if table is None:
+        center = np.arange(cell_size) + 0.5   # 像素中心到格子左边(上边)的距离
+        gaps = [center ** 2, np.zeros(cell_size), (cell_size - center) ** 2]   # 到左(上)、本列(行)、右(下)的格子
+        touches = np.array([(gaps[bit // 3][:, None] + gaps[bit % 3][None, :] <= radius * radius).ravel()
+                            for bit in range(9)], dtype=np.int32)
+        masks = (np.arange(512)[:, None] >> np.arange(9)) & 1
+        table = ((masks @ touches) == 0).ravel()
+        _WALK_TABLES[key] = table
+    return table
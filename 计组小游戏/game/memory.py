@@ -0,0 +1,288 @@
+"""
+内存统计与泄漏追踪
+
+长时间运行(例如批量模式连续运行多天)时，定期估计各子系统(地图图层、包裹列表、寻路缓存、
+图像缓存等)占用的内存，可选地用 tracemalloc 比较相邻两次快照，报告增长最多的代码位置。
+子系统超出内存预算时调用其释放函数: 可以重建的缓存直接丢弃，已完成的包裹归档后移出列表。
+
+报告显示在性能面板中(F3)，也可以逐行追加到 JSON lines 文件。
+
+用法:
+    memory = MemoryAccountant(interval=60, budgets={"total": 256 * MB}, report_path="memory.jsonl")
+    memory.register("map", game_map.memory_usage, release=game_map.release_caches)
+    memory.update(now=elapsed)    # 每帧传入模拟时间(秒)，到采样时间时才统计
+"""
+import json
+import logging
+import sys
+import time
+import tracemalloc
+from collections import deque
+
+import numpy as np
+import pygame
+
+try:
+    import resource   # 只在类Unix系统上可用，用于报告进程的峰值常驻内存
+except ImportError:
+    resource = None
+
+from .profiler import profiler
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# 估计大容器时抽样的元素数，容器的元素大小按样本的平均值外推
+SAMPLE_ITEMS = 16
+MAX_DEPTH = 8
+
+_ATOMS = (str, bytes, bytearray, int, float, complex, bool, type(None))
+
+
+def surface_bytes(surface):
+    """一个 pygame.Surface 的像素数据字节数，None 为0"""
+    if surface is None:
+        return 0
+    return surface.get_pitch() * surface.get_height()
+
+
+def estimate_size(value, _seen=None, _depth=0):
+    """
+    估计一个对象及其包含的对象占用的字节数
+
+    numpy数组按 nbytes，Surface 按像素数据计算；列表、字典等容器递归统计元素，元素多于
+    SAMPLE_ITEMS 时只统计均匀抽取的样本再按数量外推。普通对象统计其 __dict__ 或 __slots__，
+    同一个对象只统计一次。结果是估计值，用于比较和发现增长，不是精确的内存占用。
+    """
+    if _seen is None:
+        _seen = set()
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, pygame.Surface):
+        return surface_bytes(value)
+    size = sys.getsizeof(value)
+    if isinstance(value, _ATOMS) or _depth >= MAX_DEPTH:
+        return size
+
+    if isinstance(value, dict):
+        items = list(value.keys()) + list(value.values())
+    elif isinstance(value, (list, tuple, set, frozenset, deque)):
+        items = list(value)
+    elif hasattr(value, "__dict__"):
+        return size + estimate_size(vars(value), _seen, _depth + 1)
+    elif hasattr(type(value), "__slots__"):
+        items = [getattr(value, name, None) for name in type(value).__slots__]
+    else:
+        return size
+
+    count = len(items)
+    if count > SAMPLE_ITEMS:
+        step = count / SAMPLE_ITEMS
+        sample = [items[int(i * step)] for i in range(SAMPLE_ITEMS)]
+        sampled = sum(estimate_size(item, _seen, _depth + 1) for item in sample)
+        return size + int(sampled * count / SAMPLE_ITEMS)
+    return size + sum(estimate_size(item, _seen, _depth + 1) for item in items)
+
+
+def peak_rss():
+    """进程的峰值常驻内存(字节)，不支持的平台返回None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024   # Linux上单位为KB
+
+
+class _Subsystem:
+    __slots__ = ("name", "measure", "release")
+
+    def __init__(self, name, measure, release):
+        self.name = name
+        self.measure = measure
+        self.release = release
+
+
+class MemoryAccountant:
+    """
+    按子系统的内存统计、预算和泄漏追踪
+
+    Args:
+        interval: 两次采样之间的模拟时间(秒)。采样和预算执行按模拟时间进行，
+                  相同的录制回放时在相同的帧上释放数据
+        budgets: {子系统名: 字节数}，"total" 为所有子系统之和的预算；超出时调用释放函数
+        report_path: 每次采样把报告追加到该文件(每行一个JSON对象)，None表示不写文件
+        trace: 开启 tracemalloc，每次采样与上次的快照比较，报告分配增长最多的代码位置
+        trace_frames: tracemalloc 保存的调用栈深度
+        top: 报告中增长最多的代码位置数
+    """
+
+    def __init__(self, interval=60.0, budgets=None, report_path=None, trace=False, trace_frames=1, top=10):
+        self.interval = interval
+        self.budgets = dict(budgets or {})
+        self.report_path = report_path
+        self.top = top
+        self._subsystems = {}
+        self._next_sample = None
+        self._now = 0.0   # 最近一次 update 传入的模拟时间
+
+        # tracemalloc 快照，只有由这里开启的追踪才在 close 时停止
+        self.trace = trace
+        self._snapshot = None
+        self._owns_trace = False
+        if trace and not tracemalloc.is_tracing():
+            tracemalloc.start(trace_frames)
+            self._owns_trace = True
+
+        # 最近一次的报告和统计数据
+        self.last_report = None
+        self.samples = 0
+        self.releases = {}   # 子系统名 -> 因超出预算而释放的次数
+
+    def register(self, name, measure, release=None):
+        """
+        登记一个子系统
+
+        Args:
+            measure: 无参数的函数，返回字节数或 {部分名: 字节数}
+            release: 超出预算时调用的无参数函数(丢弃可以重建的缓存或归档数据)，None表示无法释放
+        """
+        self._subsystems[name] = _Subsystem(name, measure, release)
+
+    def set_budget(self, name, nbytes):
+        """设置一个子系统("total" 为全部子系统)的预算，None表示取消"""
+        if nbytes is None:
+            self.budgets.pop(name, None)
+        else:
+            self.budgets[name] = nbytes
+
+    def update(self, now):
+        """
+        每帧调用，now 为模拟时间(秒)；到采样时间时统计一次并返回报告，否则返回None
+
+        模拟时间倒退(读档)时立即采样并重新计时。
+        """
+        previous, self._now = self._now, now
+        if self._next_sample is not None and previous <= now < self._next_sample:
+            return None
+        self._next_sample = now + self.interval
+        return self.sample()
+
+    def measure(self):
+        """
+        估计各子系统当前占用的字节数
+
+        Returns:
+            {子系统名: {"bytes": 总字节数, "parts": {部分名: 字节数}}}
+        """
+        sizes = {}
+        for subsystem in self._subsystems.values():
+            sizes[subsystem.name] = self._measure(subsystem)
+        return sizes
+
+    @staticmethod
+    def _measure(subsystem):
+        result = subsystem.measure()
+        if isinstance(result, dict):
+            parts = {name: int(value) for name, value in result.items()}
+            return {"bytes": sum(parts.values()), "parts": parts}
+        return {"bytes": int(result), "parts": {}}
+
+    def sample(self):
+        """立即统计一次: 估计各子系统、执行预算、比较 tracemalloc 快照，写入文件并更新性能面板"""
+        start = time.perf_counter()
+        sizes = self.measure()
+        released = self._enforce(sizes)
+        report = {
+            "time": time.time(),
+            "elapsed": round(self._now, 3),
+            "total": sum(entry["bytes"] for entry in sizes.values()),
+            "subsystems": sizes,
+            "released": released,
+            "peak_rss": peak_rss(),
+        }
+        if self.trace and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            report["traced"] = {"current": current, "peak": peak}
+            report["growth"] = self._growth()
+        report["sample_ms"] = round((time.perf_counter() - start) * 1000.0, 3)
+
+        self.samples += 1
+        self.last_report = report
+        self._publish(report)
+        if self.report_path:
+            with open(self.report_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(report, ensure_ascii=False) + "\n")
+        logger.debug("内存统计: 合计 %.2f MB, 耗时 %.1f ms", report["total"] / MB, report["sample_ms"])
+        return report
+
+    def _enforce(self, sizes):
+        """超出预算的子系统调用释放函数并重新估计，返回被释放的子系统名列表"""
+        released = []
+
+        def release(subsystem):
+            before = sizes[subsystem.name]["bytes"]
+            subsystem.release()
+            sizes[subsystem.name] = self._measure(subsystem)
+            self.releases[subsystem.name] = self.releases.get(subsystem.name, 0) + 1
+            released.append(subsystem.name)
+            logger.info("内存预算: 释放 %s, %.2f MB -> %.2f MB", subsystem.name,
+                        before / MB, sizes[subsystem.name]["bytes"] / MB)
+
+        for name, budget in self.budgets.items():
+            subsystem = self._subsystems.get(name)
+            if subsystem is not None and subsystem.release is not None and sizes[name]["bytes"] > budget:
+                release(subsystem)
+
+        # 超出总预算时从占用最多的子系统开始释放，直到回到预算以内
+        budget = self.budgets.get("total")
+        if budget is not None:
+            for name in sorted(sizes, key=lambda name: sizes[name]["bytes"], reverse=True):
+                if sum(entry["bytes"] for entry in sizes.values()) <= budget:
+                    break
+                subsystem = self._subsystems[name]
+                if subsystem.release is not None and name not in released:
+                    release(subsystem)
+        return released
+
+    def _growth(self):
+        """与上次快照相比分配增长最多的代码位置 [{"where", "size_diff", "count_diff"}]"""
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ))
+        previous, self._snapshot = self._snapshot, snapshot
+        if previous is None:
+            return []
+        growth = []
+        for stat in snapshot.compare_to(previous, "lineno"):
+            if stat.size_diff <= 0:
+                continue
+            frame = stat.traceback[0]
+            growth.append({"where": f"{frame.filename}:{frame.lineno}",
+                           "size_diff": stat.size_diff, "count_diff": stat.count_diff})
+            if len(growth) >= self.top:
+                break
+        return growth
+
+    def _publish(self, report):
+        """把各子系统的大小(MB)写入性能面板"""
+        for name, entry in report["subsystems"].items():
+            profiler.set_gauge(f"mem.{name}", entry["bytes"] / MB, "MB")
+        profiler.set_gauge("mem.total", report["total"] / MB, "MB")
+        if report.get("traced"):
+            profiler.set_gauge("mem.traced", report["traced"]["current"] / MB, "MB")
+        growth = report.get("growth")
+        if growth:
+            profiler.set_gauge("mem.top_growth", growth[0]["size_diff"] / 1024, "KB")
+            logger.info("内存增长最多的位置: %s (+%.1f KB, %+d 个对象)", growth[0]["where"],
+                        growth[0]["size_diff"] / 1024, growth[0]["count_diff"])
+
+    def close(self):
+        """停止由这里开启的 tracemalloc"""
+        if self._owns_trace and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self._owns_trace = False
+        self._snapshot = None
@@ -0,0 +1,84 @@
+"""
+小地图
+
+地图比屏幕大时，在屏幕角落显示缩小的整张地图以及快递员和正在配送的包裹的目的地。
+缩略图由 render_terrain 从 Map.grid 直接取样生成，按地图版本缓存，
+每帧只贴一次缩略图再画几个点。
+
+用法:
+    minimap = Minimap(game_map)
+    minimap.draw(screen, [player], package_manager.active_packages)
+"""
+import logging
+
+import pygame
+
+from .map import render_terrain
+
+logger = logging.getLogger(__name__)
+
+BORDER_COLOR = (60, 60, 60)
+DESTINATION_COLOR = (255, 100, 100)   # 与目的地标记相同
+MARGIN = 10
+
+
+class Minimap:
+    """
+    Args:
+        game_map: 地图
+        max_size: 缩略图的最大尺寸 (宽, 高)，按地图的宽高比缩放
+    """
+
+    def __init__(self, game_map, max_size=(200, 150)):
+        self.map = game_map
+        self.max_size = max_size
+
+    @property
+    def scale(self):
+        """每个格子在缩略图上的像素数"""
+        return min(self.max_size[0] / self.map.width, self.max_size[1] / self.map.height)
+
+    @property
+    def size(self):
+        scale = self.scale
+        return (max(1, int(self.map.width * scale)), max(1, int(self.map.height * scale)))
+
+    def terrain(self):
+        """按地图版本缓存的缩略图"""
+        size = self.size
+
+        def build():
+            surface = render_terrain(self.map.grid, self.scale, size=size)
+            if pygame.display.get_surface() is not None:
+                surface = surface.convert()
+            logger.debug("小地图已生成: %dx%d", *size)
+            return surface
+        return self.map.get_layer(f"minimap{size[0]}x{size[1]}", build)
+
+    def position(self, screen):
+        """缩略图在屏幕上的左上角(右下角留出边距)"""
+        width, height = self.size
+        return (screen.get_width() - width - MARGIN, screen.get_height() - height - MARGIN)
+
+    def draw(self, screen, couriers, packages=()):
+        """
+        绘制小地图
+
+        Args:
+            couriers: 快递员(Player)列表，按像素坐标画为圆点
+            packages: 正在配送的包裹，目的地画为方块
+        """
+        terrain = self.terrain()
+        left, top = self.position(screen)
+        screen.blit(terrain, (left, top))
+        pygame.draw.rect(screen, BORDER_COLOR, (left - 1, top - 1, terrain.get_width() + 2, terrain.get_height() + 2), 1)
+
+        scale = self.scale
+        for package in packages:
+            x, y = package.destination
+            center = (left + int((x + 0.5) * scale), top + int((y + 0.5) * scale))
+            pygame.draw.rect(screen, DESTINATION_COLOR, (center[0] - 2, center[1] - 2, 5, 5))
+        pixel_scale = scale / self.map.cell_size
+        for courier in couriers:
+            center = (left + int(courier.x * pixel_scale), top + int(courier.y * pixel_scale))
+            pygame.draw.circle(screen, courier.color, center, 3)
@@ -0,0 +1,335 @@
+"""
+从订单日志流式读取真实订单
+
+订单日志可以是CSV文本或紧凑的二进制记录文件，按块读取和解析，经过生成器管道:
+
+    读取(read_csv / read_binary) -> 地址解析(AddressIndex) -> 按到达时间交给 PackageManager(OrderFeed)
+
+任何时刻内存中只有当前的一块订单，日志再长内存占用也不变。
+
+CSV格式(首行为表头):
+    time,order_id,address,deadline,value
+    3.5,100001,宿舍3栋,150,24
+
+    time      订单到达时间，从日志开始计的分钟数
+    order_id  订单编号，用作包裹ID
+    address   收货地址，通过 AddressIndex 映射到配送点格子
+    deadline  从到达起允许的配送时长(分钟)
+    value     包裹价值(得分)
+
+二进制格式为 BINARY_MAGIC 加上连续的 ORDER_DTYPE 记录，地址已经编码为 AddressIndex 中的编号。
+两种日志都必须按到达时间排序。
+
+用法:
+    index = AddressIndex.for_map(game_map)
+    feed = OrderFeed(read_csv("orders.csv", index), index)
+    game_manager.package_manager.set_order_feed(feed)
+
+    # 需要读档时传入打开日志的函数，feed 可以回到存档时的读取位置
+    feed = OrderFeed(lambda: open_log("orders.bin", index), index)
+"""
+import csv
+import logging
+import zlib
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 订单记录(18字节)，二进制日志按这个布局连续存放
+ORDER_DTYPE = np.dtype([
+    ("time", "<f4"),
+    ("order_id", "<u4"),
+    ("address", "<u4"),
+    ("deadline", "<f4"),
+    ("value", "<u2"),
+])
+BINARY_MAGIC = b"ORDERS01"
+CSV_COLUMNS = ("time", "order_id", "address", "deadline", "value")
+
+UNKNOWN_ADDRESS = 0xFFFFFFFF   # 无法解析的地址编号，在 OrderFeed 中丢弃
+DEFAULT_CHUNK_ROWS = 65536
+
+
+class AddressIndex:
+    """
+    收货地址到配送点格子的索引
+
+    地址按名称映射为编号，编号对应 cells 中的一个格子；地址解析只在每块订单的去重地址上
+    查询字典，结果按编号向量化地转换为坐标。
+
+    Args:
+        cells: 配送点格子 [(x, y), ...]
+        names: {地址名称: 编号}
+        fallback: 为True时把不在names中的地址按名称的CRC32散列到一个配送点(结果稳定)，
+                  否则视为无法解析
+    """
+
+    def __init__(self, cells, names=None, fallback=True):
+        self.cells = np.asarray(cells, dtype=np.int32).reshape(-1, 2)
+        self.names = dict(names or {})
+        self.fallback = fallback
+        if not len(self.cells):
+            raise ValueError("地址索引中没有配送点")
+
+    @classmethod
+    def for_map(cls, game_map, fallback=True):
+        """以地图的配送点建立索引，第i个配送点的名称为 "D{i}" """
+        cells = list(game_map.delivery_points)
+        return cls(cells, {f"D{i}": i for i in range(len(cells))}, fallback)
+
+    @classmethod
+    def from_csv(cls, path, fallback=False):
+        """读取地址表(表头 address,x,y)，同一格子的多个地址共用一个编号"""
+        cells = []
+        slots = {}
+        names = {}
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                cell = (int(row["x"]), int(row["y"]))
+                if cell not in slots:
+                    slots[cell] = len(cells)
+                    cells.append(cell)
+                names[row["address"]] = slots[cell]
+        return cls(cells, names, fallback)
+
+    def code(self, name):
+        """一个地址的编号，无法解析时为 UNKNOWN_ADDRESS"""
+        code = self.names.get(name)
+        if code is not None:
+            return code
+        if self.fallback:
+            code = self.names[name] = zlib.crc32(name.encode("utf-8")) % len(self.cells)
+            return code
+        return UNKNOWN_ADDRESS
+
+    def encode(self, names):
+        """把一列地址名称编码为编号数组(每个不同的名称只查询一次)"""
+        unique, inverse = np.unique(np.asarray(names, dtype=object).astype(str), return_inverse=True)
+        codes = np.fromiter((self.code(name) for name in unique), dtype=np.uint32, count=len(unique))
+        return codes[inverse]
+
+    def resolve(self, codes):
+        """
+        编号数组转换为格子坐标
+
+        Returns:
+            (cells, valid): cells 为 (N, 2) 的坐标数组，valid 标记可以解析的订单
+        """
+        valid = codes < len(self.cells)
+        return self.cells[np.where(valid, codes, 0)], valid
+
+
+def read_csv(path, index, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    按块读取CSV订单日志
+
+    Yields:
+        ORDER_DTYPE 数组，每块最多 chunk_rows 条订单(地址已编码)
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        header = next(csv.reader([f.readline()]), None)
+        if header is None:
+            return
+        columns = [header.index(name) for name in CSV_COLUMNS]
+        while True:
+            lines = [line for _, line in zip(range(chunk_rows), f)]
+            if not lines:
+                return
+            rows = [row for row in csv.reader(lines) if row]
+            if not rows:
+                continue
+            fields = list(zip(*rows))
+            chunk = np.empty(len(rows), dtype=ORDER_DTYPE)
+            chunk["time"] = np.asarray(fields[columns[0]]).astype(np.float32)
+            chunk["order_id"] = np.asarray(fields[columns[1]]).astype(np.uint32)
+            chunk["address"] = index.encode(fields[columns[2]])
+            chunk["deadline"] = np.asarray(fields[columns[3]]).astype(np.float32)
+            chunk["value"] = np.asarray(fields[columns[4]]).astype(np.uint16)
+            yield chunk
+
+
+def read_binary(path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    按块读取二进制订单日志
+
+    Yields:
+        ORDER_DTYPE 数组，每块最多 chunk_rows 条订单
+    """
+    with open(path, "rb") as f:
+        if f.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+            raise ValueError(f"不是订单日志文件: {path}")
+        while True:
+            chunk = np.fromfile(f, dtype=ORDER_DTYPE, count=chunk_rows)
+            if not len(chunk):
+                return
+            yield chunk
+
+
+def write_binary(path, chunks):
+    """
+    把订单块流式写入二进制日志(例如把CSV日志转换为二进制: write_binary(out, read_csv(src, index)))
+
+    Returns:
+        count: 写入的订单数
+    """
+    count = 0
+    with open(path, "wb") as f:
+        f.write(BINARY_MAGIC)
+        for chunk in chunks:
+            np.ascontiguousarray(chunk, dtype=ORDER_DTYPE).tofile(f)
+            count += len(chunk)
+    return count
+
+
+def open_log(path, index, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """按文件头选择读取方式: 二进制日志以 BINARY_MAGIC 开头，否则按CSV读取"""
+    with open(path, "rb") as f:
+        binary = f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+    if binary:
+        return read_binary(path, chunk_rows)
+    return read_csv(path, index, chunk_rows)
+
+
+class OrderFeed:
+    """
+    按游戏时间把订单交给调度者(PackageManager)
+
+    日志时间连续地映射到游戏日: 第n天(从0开始)的游戏时间t对应日志时间 n * day_minutes + t。
+    提前结束的一天剩下的订单在下一天开始时丢弃。
+
+    读取位置(state)是日志中的订单序号，存档时保存，读档时用 seek 恢复。回到更早的位置
+    需要重新打开日志，因此 chunks 为返回订单块的函数时才可以向前 seek。
+
+    Args:
+        chunks: 订单块的可迭代对象(read_csv / read_binary / open_log 的结果)，
+            或者每次调用都从头打开日志的无参数函数
+        index: 用于解析地址编号的 AddressIndex
+        day_minutes: 一个游戏日对应的日志分钟数
+    """
+
+    def __init__(self, chunks, index, day_minutes=480):
+        self._open = chunks if callable(chunks) else None
+        self._chunks = iter(chunks() if callable(chunks) else chunks)
+        self.index = index
+        self.day_minutes = day_minutes
+        self.day = -1
+        self.base = 0.0           # 当天开始时的日志时间
+
+        self._chunk = None        # 当前订单块及其解析后的目的地
+        self._cells = None
+        self._cursor = 0
+        self._offset = 0          # 当前块之前的日志订单数(包括地址无法解析的)
+        self._rows = 0            # 当前块解析前的订单数
+        self._raw = None          # 当前块中有效订单在解析前的下标，全部有效时为None
+        self.exhausted = False
+
+        # 统计数据
+        self.ingested = 0           # 已交给调度者的订单数
+        self.dropped = 0            # 地址无法解析或当天未到达就被跳过的订单数
+
+    def _current(self):
+        """当前订单块中还没有交出的部分，需要时读取下一块；日志读完时返回False"""
+        while self._chunk is None or self._cursor >= len(self._chunk):
+            self._offset += self._rows
+            self._rows = 0
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self._chunk = None
+                self.exhausted = True
+                return False
+            self._rows = len(chunk)
+            self._raw = None
+            cells, valid = self.index.resolve(chunk["address"])
+            if not valid.all():
+                self.dropped += int((~valid).sum())
+                self._raw = np.flatnonzero(valid)
+                chunk, cells = chunk[valid], cells[valid]
+            self._chunk, self._cells, self._cursor = chunk, cells, 0
+        return True
+
+    def position(self):
+        """日志中下一条还没有交出或跳过的订单的序号"""
+        if self._chunk is None:
+            return self._offset
+        if self._cursor >= len(self._chunk):
+            return self._offset + self._rows
+        if self._raw is None:
+            return self._offset + self._cursor
+        return self._offset + int(self._raw[self._cursor])
+
+    def state(self):
+        """读取位置和统计数据 (day, position, ingested, dropped)，用于存档"""
+        return self.day, self.position(), self.ingested, self.dropped
+
+    def seek(self, state):
+        """
+        回到 state() 返回的读取位置
+
+        Raises:
+            ValueError: 需要回到更早的位置，但日志不能重新打开(chunks 不是函数)
+        """
+        day, position, ingested, dropped = state
+        if position < self.position():
+            if self._open is None:
+                raise ValueError("订单日志不能回到更早的位置")
+            self._chunks = iter(self._open())
+            self._chunk = self._cells = self._raw = None
+            self._cursor = self._offset = self._rows = 0
+        self.exhausted = False
+        while self._current():
+            if position < self._offset + self._rows:
+                local = position - self._offset
+                self._cursor = local if self._raw is None else int(np.searchsorted(self._raw, local))
+                break
+            self._cursor = len(self._chunk)
+        self.day = day
+        self.base = day * self.day_minutes
+        self.ingested = ingested
+        self.dropped = dropped
+
+    def start_day(self):
+        """开始新的一天，丢弃日志时间早于当天开始的订单"""
+        self.day += 1
+        self.base = self.day * self.day_minutes
+        while self._current():
+            times = self._chunk["time"]
+            skip = int(np.searchsorted(times[self._cursor:], self.base, side="left"))
+            self.dropped += skip
+            self._cursor += skip
+            if self._cursor < len(self._chunk):
+                break
+
+    def due(self, game_time):
+        """
+        到达时间不晚于当天游戏时间 game_time 的订单
+
+        Yields:
+            (order_id, destination, arrival, deadline, value): arrival 为到达时的游戏时间，
+            deadline 为截止的游戏时间，destination 为格子坐标 (x, y)
+        """
+        until = self.base + game_time
+        while self._current():
+            chunk = self._chunk
+            end = self._cursor + int(np.searchsorted(chunk["time"][self._cursor:], until, side="right"))
+            if end == self._cursor:
+                return
+            part = chunk[self._cursor:end]
+            cells = self._cells[self._cursor:end]
+            self._cursor = end
+            self.ingested += len(part)
+            arrivals = part["time"] - self.base
+            for order, (x, y), arrival in zip(part.tolist(), cells.tolist(), arrivals.tolist()):
+                yield order[1], (x, y), arrival, arrival + order[3], order[4]
+
+    def pending_today(self):
+        """当天是否还有订单会到达"""
+        if not self._current():
+            return False
+        return float(self._chunk["time"][self._cursor]) < self.base + self.day_minutes
+
+    def next_arrival(self):
+        """当天下一条订单到达时的游戏时间，当天没有订单会到达时返回None"""
+        if not self.pending_today():
+            return None
+        return float(self._chunk["time"][self._cursor]) - self.base
@@ -1,16 +1,28 @@
+import csv
+import logging
+import os
+import sys
 import pygame
 import random
 from .pathfinding import AStar
+from .depots import UNREACHABLE, assign_depot, depot_field
+from . import telemetry as events
+from .memory import estimate_size
+from .event_bus import (EventBus, CELL_ENTERED, PACKAGE_SPAWNED, PACKAGE_PICKED,
+                        PACKAGE_DELIVERED, PACKAGE_EXPIRED)
+
+logger = logging.getLogger(__name__)
 
 class Package:
-    def __init__(self, start_point, destination, deadline, value):
-        self.start_point = start_point  # 起点 (grid_x, grid_y)
+    def __init__(self, start_point, destination, deadline, value, rng=None, package_id=None):
+        self.start_point = start_point  # 起点(发出包裹的快递站) (grid_x, grid_y)
         self.destination = destination  # 目的地 (grid_x, grid_y)
         self.deadline = deadline        # 截止时间（游戏内分钟）
         self.value = value              # 包裹价值（得分）
         self.pickup_time = None         # 拾取时间
         self.status = "WAITING"         # 状态：WAITING, PICKED, DELIVERED, EXPIRED
-        self.id = random.randint(10000, 99999)  # 随机包裹ID
+        # 包裹ID: 来自订单日志时使用订单编号，否则随机生成
+        self.id = package_id if package_id is not None else (rng or random).randint(10000, 99999)
     
     def pick_up(self, current_time):
         """拾取包裹"""
@@ -35,55 +47,225 @@ class Package:
         return True
 
 class PackageManager:
-    def __init__(self, game_map):
+    def __init__(self, game_map, rng=None, pathfinder=None, bus=None):
         self.map = game_map
+        
+        # 随机数生成器，传入固定种子的 random.Random 可使包裹生成可复现
+        self.rng = rng or random.Random()
         self.packages = []
         self.active_packages = []
         self.delivered_packages = []
         self.expired_packages = []
         
+        # 已归档(移出列表)的包裹数，见 archive_finished
+        self.archived_delivered = 0
+        self.archived_expired = 0
+        self.archive_path = None   # 归档时追加写入的CSV文件，None表示只保留计数
+        
         # 包裹生成设置
         self.next_spawn_time = 0
         self.spawn_interval = 120  # 默认每120秒游戏时间生成一个新包裹
         self.max_active_packages = 5
         
-        # 初始化寻路器用于检查路径可达性
-        self.pathfinder = AStar(self.map)
+        # 初始化寻路器用于检查路径可达性(可传入与其他对象共享的寻路器以共享路径缓存)
+        self.pathfinder = pathfinder or AStar(self.map)
+        
+        # 寻路调度器(可选，见 game.path_scheduler)，设置后新包裹在路径查询完成后才生成
+        self.scheduler = None
+        self._spawn_requests = []    # [(查询, (快递站, 目的地, 截止时间, 包裹ID))]
+        
+        # 从某个快递站可以到达的配送点，按地图版本缓存
+        self._reachable = None
+        self._reachable_key = None
+        
+        # 遥测(可选)，记录包裹生成、拾取、配送和过期事件
+        self.telemetry = None
+        self.courier = 0       # 遥测中的快递员编号
+        self.game_time = 0     # 最近一次update的游戏时间，用于给生成事件打时间戳
+        
+        # 事件总线: 玩家进入新格子时才检查拾取和配送；新包裹生成在玩家所在的快递站时也检查拾取
+        self.bus = bus or EventBus()
+        self.bus.subscribe(CELL_ENTERED, self._on_cell_entered)
+        self.bus.subscribe(PACKAGE_SPAWNED, self._on_package_spawned)
+        self._arrivals = []          # 上次update之后进入新格子的 (玩家, 格子)
+        self._players = []           # 发布过 CELL_ENTERED 的玩家，用于检查新包裹是否生成在玩家脚下
+        self._next_deadline = None   # 等待中包裹的最早截止时间，None表示需要重新扫描
+        
+        # 订单来源(可选，见 game.orders.OrderFeed)，设置后包裹按订单日志的到达时间生成，不再随机生成
+        self.order_feed = None
+        
+        # draw 使用的字体，第一次绘制时创建
+        self._font = None
+    
+    def set_order_feed(self, feed):
+        """使用订单日志代替随机生成包裹，从下一次 generate_packages 开始生效"""
+        self.order_feed = feed
+    
+    def set_scheduler(self, scheduler):
+        """设置寻路调度器，之后生成包裹时的路径查询分多帧执行"""
+        self.scheduler = scheduler
+    
+    def spawns_pending(self):
+        """是否有等待路径查询完成的新包裹"""
+        return bool(self._spawn_requests)
+    
+    def pending_spawns(self):
+        """等待路径查询完成的新包裹 [(快递站, 目的地, 截止时间, 包裹ID)]，用于存档"""
+        return [spawn for _, spawn in self._spawn_requests]
+    
+    def restore_spawns(self, spawns):
+        """重新提交存档中等待路径查询的新包裹(在 invalidate 之后调用)"""
+        for spawn in spawns:
+            self._request_spawn(*spawn)
+    
+    def orders_pending(self):
+        """订单日志中当天是否还有订单会到达"""
+        return self.order_feed is not None and self.order_feed.pending_today()
+    
+    def next_change(self):
+        """
+        下一次订单到达或等待中的包裹过期的游戏时间，没有时返回None
+
+        到达和截止时间都可以不是整分钟(订单日志的时间是连续的)。
+        """
+        times = [package.deadline for package in self.packages if package.status == "WAITING"]
+        if self.order_feed is not None:
+            arrival = self.order_feed.next_arrival()
+            if arrival is not None:
+                times.append(arrival)
+        return min(times, default=None)
+    
+    def delivered_count(self):
+        """当天已配送的包裹数(包括已归档的)"""
+        return self.archived_delivered + len(self.delivered_packages)
+    
+    def expired_count(self):
+        """当天已过期的包裹数(包括已归档的)"""
+        return self.archived_expired + len(self.expired_packages)
+    
+    def archive_finished(self):
+        """
+        把已配送和已过期的包裹移出所有列表，只保留计数
+        
+        长时间运行时包裹列表只增不减，由内存预算(见 game.memory)触发。设置了 archive_path 时
+        归档的包裹追加写入该CSV文件。归档的包裹不再出现在存档和 state_summary 的包裹列表中。
+        
+        Returns:
+            count: 归档的包裹数
+        """
+        finished = list({id(package): package for package in self.delivered_packages + self.expired_packages
+                         + [p for p in self.packages if p.status in ("DELIVERED", "EXPIRED")]}.values())
+        if not finished:
+            return 0
+        if self.archive_path:
+            new_file = not os.path.exists(self.archive_path) or os.path.getsize(self.archive_path) == 0
+            with open(self.archive_path, "a", newline="") as f:
+                writer = csv.writer(f)
+                if new_file:
+                    writer.writerow(["id", "status", "dest_x", "dest_y", "deadline", "value", "pickup_time"])
+                for package in finished:
+                    writer.writerow([package.id, package.status, package.destination[0], package.destination[1],
+                                     package.deadline, package.value,
+                                     "" if package.pickup_time is None else package.pickup_time])
+        self.archived_delivered += sum(1 for package in finished if package.status == "DELIVERED")
+        self.archived_expired += sum(1 for package in finished if package.status == "EXPIRED")
+        self.delivered_packages = []
+        self.expired_packages = []
+        self.packages = [package for package in self.packages if package.status not in ("DELIVERED", "EXPIRED")]
+        logger.info("归档 %d 个已完成的包裹", len(finished))
+        return len(finished)
+    
+    def memory_usage(self):
+        """包裹列表占用的字节数估计(见 game.memory)，同一个包裹在多个列表中只统计一次"""
+        lists = (self.active_packages, self.delivered_packages, self.expired_packages)
+        return {
+            "packages": estimate_size(self.packages),
+            "lists": sum(sys.getsizeof(packages) for packages in lists),
+        }
         
     def update(self, delta_time, player, game_time):
-        """更新所有包裹状态"""
+        """
+        更新包裹状态，返回本帧配送得分
+        
+        过期检查只在游戏时间超过最早的截止时间后进行；拾取和配送只在玩家进入新格子
+        (CELL_ENTERED 事件)后，或者新包裹生成在玩家所在的快递站(PACKAGE_SPAWNED 事件)后检查。
+        player 参数保留以兼容旧的调用方式。
+        """
         # 使用由GameManager传入的game_time
         
-        # 更新包裹状态
-        for package in self.packages[:]:
-            package.update(game_time)
+        self.game_time = game_time
         
-        # 处理拾取包裹
-        self._handle_pickup(player, game_time)
+        # 把已经到达的订单转换为包裹
+        if self.order_feed is not None:
+            self._ingest_orders(game_time)
         
-        # 处理交付包裹
-        return self._handle_delivery(player, game_time)
-    
-    def _handle_pickup(self, player, game_time):
-        """处理玩家拾取包裹"""
-        player_grid_pos = self.map.pixel_to_grid(player.x, player.y)
+        # 更新包裹状态，刚过期的包裹移入过期列表
+        if self._next_deadline is None or game_time > self._next_deadline:
+            self._expire(game_time)
         
+        score = 0
+        arrivals, self._arrivals = self._arrivals, []
+        for arrived, cell in arrivals:
+            # 处理拾取包裹
+            self._handle_pickup(arrived, cell, game_time)
+            
+            # 处理交付包裹
+            score += self._handle_delivery(arrived, cell, game_time)
+        return score
+    
+    def invalidate(self):
+        """包裹列表被外部替换后(例如读取存档)调用，下一次update重新扫描截止时间"""
+        self._next_deadline = None
+        self._arrivals = []
+        for request, _ in self._spawn_requests:
+            self.scheduler.cancel(request)
+        self._spawn_requests = []
+    
+    def _on_cell_entered(self, player, cell):
+        if not any(known is player for known in self._players):
+            self._players.append(player)
+        self._arrivals.append((player, cell))
+    
+    def _on_package_spawned(self, package):
+        """
+        包裹生成在玩家正站着的快递站上(订单到达或路径查询完成时)，玩家不会再进入这个格子，
+        按进入格子处理一次，在下一次update中拾取
+        """
+        for player in self._players:
+            if package.status == "WAITING" and player.cell == package.start_point:
+                self._arrivals.append((player, player.cell))
+    
+    def _expire(self, game_time):
+        """把超过截止时间仍未拾取的包裹移入过期列表，并记录剩余等待包裹的最早截止时间"""
+        next_deadline = float("inf")
+        for package in self.packages:
+            if not package.update(game_time):
+                self.expired_packages.append(package)
+                self._emit(events.EXPIRE, package)
+                self.bus.publish(PACKAGE_EXPIRED, package=package)
+            elif package.status == "WAITING" and package.deadline < next_deadline:
+                next_deadline = package.deadline
+        self._next_deadline = next_deadline
+    
+    def _handle_pickup(self, player, cell, game_time):
+        """处理玩家在cell拾取包裹"""
         for package in self.packages:
             if (package.status == "WAITING" and 
-                player_grid_pos == package.start_point and 
-                player.pickup_package()):
+                cell == package.start_point and 
+                player.can_pickup()):
                 package.pick_up(game_time)
                 self.active_packages.append(package)
+                self._emit(events.PICKUP, package)
+                self.bus.publish(PACKAGE_PICKED, package=package, player=player)
     
-    def _handle_delivery(self, player, game_time):
-        """处理玩家配送包裹"""
-        player_grid_pos = self.map.pixel_to_grid(player.x, player.y)
+    def _handle_delivery(self, player, cell, game_time):
+        """处理玩家在cell配送包裹"""
         score = 0
         
         for package in self.active_packages[:]:
             if (package.status == "PICKED" and 
-                player_grid_pos == package.destination and 
-                player.deliver_package()):
+                cell == package.destination and 
+                player.current_packages > 0):
                 # 配送成功，计算得分
                 points = package.deliver(game_time)
                 score += points
@@ -91,6 +273,8 @@ class PackageManager:
                 # 移动到已配送列表
                 self.active_packages.remove(package)
                 self.delivered_packages.append(package)
+                self._emit(events.DELIVER, package, points, game_time - package.pickup_time)
+                self.bus.publish(PACKAGE_DELIVERED, package=package, player=player, points=points)
         
         return score
     
@@ -100,6 +284,15 @@ class PackageManager:
         self.active_packages = []
         self.delivered_packages = []
         self.expired_packages = []
+        self.archived_delivered = 0
+        self.archived_expired = 0
+        self.game_time = 0
+        self.invalidate()
+        
+        # 使用订单日志时，包裹在订单到达时生成
+        if self.order_feed is not None:
+            self.order_feed.start_day()
+            return
         
         # 生成初始包裹
         for _ in range(3):
@@ -110,49 +303,106 @@ class PackageManager:
         # 获取可能的目的地（配送点）
         destinations = self.map.delivery_points
         
-        # 从起点生成包裹
-        start_point = self.map.start_point
-        
         # 尝试找到一个有效路径的目的地
         valid_destination = None
-        valid_path = None
         max_attempts = 10  # 最多尝试次数
         
+        # 可达性由快递站区域确定，可达的目的地一定有路径
+        reachable = self._reachable_destinations()
         for _ in range(max_attempts):
             # 随机选择一个目的地
             if not destinations:
-                print("错误：没有可用的配送点")
+                logger.error("没有可用的配送点")
                 return
                 
-            destination = random.choice(destinations)
-            
-            # 检查路径可达性
-            path = self.pathfinder.find_path(start_point, destination)
-            if path:
+            destination = self.rng.choice(destinations)
+            if destination in reachable:
                 valid_destination = destination
-                valid_path = path
-                print(f"找到可行路径 从 {start_point} 到 {destination}, 长度: {len(path)}")
                 break
         
         # 如果没有找到有效路径，打印错误
         if not valid_destination:
-            print("警告：无法生成有效包裹，所有目的地都无法到达")
+            logger.warning("无法生成有效包裹，所有目的地都无法到达")
             return
             
         # 设置截止时间（当前时间 + 随机时长）
-        deadline = random.randint(120, 240)  # 2-4小时期限
+        deadline = self.rng.randint(120, 240)  # 2-4小时期限
+        
+        # 包裹ID在提交查询时就取出，随机数的使用顺序与路径查询何时完成无关
+        package_id = self.rng.randint(10000, 99999)
+        
+        # 包裹从到达目的地最快的快递站发出
+        depot = assign_depot(self.map, valid_destination)
+        self._request_spawn(depot, valid_destination, deadline, package_id)
+    
+    def _request_spawn(self, depot, destination, deadline, package_id):
+        """查询从快递站到目的地的路径，完成后生成包裹(没有调度器时立即查询)"""
+        if self.scheduler is None:
+            self._spawn(depot, destination, deadline, package_id, self.pathfinder.find_path(depot, destination))
+            return
+        
+        def spawn(path):
+            self._spawn_requests.remove(entry)
+            self._spawn(depot, destination, deadline, package_id, path)
+        request = self.scheduler.submit(depot, destination, callback=spawn, any_angle=False)
+        entry = (request, (depot, destination, deadline, package_id))
+        self._spawn_requests.append(entry)
+    
+    def _spawn(self, depot, destination, deadline, package_id, path):
+        """路径查询完成后在快递站depot创建包裹"""
+        if not path:
+            logger.warning("无法生成有效包裹，到 %s 的路径查询失败", destination)
+            return
+        logger.debug("找到可行路径 从 %s 到 %s, 长度: %d", depot, destination, len(path))
         
         # 设置价值（基于距离和截止时间）
-        distance = len(valid_path)  # 使用路径长度作为实际距离
+        distance = len(path)  # 使用路径长度作为实际距离
         value = int(10 + distance * 2)  # 基础分 + 距离奖励
         
         # 创建新包裹
-        package = Package(start_point, valid_destination, deadline, value)
+        package = Package(depot, destination, deadline, value, package_id=package_id)
         self.packages.append(package)
-        print(f"生成新包裹: ID {package.id}, 目的地: {valid_destination}, 价值: {value}")
+        if self._next_deadline is not None:
+            self._next_deadline = min(self._next_deadline, deadline)
+        self._emit(events.SPAWN, package, value, deadline)
+        self.bus.publish(PACKAGE_SPAWNED, package=package)
+        logger.info("生成新包裹: ID %d, 目的地: %s, 价值: %d", package.id, destination, value)
+    
+    def _ingest_orders(self, game_time):
+        """把订单日志中到达时间不晚于game_time的订单加入等待列表(在到达最快的快递站等待)"""
+        start_point = self.map.start_point
+        for order_id, destination, arrival, deadline, value in self.order_feed.due(game_time):
+            depot = assign_depot(self.map, destination) or start_point
+            package = Package(depot, destination, deadline, value, package_id=order_id)
+            self.packages.append(package)
+            if self._next_deadline is not None:
+                self._next_deadline = min(self._next_deadline, deadline)
+            self._emit(events.SPAWN, package, value, deadline)
+            self.bus.publish(PACKAGE_SPAWNED, package=package)
+            logger.debug("订单到达: ID %d, 目的地: %s, 到达时间: %.1f", order_id, destination, arrival)
+    
+    def _reachable_destinations(self):
+        """从某个快递站可以到达的配送点集合(由快递站区域查表，见 game.depots)"""
+        key = (self.map.version, self.map.start_point, tuple(self.map.delivery_points))
+        if self._reachable_key != key:
+            labels = depot_field(self.map)[0]
+            self._reachable = {tuple(point) for point in self.map.delivery_points
+                               if labels[point[1], point[0]] != UNREACHABLE}
+            self._reachable_key = key
+        return self._reachable
+    
+    def _emit(self, kind, package, value=0, aux=0.0):
+        """向遥测记录一个包裹事件(未开启遥测时不做任何事)"""
+        if self.telemetry is not None:
+            self.telemetry.record(kind, self.game_time, package.id, package.destination[0],
+                                  package.destination[1], value, aux, self.courier)
     
     def draw(self, screen):
         """绘制所有包裹"""
+        if self._font is None:
+            self._font = pygame.font.SysFont(None, 20)
+        font = self._font
+        
         # 绘制等待中的包裹
         for package in self.packages:
             if package.status == "WAITING":
@@ -162,7 +412,6 @@ class PackageManager:
                                (pos[0] - 5, pos[1] - 5, 10, 10))
                 
                 # 绘制包裹ID
-                font = pygame.font.SysFont(None, 20)
                 id_text = f"{package.id}"
                 id_surface = font.render(id_text, True, (0, 0, 0))
                 screen.blit(id_surface, (pos[0] - id_surface.get_width() // 2, 
@@ -175,7 +424,6 @@ class PackageManager:
             pygame.draw.circle(screen, (255, 100, 100), pos, 8, 2)
             
             # 绘制包裹ID
-            font = pygame.font.SysFont(None, 20)
             id_text = f"{package.id}"
             id_surface = font.render(id_text, True, (0, 0, 0))
             screen.blit(id_surface, (pos[0] - id_surface.get_width() // 2, 
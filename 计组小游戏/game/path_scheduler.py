@@ -0,0 +1,168 @@
+"""
+按帧分配预算的寻路调度
+
+玩家规划路线和生成包裹时不在事件处理中直接搜索，而是把查询提交给 PathScheduler。
+GameManager 每帧调用一次 update，按提交顺序继续执行未完成的搜索(IncrementalSearch)，
+总共最多展开 max_expansions 个节点(可选再加上微秒预算)，搜索完成后需要平滑的路径
+也在预算内分帧平滑(每次视线检测按 SMOOTH_CHECK_COST 个节点计)，全部完成时调用回调。
+一次搜索再长，每帧的寻路耗时也不超过预算；搜索未完成时可以先使用 partial_path。
+
+节点数预算是确定的，录制和回放得到相同的结果；微秒预算与机器速度有关，只适合不需要复现的场合。
+
+用法:
+    scheduler = PathScheduler(pathfinder, max_expansions=2000)
+    request = scheduler.submit(start, end, callback=on_path)
+    scheduler.update()        # 每帧一次
+"""
+import logging
+import time
+
+from .profiler import profiler
+
+logger = logging.getLogger(__name__)
+
+# 一次视线检测(路径平滑)大约相当于展开的节点数
+SMOOTH_CHECK_COST = 4
+
+
+class PathRequest:
+    """一个提交给调度器的路径查询"""
+
+    def __init__(self, search, callback, any_angle):
+        self.search = search
+        self.callback = callback
+        self.any_angle = any_angle
+        self.cancelled = False
+        self.frames = 0          # 执行过的帧数
+
+        # 搜索完成后、平滑之前对网格路径的修改(可选)，例如接上已经沿部分路径走过的格子
+        self.transform = None
+
+        self.done = False
+        self.path = None
+        self._smoothing = None   # 分步平滑的 (生成器, 平滑结果)
+
+    def restart(self, search):
+        """换成新的搜索(例如地图改变后从头搜索)，丢弃未完成的平滑"""
+        self.search = search
+        self._smoothing = None
+
+    def advance(self, pathfinder, budget, deadline=None):
+        """在budget个节点的预算内继续执行，返回用掉的预算"""
+        used = 0
+        if not self.search.done:
+            used = self.search.step(budget, deadline)
+            if not self.search.done:
+                return used
+        if self._smoothing is None:
+            # 搜索刚完成(或提交时就已完成，例如起点即终点或命中路径缓存)
+            path = self.search.path
+            if self.transform is not None and path:
+                path = self.transform(list(path))
+            if not (self.any_angle and path):
+                self.path = list(path)
+                self.done = True
+                return used
+            smoothed = []
+            self._smoothing = (pathfinder.smooth_steps(path, self.search.radius, smoothed), smoothed)
+        steps, smoothed = self._smoothing
+        for checks in steps:
+            used += checks * SMOOTH_CHECK_COST
+            if used >= budget or (deadline is not None and time.perf_counter() >= deadline):
+                return used
+        self.path = smoothed
+        self.done = True
+        self._smoothing = None
+        return used
+
+    def partial_path(self):
+        """目前最好的部分路径(见 IncrementalSearch.partial_path)"""
+        return self.search.partial_path()
+
+
+class PathScheduler:
+    """
+    每帧按预算执行寻路查询
+
+    Args:
+        pathfinder: AStar
+        max_expansions: 每帧最多展开的节点数
+        max_microseconds: 每帧的寻路时间预算(微秒)，None表示只按节点数限制
+    """
+
+    def __init__(self, pathfinder, max_expansions=2000, max_microseconds=None):
+        self.pathfinder = pathfinder
+        self.max_expansions = max_expansions
+        self.max_microseconds = max_microseconds
+        self._queue = []
+
+        # 最近一帧的统计数据
+        self.last_expanded = 0
+        self.last_completed = 0
+
+    def __len__(self):
+        return len(self._queue)
+
+    def submit(self, start, end, callback=None, any_angle=None, radius=None):
+        """
+        提交一个查询，下一次 update 时开始执行
+
+        Args:
+            callback: 完成时以路径为参数调用(不可达时为空列表)
+            any_angle: 是否平滑路径，None表示使用寻路器的设置
+            radius: 个体半径，None表示使用寻路器的设置
+
+        Returns:
+            PathRequest
+        """
+        if any_angle is None:
+            any_angle = self.pathfinder.any_angle
+        request = PathRequest(self.pathfinder.start_search(start, end, radius), callback, any_angle)
+        self._queue.append(request)
+        return request
+
+    def cancel(self, request):
+        """取消一个查询，之后不再调用它的回调"""
+        if request is not None:
+            request.cancelled = True
+
+    def clear(self):
+        """取消全部查询"""
+        for request in self._queue:
+            request.cancelled = True
+        self._queue = []
+
+    def update(self):
+        """执行一帧的寻路，依次完成的查询按提交顺序调用回调"""
+        budget = self.max_expansions
+        deadline = None
+        if self.max_microseconds is not None:
+            deadline = time.perf_counter() + self.max_microseconds / 1e6
+        version = self.pathfinder.map.version
+        finished = []
+        expanded = 0
+        for request in self._queue:
+            if request.cancelled:
+                continue
+            search = request.search
+            if search.version != version:
+                # 地图改变后从头搜索
+                request.restart(self.pathfinder.start_search(search.start, search.end, search.radius))
+            if not request.done:
+                if budget <= expanded or (deadline is not None and time.perf_counter() >= deadline):
+                    break
+                request.frames += 1
+                expanded += request.advance(self.pathfinder, budget - expanded, deadline)
+            if request.done:
+                finished.append(request)
+        self.last_expanded = expanded
+        self.last_completed = len(finished)
+        profiler.count("scheduler.expanded", expanded)
+
+        if finished or any(request.cancelled for request in self._queue):
+            self._queue = [request for request in self._queue if not request.cancelled and not request.done]
+        for request in finished:
+            if request.frames > 1:
+                logger.debug("路径查询 %s -> %s 用了 %d 帧", request.search.start, request.search.end, request.frames)
+            if request.callback is not None:
+                request.callback(list(request.path))
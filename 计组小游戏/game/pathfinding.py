@@ -1,133 +1,600 @@
 import heapq
+import math
+import time
+from collections import OrderedDict
 import numpy as np
+from .profiler import profiler
+from .memory import estimate_size
+from . import heuristics, search_grid
 
 class AStar:
-    def __init__(self, game_map):
+    # 路径缓存最多保存的条目数
+    CACHE_SIZE = 256
+    
+    def __init__(self, game_map, heuristic="octile", queue="heapq"):
         self.map = game_map
+        
+        # 路径缓存: (起点, 终点, 任意角度, 半径) -> 路径，地图版本变化时清空
+        self._path_cache = OrderedDict()
+        self._cache_version = None
+        
+        # 启发式函数: "octile"(默认，可采纳)、"alt"(地标，大地图上展开节点更少)或 "manhattan"(旧版本)
+        self.heuristic = None
+        self._heuristic_impl = None
+        self.set_heuristic(heuristic)
+        
+        # 最近一次搜索的统计数据
+        self.last_expanded = 0
+        self.last_pushes = 0
+        
+        # 任意角度模式: 对网格路径做视线平滑，去掉多余的拐点
+        self.any_angle = False
+        
+        # 个体半径(像素): 大于0时避开净空距离不足的格子，对角移动不切角
+        self.radius = 0
+        
+        # 优先队列: "heapq"(浮点成本)或 "bucket"(整数成本的桶队列，见 game.search_grid)
+        self.queue = "heapq"
+        self.set_queue(queue)
+        
+        # 搜索的节点存储，在多次搜索之间复用
+        self._nodes = None
+        
+        # 视线检测使用的成本表(按行的列表)，随地图版本更新
+        self._los_costs = None
+        self._los_version = None
     
-    def find_path(self, start, end):
+    def find_path(self, start, end, any_angle=None, radius=None):
         """
         使用A*算法找到从起点到终点的最佳路径
         
         Args:
             start: 起点坐标元组 (x, y)，以网格为单位
             end: 终点坐标元组 (x, y)，以网格为单位
+            any_angle: 是否返回平滑后的任意角度路径，None表示使用 self.any_angle
+            radius: 个体半径(像素)，None表示使用 self.radius
             
         Returns:
             path: 路径列表，每个元素为 (x, y) 坐标元组
                   如果没有路径，返回空列表
         """
+        if any_angle is None:
+            any_angle = self.any_angle
+        if radius is None:
+            radius = self.radius
+        
+        # 地图改变后缓存的路径不再有效
+        if self._cache_version != self.map.version:
+            self._path_cache.clear()
+            self._cache_version = self.map.version
+        
+        key = (start, end, any_angle, radius)
+        cached = self._path_cache.get(key)
+        if cached is not None:
+            self._path_cache.move_to_end(key)
+            profiler.count("astar.cache_hits")
+            return list(cached)
+        
+        if any_angle:
+            path = self.smooth_path(self.find_path(start, end, False, radius), radius)
+        else:
+            self.last_expanded = 0
+            self.last_pushes = 0
+            if self.queue == "bucket":
+                path = self._search_bucket(start, end, radius)
+            else:
+                path = self._search(start, end, radius)
+            profiler.count("astar.searches")
+            profiler.count("astar.expanded", self.last_expanded)
+            profiler.count("astar.pushes", self.last_pushes)
+        
+        self._cache_put(key, path)
+        return list(path)
+    
+    def _cache_put(self, key, path):
+        """写入路径缓存，超过容量时淘汰最久未使用的条目"""
+        self._path_cache[key] = path
+        if len(self._path_cache) > self.CACHE_SIZE:
+            self._path_cache.popitem(last=False)
+    
+    def smooth_path(self, path, radius=0):
+        """
+        对网格路径做视线平滑(post-smoothing)
+        
+        从当前锚点出发，只要直线视线畅通且直线的成本不高于原路径对应段的成本，
+        就跳过中间的拐点。直线成本按经过格子的最大地形成本乘以直线长度估算，
+        因此平滑不会把道路上的路线拉到草地上。radius > 0 时直线的净空距离还必须大于radius。
+        
+        Args:
+            path: find_path 返回的网格路径
+            radius: 个体半径(像素)
+            
+        Returns:
+            path: 只保留必要拐点的路径，首尾点不变
+        """
+        smoothed = []
+        for _ in self.smooth_steps(path, radius, smoothed):
+            pass
+        return smoothed
+    
+    def smooth_steps(self, path, radius, smoothed):
+        """
+        smooth_path 的分步版本: 把平滑后的路径逐点追加到smoothed，每确定一个拐点产出一次
+        本步的视线检测次数，供按帧分配预算的调用方(见 game.path_scheduler)使用
+        """
+        if len(path) < 3:
+            smoothed.extend(path)
+            return
+        
+        costs = self._get_los_costs()
+        
+        # 原路径到每个点的累计成本(与搜索使用相同的成本模型)
+        cumulative = [0.0]
+        for (x0, y0), (x1, y1) in zip(path, path[1:]):
+            step = 1.414 if x0 != x1 and y0 != y1 else 1.0
+            cumulative.append(cumulative[-1] + step * costs[y1][x1])
+        
+        smoothed.append(path[0])
+        anchor = 0
+        checks = 0
+        while anchor < len(path) - 1:
+            best = anchor + 1
+            step_checks = 0
+            for j in range(anchor + 2, len(path)):
+                step_checks += 1
+                max_cost = self._line_max_cost(costs, path[anchor], path[j])
+                if max_cost < 0 or (radius > 0 and self._segment_clearance(path[anchor], path[j]) <= radius):
+                    break  # 视线被阻挡
+                dx = path[j][0] - path[anchor][0]
+                dy = path[j][1] - path[anchor][1]
+                if math.hypot(dx, dy) * max_cost <= cumulative[j] - cumulative[anchor] + 1e-9:
+                    best = j
+            smoothed.append(path[best])
+            anchor = best
+            checks += step_checks
+            yield step_checks
+        
+        profiler.count("astar.los_checks", checks)
+    
+    def _segment_clearance(self, a, b):
+        """两个格子中心之间线段的净空距离下界"""
+        return self.map.segment_clearance(*self.map.grid_to_pixel(*a), *self.map.grid_to_pixel(*b))
+    
+    def line_of_sight(self, a, b):
+        """检查两个网格点之间的直线是否只经过可行走格子"""
+        return self._line_max_cost(self._get_los_costs(), a, b) >= 0
+    
+    def _get_los_costs(self):
+        """按行的地形成本列表，不可通行为-1；Python列表的单元素访问比numpy快得多"""
+        if self._los_version != self.map.version:
+            self._los_costs = self.map.get_cost_grid().tolist()
+            self._los_version = self.map.version
+        return self._los_costs
+    
+    def _line_max_cost(self, costs, a, b):
+        """
+        沿两个格子中心之间的直线遍历所有经过的格子(supercover)
+        
+        直线恰好穿过格子角点时，角点两侧的格子都要检查，避免穿墙。
+        
+        Returns:
+            cost: 经过格子的最大成本，遇到不可通行格子时返回-1
+        """
+        x, y = a
+        x1, y1 = b
+        dx = abs(x1 - x)
+        dy = abs(y1 - y)
+        sx = 1 if x1 > x else -1
+        sy = 1 if y1 > y else -1
+        error = dx - dy
+        dx *= 2
+        dy *= 2
+        
+        max_cost = 0  # 与搜索相同，起点格子本身不计成本
+        for _ in range(abs(x1 - x) + abs(y1 - y)):
+            if error > 0:
+                x += sx
+                error -= dy
+            elif error < 0:
+                y += sy
+                error += dx
+            else:
+                # 恰好经过角点: 检查两个相邻格子后沿对角线前进
+                c1 = costs[y][x + sx]
+                c2 = costs[y + sy][x]
+                if c1 < 0 or c2 < 0:
+                    return -1
+                max_cost = max(max_cost, c1, c2)
+                x += sx
+                y += sy
+                error += dx - dy
+            cost = costs[y][x]
+            if cost < 0:
+                return -1
+            if cost > max_cost:
+                max_cost = cost
+            if x == x1 and y == y1:
+                break
+        return max_cost
+    
+    def clear_cache(self):
+        """清空路径缓存(包括启发式按终点缓存的数据)"""
+        self._path_cache.clear()
+        self._heuristic_impl.clear_cache()
+    
+    def memory_usage(self):
+        """路径缓存、节点存储和启发式缓存占用的字节数估计(见 game.memory)"""
+        return {
+            "path_cache": estimate_size(self._path_cache),
+            "node_store": estimate_size(self._nodes),
+            "los_costs": estimate_size(self._los_costs),
+            "heuristic": self._heuristic_impl.memory_usage(),
+        }
+    
+    def release_memory(self):
+        """清空路径缓存并丢弃节点存储和视线成本表，下次搜索时重新分配"""
+        self.clear_cache()
+        self._nodes = None
+        self._los_costs = None
+        self._los_version = None
+    
+    def set_heuristic(self, name):
+        """切换启发式函数(见 game.heuristics)，不同启发式找到的等价路径可能不同，因此清空路径缓存"""
+        self._heuristic_impl = heuristics.create(name, self.map)
+        self.heuristic = name
+        self._path_cache.clear()
+    
+    def start_search(self, start, end, radius=None):
+        """
+        开始一次可以分多帧执行的搜索(见 IncrementalSearch)，结果为不平滑的网格路径
+        
+        路径已在缓存中时返回的搜索已经完成；搜索完成时结果写入路径缓存。
+        """
+        if radius is None:
+            radius = self.radius
+        if self._cache_version != self.map.version:
+            self._path_cache.clear()
+            self._cache_version = self.map.version
+        return IncrementalSearch(self, start, end, radius)
+    
+    def set_queue(self, name):
+        """切换优先队列，相同成本的路径可能不同，因此清空路径缓存"""
+        self.queue = search_grid.check_queue(name)
+        self._path_cache.clear()
+    
+    def _store(self, size):
+        """取出节点存储并开始新一轮搜索"""
+        store = self._nodes
+        if store is None or len(store.g) != size:
+            store = self._nodes = _NodeStore(size)
+        store.generation += 1
+        return store
+    
+    def _endpoints(self, start, end):
+        """检查起点和终点，返回它们的扁平下标，无法搜索时返回None"""
         # 确保起点和终点在地图范围内
         if not (0 <= start[0] < self.map.width and 0 <= start[1] < self.map.height) or \
            not (0 <= end[0] < self.map.width and 0 <= end[1] < self.map.height):
-            return []
+            return None
         
         # 确保终点可行走
         if self.map.grid[end[1], end[0]] in [self.map.BUILDING, self.map.WATER]:
-            return []
-        
-        # 方向数组，用于生成相邻节点
-        # 8个方向：上、右、下、左、右上、右下、左下、左上
-        directions = [(0, -1), (1, 0), (0, 1), (-1, 0), (1, -1), (1, 1), (-1, 1), (-1, -1)]
+            return None
         
-        # 初始化开放列表和关闭列表
-        open_list = []  # 优先队列，存储待考察的节点
-        closed_set = set()  # 存储已考察的节点
-        
-        # 存储每个节点的父节点，用于重建路径
-        came_from = {}
+        stride = self.map.width + 2
+        return (int(start[1]) + 1) * stride + int(start[0]) + 1, (int(end[1]) + 1) * stride + int(end[0]) + 1
+    
+    def _search(self, start, end, radius=0):
+        """
+        执行一次A*搜索，并把展开节点数和入堆次数记录到 last_expanded / last_pushes
         
-        # 存储从起点到每个节点的实际成本
-        g_score = {start: 0}
+        节点用扁平下标表示(见 search_grid.grid_layout)，g值、父节点和关闭标记保存在
+        可复用的数组中，每轮搜索递增代号即可清空，不需要重新分配。
+        每个方向的移动成本(包括半径限制)预先计算在 search_grid.move_layout 的成本表中。
+        """
+        endpoints = self._endpoints(start, end)
+        if endpoints is None:
+            return []
+        source, target = endpoints
+        stride, costs, moves, _ = search_grid.move_layout(self.map, radius)
+        store = self._store(len(costs))
+        generation = store.generation
+        g_score, came_from, seen, closed = store.g, store.parent, store.seen, store.closed
+        heuristic = self._heuristic_impl.bind_index(end)
+        push, pop = heapq.heappush, heapq.heappop
         
-        # 存储从起点到终点经过每个节点的估计总成本
-        f_score = {start: self._heuristic(start, end)}
+        # 开放列表为优先队列，存储 (f值, 节点)
+        seen[source] = generation
+        g_score[source] = 0.0
+        came_from[source] = -1
+        open_list = [(heuristic(source), source)]
         
-        # 将起点添加到开放列表
-        heapq.heappush(open_list, (f_score[start], start))
+        # 统计计数使用局部变量，搜索结束时再写回
+        expanded = 0
+        pushes = 1
         
         while open_list:
             # 从开放列表中获取f值最小的节点
-            _, current = heapq.heappop(open_list)
+            _, current = pop(open_list)
+            
+            # 同一节点可能因找到更优路径而多次入堆，跳过已展开的旧条目
+            if closed[current] == generation:
+                continue
             
             # 如果当前节点是终点，重建路径并返回
-            if current == end:
-                return self._reconstruct_path(came_from, end)
+            if current == target:
+                self.last_expanded = expanded
+                self.last_pushes = pushes
+                return self._reconstruct_path(came_from, current, stride)
             
-            # 将当前节点添加到关闭列表
-            closed_set.add(current)
+            closed[current] = generation
+            expanded += 1
+            g_current = g_score[current]
             
-            # 检查所有相邻节点
-            for dx, dy in directions:
-                neighbor = (current[0] + dx, current[1] + dy)
-                
-                # 检查邻居是否在地图范围内
-                if not (0 <= neighbor[0] < self.map.width and 0 <= neighbor[1] < self.map.height):
-                    continue
-                
-                # 检查邻居是否可行走
-                terrain_type = self.map.grid[neighbor[1], neighbor[0]]
-                if terrain_type in [self.map.BUILDING, self.map.WATER]:
+            # 检查所有相邻节点，进入邻居的成本为其地形成本，对角线乘以√2
+            for offset, move_costs in moves:
+                neighbor = current + offset
+                cost = move_costs[neighbor]
+                if cost < 0 or closed[neighbor] == generation:
                     continue
-                
-                # 如果邻居已经在关闭列表中，跳过
-                if neighbor in closed_set:
-                    continue
-                
-                # 计算经过当前节点到达邻居的成本
-                # 对角线移动成本为√2
-                if dx != 0 and dy != 0:
-                    move_cost = 1.414 * self.map.TERRAIN_COSTS[terrain_type]
-                else:
-                    move_cost = self.map.TERRAIN_COSTS[terrain_type]
-                
-                tentative_g_score = g_score[current] + move_cost
-                
-                # 如果邻居不在开放列表中，或者找到了更优路径
-                if neighbor not in g_score or tentative_g_score < g_score[neighbor]:
-                    # 更新路径和成本
-                    came_from[neighbor] = current
+                tentative_g_score = g_current + cost
+                if seen[neighbor] != generation or tentative_g_score < g_score[neighbor]:
+                    seen[neighbor] = generation
                     g_score[neighbor] = tentative_g_score
-                    f_score[neighbor] = g_score[neighbor] + self._heuristic(neighbor, end)
-                    
-                    # 如果邻居不在开放列表中，添加到开放列表
-                    if neighbor not in [i[1] for i in open_list]:
-                        heapq.heappush(open_list, (f_score[neighbor], neighbor))
+                    came_from[neighbor] = current
+                    push(open_list, (tentative_g_score + heuristic(neighbor), neighbor))
+                    pushes += 1
         
         # 如果开放列表为空但未找到路径，则无法到达终点
+        self.last_expanded = expanded
+        self.last_pushes = pushes
         return []
     
-    def _heuristic(self, a, b):
+    def _search_bucket(self, start, end, radius=0):
         """
-        计算两点之间的启发式距离（曼哈顿距离）
+        使用桶队列的A*搜索，结果与 _search 相同(成本相同的路径中可能选择不同的一条)
         
-        Args:
-            a: 第一个点的坐标 (x, y)
-            b: 第二个点的坐标 (x, y)
-            
-        Returns:
-            distance: 两点之间的估计距离
+        g值和f值都是乘以 SCALE 的整数。buckets 把f值映射到节点列表，keys 是其余非空桶的f值的堆，
+        通常只在当前桶取空时才访问堆。同一个桶内后进先出，f值相同时优先展开g值较大
+        (离终点较近)的节点。启发式不一致(manhattan)时f值可能变小，此时先转到更小的桶。
         """
-        # 使用曼哈顿距离作为启发式函数
-        return abs(a[0] - b[0]) + abs(a[1] - b[1])
+        endpoints = self._endpoints(start, end)
+        if endpoints is None:
+            return []
+        source, target = endpoints
+        stride, moves, _ = search_grid.integer_move_layout(self.map, radius)
+        store = self._store(len(moves[0][1]))
+        generation = store.generation
+        g_score, came_from, seen, closed = store.g, store.parent, store.seen, store.closed
+        heuristic = heuristics.scale_heuristic(self._heuristic_impl.bind_index(end))
+        push, pop = heapq.heappush, heapq.heappop
+        
+        seen[source] = generation
+        g_score[source] = 0
+        came_from[source] = -1
+        key = heuristic(source)
+        buckets = {key: [source]}
+        keys = []
+        bucket = buckets[key]
+        
+        expanded = 0
+        pushes = 1
+        
+        while True:
+            # 当前桶取空后转到下一个f值
+            while not bucket:
+                del buckets[key]
+                if not keys:
+                    self.last_expanded = expanded
+                    self.last_pushes = pushes
+                    return []
+                key = pop(keys)
+                bucket = buckets[key]
+            if keys and keys[0] < key:
+                push(keys, key)
+                key = pop(keys)
+                bucket = buckets[key]
+            current = bucket.pop()
+            
+            if closed[current] == generation:
+                continue
+            
+            if current == target:
+                self.last_expanded = expanded
+                self.last_pushes = pushes
+                return self._reconstruct_path(came_from, current, stride)
+            
+            closed[current] = generation
+            expanded += 1
+            g_current = g_score[current]
+            
+            for offset, move_costs in moves:
+                neighbor = current + offset
+                cost = move_costs[neighbor]
+                if cost < 0 or closed[neighbor] == generation:
+                    continue
+                tentative_g_score = g_current + cost
+                if seen[neighbor] != generation or tentative_g_score < g_score[neighbor]:
+                    seen[neighbor] = generation
+                    g_score[neighbor] = tentative_g_score
+                    came_from[neighbor] = current
+                    f_score = tentative_g_score + heuristic(neighbor)
+                    entries = buckets.get(f_score)
+                    if entries is None:
+                        buckets[f_score] = [neighbor]
+                        push(keys, f_score)
+                    else:
+                        entries.append(neighbor)
+                    pushes += 1
+    
+    @staticmethod
+    def _to_grid(index, stride):
+        """扁平下标转换为网格坐标 (x, y)"""
+        y, x = divmod(index, stride)
+        return (x - 1, y - 1)
     
-    def _reconstruct_path(self, came_from, current):
+    def _reconstruct_path(self, came_from, current, stride):
         """
         从终点回溯到起点，重建完整路径
         
         Args:
-            came_from: 存储每个节点的父节点的字典
-            current: 终点坐标
+            came_from: 每个节点的父节点下标(起点为-1)
+            current: 终点下标
+            stride: 扁平网格的行宽
             
         Returns:
             path: 从起点到终点的路径列表
         """
-        total_path = [current]
-        while current in came_from:
+        total_path = []
+        while current != -1:
+            total_path.append(self._to_grid(current, stride))
             current = came_from[current]
-            total_path.append(current)
         
         # 反转路径，使其从起点到终点
         total_path.reverse()
         
-        return total_path 
\ No newline at end of file
+        return total_path
+
+
+class IncrementalSearch:
+    """
+    可以暂停和继续的A*搜索(与 AStar._search 相同的成本模型和启发式，使用heapq)
+    
+    每次调用 step 最多展开指定数量的节点，搜索状态(开放列表、g值、父节点)保存在
+    自己的节点存储中，多个搜索可以交替执行。搜索完成前 partial_path 返回到目前为止
+    展开的节点中离终点最近(启发式最小)的节点的路径，调用方可以先沿它出发。
+    
+    由 AStar.start_search 创建。
+    """
+    
+    # 有时间预算时每展开这么多节点检查一次时钟
+    CLOCK_INTERVAL = 64
+    
+    def __init__(self, pathfinder, start, end, radius=0):
+        self.pathfinder = pathfinder
+        self.start = start
+        self.end = end
+        self.radius = radius
+        self.version = pathfinder.map.version
+        self.done = False
+        self.path = None
+        self.expanded = 0
+        
+        self._key = (start, end, False, False, radius)
+        cached = pathfinder._path_cache.get(self._key)
+        if cached is not None:
+            profiler.count("astar.cache_hits")
+            self._finish(list(cached), cache=False)
+            return
+        endpoints = pathfinder._endpoints(start, end)
+        if endpoints is None:
+            self._finish([])
+            return
+        self._source, self._target = endpoints
+        self._stride, costs, self._moves, _ = search_grid.move_layout(pathfinder.map, radius)
+        self._store = store = _NodeStore(len(costs))
+        store.generation = 1
+        store.seen[self._source] = 1
+        store.g[self._source] = 0.0
+        self._heuristic = pathfinder._heuristic_impl.bind_index(end)
+        estimate = self._heuristic(self._source)
+        self._open = [(estimate, self._source)]
+        self._best = self._source
+        self._best_estimate = estimate
+    
+    def _finish(self, path, cache=True):
+        self.done = True
+        self.path = path
+        self._open = None
+        self._store = None
+        if cache:
+            profiler.count("astar.searches")
+            self.pathfinder._cache_put(self._key, path)
+    
+    def step(self, max_expansions, deadline=None):
+        """
+        继续搜索，最多展开 max_expansions 个节点
+        
+        Args:
+            max_expansions: 本次最多展开的节点数
+            deadline: time.perf_counter() 的截止时刻，None表示只按节点数限制
+            
+        Returns:
+            expanded: 本次展开的节点数
+        """
+        if self.done:
+            return 0
+        store = self._store
+        g_score, came_from, seen, closed = store.g, store.parent, store.seen, store.closed
+        open_list, moves, heuristic, target = self._open, self._moves, self._heuristic, self._target
+        push, pop = heapq.heappush, heapq.heappop
+        best, best_estimate = self._best, self._best_estimate
+        interval = self.CLOCK_INTERVAL
+        expanded = 0
+        
+        while open_list and expanded < max_expansions:
+            if deadline is not None and expanded % interval == interval - 1 and time.perf_counter() >= deadline:
+                break
+            _, current = pop(open_list)
+            if closed[current] == 1:
+                continue
+            if current == target:
+                self._count(expanded)
+                self._finish(self.pathfinder._reconstruct_path(came_from, current, self._stride))
+                return expanded
+            closed[current] = 1
+            expanded += 1
+            estimate = heuristic(current)
+            if estimate < best_estimate:
+                best, best_estimate = current, estimate
+            g_current = g_score[current]
+            for offset, move_costs in moves:
+                neighbor = current + offset
+                cost = move_costs[neighbor]
+                if cost < 0 or closed[neighbor] == 1:
+                    continue
+                tentative_g_score = g_current + cost
+                if seen[neighbor] != 1 or tentative_g_score < g_score[neighbor]:
+                    seen[neighbor] = 1
+                    g_score[neighbor] = tentative_g_score
+                    came_from[neighbor] = current
+                    push(open_list, (tentative_g_score + heuristic(neighbor), neighbor))
+        
+        self._best, self._best_estimate = best, best_estimate
+        self._count(expanded)
+        if not open_list:
+            self._finish([])
+        return expanded
+    
+    def _count(self, expanded):
+        self.expanded += expanded
+        profiler.count("astar.expanded", expanded)
+    
+    def run(self):
+        """一次执行到结束，返回路径"""
+        while not self.done:
+            self.step(1 << 30)
+        return self.path
+    
+    def partial_path(self):
+        """完成时为最终路径，否则为从起点到目前离终点最近的已展开节点的路径"""
+        if self.done:
+            return list(self.path)
+        return self.pathfinder._reconstruct_path(self._store.parent, self._best, self._stride)
+
+
+class _NodeStore:
+    """
+    一次搜索的节点数据，按扁平下标存储
+    
+    seen/closed 保存最近一次写入时的搜索代号，与当前代号相同才有效，
+    因此开始新一轮搜索只需要递增代号。
+    """
+    __slots__ = ("g", "parent", "seen", "closed", "generation")
+    
+    def __init__(self, size):
+        self.g = [0.0] * size
+        self.parent = [-1] * size
+        self.seen = [0] * size
+        self.closed = [0] * size
+        self.generation = 0
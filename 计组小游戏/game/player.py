@@ -1,7 +1,12 @@
+import logging
 import pygame
+from .depots import nearest_delivery_point, nearest_depot
+from .event_bus import EventBus, CELL_ENTERED, DEPOT_REACHED, PACKAGE_PICKED, PACKAGE_DELIVERED
+
+logger = logging.getLogger(__name__)
 
 class Player:
-    def __init__(self, game_map):
+    def __init__(self, game_map, bus=None):
         self.map = game_map
         
         # 玩家位置(像素坐标)
@@ -30,11 +35,28 @@ class Player:
         
         # 添加A*寻路器引用
         self.pathfinder = None
+        
+        # 寻路调度器(可选，见 game.path_scheduler)，设置后路线查询分多帧执行
+        self.scheduler = None
+        self._route_request = None
+        self._route_partial = False   # 是否正在沿未完成查询的部分路径移动
+        
+        # 当前所在格子，进入新格子时发布 CELL_ENTERED(None表示下一次更新时重新发布)
+        self.cell = None
+        
+        # 事件总线: 携带的包裹数随拾取和配送事件更新
+        self.bus = bus or EventBus()
+        self.bus.subscribe(PACKAGE_PICKED, self._on_package_picked)
+        self.bus.subscribe(PACKAGE_DELIVERED, self._on_package_delivered)
     
     def set_pathfinder(self, pathfinder):
         """设置寻路器引用"""
         self.pathfinder = pathfinder
     
+    def set_scheduler(self, scheduler):
+        """设置寻路调度器，之后路线查询提交给调度器而不是立即搜索"""
+        self.scheduler = scheduler
+    
     def reset(self):
         """重置玩家到初始状态"""
         start_x, start_y = self.map.grid_to_pixel(*self.map.start_point)
@@ -44,6 +66,8 @@ class Player:
         self.current_packages = 0
         self.current_path = []
         self.follow_path = False
+        self.cell = None
+        self.cancel_route()
     
     def handle_event(self, event):
         """处理玩家输入事件"""
@@ -59,58 +83,7 @@ class Player:
                 
             # 路径跟随切换
             if event.key == pygame.K_p:
-                # 获取当前玩家的网格坐标
-                current_grid = self.map.pixel_to_grid(self.x, self.y)
-                # 确保坐标是整数
-                current_grid = (int(current_grid[0]), int(current_grid[1]))
-                print("当前位置:", current_grid)
-                
-                # 如果有寻路器
-                if self.pathfinder:
-                    # 如果玩家正在携带包裹，寻找到最近的配送点
-                    if self.carrying_package:
-                        nearest_point = None
-                        min_distance = float('inf')
-                        
-                        # 找出最近的配送点
-                        for point in self.map.delivery_points:
-                            # 检查到该点的路径是否存在
-                            path = self.pathfinder.find_path(current_grid, point)
-                            if path:  # 如果存在路径
-                                dist = len(path)  # 使用路径长度作为距离
-                                if dist < min_distance:
-                                    min_distance = dist
-                                    nearest_point = point
-                        
-                        if nearest_point:
-                            print("寻找路径到配送点:", nearest_point)
-                            path = self.pathfinder.find_path(current_grid, nearest_point)
-                            if path:
-                                self.current_path = path
-                                self.path_index = 0
-                                self.follow_path = True
-                                print("已计算路径，长度:", len(path))
-                            else:
-                                print("无法找到到配送点的路径")
-                        else:
-                            print("未找到可到达的配送点")
-                    else:
-                        # 如果没有携带包裹，寻找回快递站的路径
-                        start_point = self.map.start_point
-                        print("寻找路径回快递站:", start_point)
-                        path = self.pathfinder.find_path(current_grid, start_point)
-                        if path:
-                            self.current_path = path
-                            self.path_index = 0
-                            self.follow_path = True
-                            print("已计算回快递站的路径，长度:", len(path))
-                        else:
-                            print("无法找到回快递站的路径")
-                else:
-                    # 如果没有寻路器
-                    print("寻路器未设置")
-                    # 仅切换显示/隐藏路径状态
-                    self.follow_path = not self.follow_path
+                self.plan_route()
                 
         elif event.type == pygame.KEYUP:
             if event.key == pygame.K_a or event.key == pygame.K_LEFT:
@@ -122,14 +95,115 @@ class Player:
             if event.key == pygame.K_s or event.key == pygame.K_DOWN:
                 self.moving_down = False
     
+    def plan_route(self):
+        """
+        计算路径辅助: 携带包裹时前往最近的配送点，否则返回快递站
+
+        最近的目标由按地图版本缓存的反向多源距离场查表得到(见 game.depots)，
+        在输入事件中不做搜索；到目标的路线查询有调度器时分多帧执行。
+        """
+        # 获取当前玩家的网格坐标
+        current_grid = self.map.pixel_to_grid(self.x, self.y)
+        # 确保坐标是整数
+        current_grid = (int(current_grid[0]), int(current_grid[1]))
+        logger.debug("当前位置: %s", current_grid)
+        
+        # 如果有寻路器
+        if self.pathfinder:
+            # 如果玩家正在携带包裹，寻找到最近的配送点
+            if self.carrying_package:
+                # 查配送点距离场找出最近的配送点
+                nearest_point = nearest_delivery_point(self.map, current_grid)[0]
+                
+                if nearest_point:
+                    logger.debug("寻找路径到配送点: %s", nearest_point)
+                    self._request_route(current_grid, nearest_point, "配送点")
+                else:
+                    logger.warning("未找到可到达的配送点")
+            else:
+                # 如果没有携带包裹，寻找回最近的快递站的路径(查快递站区域，见 game.depots)
+                depot = nearest_depot(self.map, current_grid, reverse=True)[0] or self.map.start_point
+                logger.debug("寻找路径回快递站: %s", depot)
+                self._request_route(current_grid, depot, "快递站")
+        else:
+            # 如果没有寻路器
+            logger.warning("寻路器未设置")
+            # 仅切换显示/隐藏路径状态
+            self.follow_path = not self.follow_path
+    
+    def _request_route(self, start, end, label):
+        """查询到end的路线: 有调度器时提交查询，完成后再设置路径，否则立即搜索"""
+        self.cancel_route()
+        if self.scheduler is None:
+            self._on_route(self.pathfinder.find_path(start, end, radius=self.radius), label)
+            return
+        self._route_request = self.scheduler.submit(
+            start, end, callback=lambda path: self._on_route(path, label), radius=self.radius)
+    
+    def cancel_route(self):
+        """取消未完成的路线查询"""
+        if self._route_request is not None and self.scheduler is not None:
+            self.scheduler.cancel(self._route_request)
+        self._route_request = None
+        self._route_partial = False
+    
+    def _join_walked(self, path):
+        """
+        查询完成时已经沿部分路径走了一段: 沿走过的格子退回到最后一个位于新路径上的格子，
+        再接上新路径(在调度器平滑路径之前调用，path为网格路径)
+        """
+        walked = self.current_path[:self.path_index]
+        on_path = {cell: i for i, cell in enumerate(path)}
+        for back, cell in enumerate(reversed(walked)):
+            if cell in on_path:
+                return walked[len(walked) - back:][::-1] + path[on_path[cell]:]
+        return path
+    
+    def _on_route(self, path, label):
+        """路线查询完成"""
+        partial = self._route_partial
+        self._route_request = None
+        self._route_partial = False
+        if path:
+            self.current_path = path
+            self.path_index = 0
+            self.follow_path = True
+            logger.debug("已计算到%s的路径，长度: %d", label, len(path))
+        else:
+            if partial:
+                self.follow_path = False
+            logger.warning("无法找到到%s的路径", label)
+    
     def update(self, delta_time):
         """更新玩家状态"""
+        # 路线查询还没有完成时，先沿目前离终点最近的部分路径出发
+        request = self._route_request
+        if request is not None and not request.search.done and not self._route_partial and request.frames:
+            partial = request.partial_path()
+            if len(partial) > 1:
+                self.set_path(partial)
+                self._route_partial = True
+                request.transform = self._join_walked
+        
         # 如果正在跟随路径
         if self.follow_path and self.current_path and self.path_index < len(self.current_path):
             self._follow_path(delta_time)
         else:
             # 根据用户输入移动
             self._move_by_input(delta_time)
+        
+        cell = self.map.pixel_to_grid(self.x, self.y)
+        if cell != self.cell:
+            self.cell = cell
+            self.bus.publish(CELL_ENTERED, player=self, cell=cell)
+            if self.map.is_depot(*cell):
+                self.bus.publish(DEPOT_REACHED, player=self)
+    
+    def is_idle(self):
+        """没有移动输入也不在跟随路径时，玩家不会移动"""
+        if self.moving_left or self.moving_right or self.moving_up or self.moving_down:
+            return False
+        return not (self.follow_path and self.current_path and self.path_index < len(self.current_path))
     
     def _move_by_input(self, delta_time):
         """根据用户输入移动"""
@@ -153,18 +227,28 @@ class Player:
         # 计算新位置
         new_x = self.x + dx * self.speed * delta_time
         new_y = self.y + dy * self.speed * delta_time
+        self._move_to(new_x, new_y)
+    
+    def _move_to(self, new_x, new_y):
+        """
+        移动到新位置，返回是否移动了
         
-        # 检查新位置是否可行走
-        if self.map.is_walkable(new_x, new_y):
+        整个圆都不能与不可通行的格子重叠，不能整体移动时依次尝试只水平、只垂直移动。
+        当前位置已经贴墙时(例如刚加载的旧存档)只检查中心点，避免卡住。
+        """
+        radius = self.radius if self.map.is_walkable(self.x, self.y, self.radius) else 0
+        if self.map.is_walkable(new_x, new_y, radius):
+            self.x = new_x
+            self.y = new_y
+        # 尝试水平移动
+        elif new_x != self.x and self.map.is_walkable(new_x, self.y, radius):
             self.x = new_x
+        # 尝试垂直移动
+        elif new_y != self.y and self.map.is_walkable(self.x, new_y, radius):
             self.y = new_y
         else:
-            # 尝试水平移动
-            if self.map.is_walkable(new_x, self.y):
-                self.x = new_x
-            # 尝试垂直移动
-            elif self.map.is_walkable(self.x, new_y):
-                self.y = new_y
+            return False
+        return True
     
     def _follow_path(self, delta_time):
         """跟随预先计算的路径"""
@@ -190,13 +274,13 @@ class Player:
             dx /= distance
             dy /= distance
             
-        # 计算新位置
+        # 计算新位置，与键盘移动一样检查圆形碰撞
         new_x = self.x + dx * self.speed * delta_time
         new_y = self.y + dy * self.speed * delta_time
-        
-        # 移动玩家
-        self.x = new_x
-        self.y = new_y
+        if not self._move_to(new_x, new_y):
+            # 路径被挡住(例如查询之后地形改变了)，停止跟随，交还键盘控制
+            logger.debug("路径在 %s 处被挡住，停止跟随", self.current_path[self.path_index])
+            self.follow_path = False
     
     def set_path(self, path):
         """设置要跟随的路径"""
@@ -214,13 +298,28 @@ class Player:
             pygame.draw.rect(screen, (150, 100, 50), 
                             (int(self.x) - 5, int(self.y) - 20, 10, 10))
         
-        # 如果有路径且显示路径开启，绘制路径
+        self.draw_path(screen)
+    
+    def draw_path(self, screen):
+        """如果有路径且显示路径开启，绘制剩余的路径"""
         if self.current_path and self.follow_path:
             for i in range(self.path_index, len(self.current_path) - 1):
                 start_pos = self.map.grid_to_pixel(*self.current_path[i])
                 end_pos = self.map.grid_to_pixel(*self.current_path[i + 1])
                 pygame.draw.line(screen, (255, 0, 0), start_pos, end_pos, 2)
     
+    def can_pickup(self):
+        """背包是否还能再放一个包裹"""
+        return self.current_packages < self.max_packages
+    
+    def _on_package_picked(self, package, player):
+        if player is self:
+            self.pickup_package()
+    
+    def _on_package_delivered(self, package, player, points):
+        if player is self:
+            self.deliver_package()
+    
     def pickup_package(self):
         """尝试拾取包裹"""
         if self.current_packages < self.max_packages:
@@ -0,0 +1,278 @@
+import csv
+import json
+import logging
+import time
+from collections import deque
+
+import pygame
+
+logger = logging.getLogger(__name__)
+
+
+class _NullSection:
+    """关闭性能统计时使用的空计时区段，进入和退出都不做任何事"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SECTION = _NullSection()
+
+
+class _Section:
+    """一个计时区段，退出时把耗时交给记录函数(累加到当前帧或记为启动阶段)"""
+    __slots__ = ("record", "name", "start")
+
+    def __init__(self, record, name):
+        self.record = record
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Profiler:
+    """
+    每帧性能统计
+
+    记录各阶段(handle_event/update/draw)及各子系统的耗时、寻路计数器，
+    并把最近若干帧保存在环形缓冲区中，可在屏幕上显示或导出为CSV/JSON。
+    关闭时 section() 返回共享的空区段，count() 只做一次布尔判断。
+    """
+
+    # 性能面板的统计数据每隔这么多秒(真实时间)才重新汇总一次，两次之间只贴缓存的图像
+    HUD_INTERVAL = 0.25
+
+    def __init__(self, history=300):
+        self.enabled = False
+        self.show_hud = False
+        self.frames = deque(maxlen=history)  # 最近帧的环形缓冲区
+        self.frame_index = 0
+
+        # 启动阶段耗时 [(名称, 秒)]，与是否开启统计无关，总是记录
+        self.startup = []
+        self.time_to_first_frame = None
+
+        # 当前帧的累计数据
+        self._sections = {}
+        self._counters = {}
+        self._frame_start = None
+
+        # 仪表值: 名称 -> (最新值, 单位)，由其他子系统定期设置(例如内存统计，见 game.memory)
+        self.gauges = {}
+
+        # 性能面板: 字体在第一次绘制时创建，半透明底色按尺寸缓存，
+        # 每行文字是一个 Label(见 game.ui)，文字改变时才重新渲染
+        self._font = None
+        self._hud_panel = None
+        self._hud_lines = []
+        self._hud_next = 0.0
+
+    def enable(self, enabled=True):
+        """开启或关闭性能统计"""
+        self.enabled = enabled
+        if not enabled:
+            self._frame_start = None
+            self._sections = {}
+            self._counters = {}
+
+    def section(self, name):
+        """返回一个计时区段，用法: with profiler.section("update"): ..."""
+        if not self.enabled:
+            return _NULL_SECTION
+        return _Section(self.add_time, name)
+
+    def stage(self, name):
+        """返回一个启动阶段计时区段，用法: with profiler.stage("pygame.init"): ..."""
+        return _Section(self.record_stage, name)
+
+    def record_stage(self, name, seconds):
+        """记录一个启动阶段的耗时"""
+        self.startup.append((name, seconds))
+
+    def startup_report(self):
+        """启动阶段耗时的单行文本，单位毫秒"""
+        parts = [f"{name} {seconds * 1000.0:.1f}ms" for name, seconds in self.startup]
+        if self.time_to_first_frame is not None:
+            parts.append(f"首帧 {self.time_to_first_frame * 1000.0:.1f}ms")
+        return ", ".join(parts)
+
+    def add_time(self, name, seconds):
+        """把一段耗时累加到当前帧"""
+        if self.enabled:
+            self._sections[name] = self._sections.get(name, 0.0) + seconds
+
+    def count(self, name, value=1):
+        """累加一个计数器"""
+        if self.enabled:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name, value, unit=""):
+        """设置一个仪表的最新值，显示在性能面板中并随JSON导出，与是否开启统计无关"""
+        self.gauges[name] = (value, unit)
+
+    def begin_frame(self):
+        """开始新的一帧"""
+        if self.enabled:
+            self._frame_start = time.perf_counter()
+
+    def end_frame(self):
+        """结束当前帧，把统计结果写入环形缓冲区"""
+        if not self.enabled or self._frame_start is None:
+            return
+        total = time.perf_counter() - self._frame_start
+        self.frames.append({
+            "frame": self.frame_index,
+            "total": total,
+            "sections": self._sections,
+            "counters": self._counters,
+        })
+        self.frame_index += 1
+        self._sections = {}
+        self._counters = {}
+        self._frame_start = None
+
+    def summary(self):
+        """
+        汇总环形缓冲区中的帧
+
+        Returns:
+            summary: 字典，包含帧数、平均/最大帧时间(毫秒)、各区段平均耗时(毫秒)和各计数器的每帧平均值
+        """
+        frames = list(self.frames)
+        if not frames:
+            return {"frames": 0, "avg_ms": 0.0, "max_ms": 0.0, "sections": {}, "counters": {}}
+
+        n = len(frames)
+        sections = {}
+        counters = {}
+        for frame in frames:
+            for name, seconds in frame["sections"].items():
+                sections[name] = sections.get(name, 0.0) + seconds
+            for name, value in frame["counters"].items():
+                counters[name] = counters.get(name, 0) + value
+
+        totals = [frame["total"] for frame in frames]
+        return {
+            "frames": n,
+            "avg_ms": sum(totals) / n * 1000.0,
+            "max_ms": max(totals) * 1000.0,
+            "sections": {name: value / n * 1000.0 for name, value in sections.items()},
+            "counters": {name: value / n for name, value in counters.items()},
+        }
+
+    def _columns(self):
+        """导出时使用的区段名和计数器名(按首次出现排序)"""
+        section_names = []
+        counter_names = []
+        for frame in self.frames:
+            for name in frame["sections"]:
+                if name not in section_names:
+                    section_names.append(name)
+            for name in frame["counters"]:
+                if name not in counter_names:
+                    counter_names.append(name)
+        return section_names, counter_names
+
+    def export_csv(self, path):
+        """把环形缓冲区导出为CSV，每帧一行，耗时单位为毫秒"""
+        section_names, counter_names = self._columns()
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["frame", "total_ms"] + [f"{name}_ms" for name in section_names] + counter_names)
+            for frame in self.frames:
+                row = [frame["frame"], round(frame["total"] * 1000.0, 4)]
+                row += [round(frame["sections"].get(name, 0.0) * 1000.0, 4) for name in section_names]
+                row += [frame["counters"].get(name, 0) for name in counter_names]
+                writer.writerow(row)
+        logger.info("性能数据已导出: %s (%d 帧)", path, len(self.frames))
+
+    def export_json(self, path):
+        """把环形缓冲区和汇总数据导出为JSON"""
+        data = {
+            "summary": self.summary(),
+            "startup": {
+                "stages_ms": {name: seconds * 1000.0 for name, seconds in self.startup},
+                "time_to_first_frame_ms": None if self.time_to_first_frame is None
+                else self.time_to_first_frame * 1000.0,
+            },
+            "gauges": {name: {"value": value, "unit": unit} for name, (value, unit) in self.gauges.items()},
+            "frames": list(self.frames),
+        }
+        with open(path, "w") as f:
+            json.dump(data, f, indent=1)
+        logger.info("性能数据已导出: %s (%d 帧)", path, len(self.frames))
+
+    def export(self, path):
+        """根据扩展名选择导出格式(.csv 或 .json)"""
+        if path.lower().endswith(".csv"):
+            self.export_csv(path)
+        else:
+            self.export_json(path)
+
+    def toggle_hud(self):
+        """切换屏幕上的性能面板，打开面板时自动开启统计"""
+        self.show_hud = not self.show_hud
+        self._hud_next = 0.0   # 打开面板时立即显示最新的统计
+        if self.show_hud and not self.enabled:
+            self.enable(True)
+
+    def draw_hud(self, screen):
+        """在屏幕左下角绘制性能面板(统计数据每 HUD_INTERVAL 秒更新一次)"""
+        if self._font is None:
+            self._font = pygame.font.Font(pygame.font.get_default_font(), 12)
+
+        now = time.perf_counter()
+        if now >= self._hud_next:
+            self._hud_next = now + self.HUD_INTERVAL
+            self._set_hud_lines(self._hud_text())
+
+        line_height = self._font.get_linesize()
+        size = (300, line_height * len(self._hud_lines) + 8)
+        if self._hud_panel is None or self._hud_panel.get_size() != size:
+            self._hud_panel = pygame.Surface(size, pygame.SRCALPHA)
+            self._hud_panel.fill((0, 0, 0, 160))
+        top = screen.get_height() - size[1] - 10
+        screen.blit(self._hud_panel, (10, top))
+        for i, label in enumerate(self._hud_lines):
+            screen.blit(label.surface, (14, top + 4 + i * line_height))
+
+    def _set_hud_lines(self, lines):
+        """更新面板各行的文字，只有改变的行重新渲染"""
+        # 只在绘制面板时才需要界面层，profiler 本身不依赖 game.ui
+        from .ui import Label
+
+        font = self._font
+        del self._hud_lines[len(lines):]
+        while len(self._hud_lines) < len(lines):
+            self._hud_lines.append(Label(lambda text: font.render(text, True, (255, 255, 255)), (0, 0)))
+        for label, line in zip(self._hud_lines, lines):
+            label.set(line)
+
+    def _hud_text(self):
+        """性能面板各行的文字"""
+        stats = self.summary()
+        lines = [f"frame {stats['avg_ms']:.2f} ms avg / {stats['max_ms']:.2f} ms max ({stats['frames']} frames)"]
+        if self.time_to_first_frame is not None:
+            lines.append(f"first frame: {self.time_to_first_frame * 1000.0:.1f} ms")
+        for name, ms in sorted(stats["sections"].items()):
+            lines.append(f"{name}: {ms:.3f} ms")
+        for name, value in sorted(stats["counters"].items()):
+            lines.append(f"{name}: {value:.1f}/frame")
+        for name, (value, unit) in sorted(self.gauges.items()):
+            lines.append(f"{name}: {value:.2f} {unit}")
+        return lines
+
+
+# 全局性能统计实例，默认关闭
+profiler = Profiler()
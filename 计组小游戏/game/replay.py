@@ -0,0 +1,177 @@
+import logging
+import os
+import struct
+import tempfile
+
+import pygame
+
+from .game_manager import GameManager
+from .profiler import profiler
+
+logger = logging.getLogger(__name__)
+
+# 文件头: 魔数、格式版本、随机种子、屏幕宽高
+HEADER = struct.Struct("<4sBQHH")
+MAGIC = b"CDRP"
+VERSION = 2
+
+# 记录类型
+RECORD_FRAMES = 0       # 连续若干帧使用相同的帧间隔: (类型, 帧数, 帧间隔毫秒)
+RECORD_EVENT = 1        # 一个输入事件: (类型, 模拟时间毫秒, 事件种类, 按键, x, y, 鼠标按钮)
+RECORD_FRAME_BLOCK = 2  # 若干帧各自的帧间隔: (类型, 帧数) 后跟每帧一个字节的毫秒数
+FRAMES = struct.Struct("<BHH")
+EVENT = struct.Struct("<BIBIhhB")  # SDL2的方向键和功能键键码超过16位
+FRAME_BLOCK = struct.Struct("<BH")
+
+# 录制的事件种类
+EVENT_KINDS = {
+    pygame.KEYDOWN: 1,
+    pygame.KEYUP: 2,
+    pygame.MOUSEMOTION: 3,
+    pygame.MOUSEBUTTONDOWN: 4,
+    pygame.MOUSEBUTTONUP: 5,
+}
+EVENT_TYPES = {kind: event_type for event_type, kind in EVENT_KINDS.items()}
+
+
+class InputRecorder:
+    """
+    输入录制器
+
+    把随机种子、输入事件和每帧的时间间隔写入紧凑的二进制文件。
+    每帧的时间间隔占一个字节，全部相同的一段帧合并为一条记录。
+    """
+
+    def __init__(self, path, seed, screen_size):
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, seed, *screen_size))
+        self.sim_time_ms = 0  # 模拟时间(毫秒)
+
+        # 尚未写入的帧间隔
+        self._pending = bytearray()
+
+    def record_event(self, event):
+        """记录一个输入事件，不需要回放的事件类型会被忽略"""
+        kind = EVENT_KINDS.get(event.type)
+        if kind is None:
+            return
+        self._flush_frames()
+
+        key = getattr(event, "key", 0)
+        x, y = getattr(event, "pos", (0, 0))
+        button = getattr(event, "button", 0)
+        self.file.write(EVENT.pack(RECORD_EVENT, self.sim_time_ms, kind, key, x, y, button))
+
+    def record_frame(self, dt_ms):
+        """记录一帧的时间间隔(毫秒)"""
+        self.sim_time_ms += dt_ms
+        if dt_ms > 0xFF:
+            # 超过一个字节的长帧单独记录
+            self._flush_frames()
+            self.file.write(FRAMES.pack(RECORD_FRAMES, 1, dt_ms))
+            return
+        self._pending.append(dt_ms)
+        if len(self._pending) == 0xFFFF:
+            self._flush_frames()
+
+    def _flush_frames(self):
+        pending = self._pending
+        if not pending:
+            return
+        if pending.count(pending[0]) == len(pending):
+            self.file.write(FRAMES.pack(RECORD_FRAMES, len(pending), pending[0]))
+        else:
+            self.file.write(FRAME_BLOCK.pack(RECORD_FRAME_BLOCK, len(pending)))
+            self.file.write(pending)
+        self._pending = bytearray()
+
+    def close(self):
+        """写入剩余数据并关闭文件"""
+        self._flush_frames()
+        self.file.close()
+        logger.info("输入录制完成，模拟时长 %.1f 秒", self.sim_time_ms / 1000.0)
+
+
+def read_recording(path):
+    """
+    读取录制文件
+
+    Returns:
+        (header, records): header 为 (种子, 屏幕宽, 屏幕高)；
+        records 为生成器，依次产生 ("frames", 帧间隔毫秒列表) 或 ("event", pygame事件)
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    magic, version, seed, width, height = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"不是有效的录制文件: {path}")
+
+    def records():
+        offset = HEADER.size
+        while offset < len(data):
+            record_type = data[offset]
+            if record_type == RECORD_FRAMES:
+                _, count, dt_ms = FRAMES.unpack_from(data, offset)
+                offset += FRAMES.size
+                yield "frames", [dt_ms] * count
+            elif record_type == RECORD_FRAME_BLOCK:
+                _, count = FRAME_BLOCK.unpack_from(data, offset)
+                offset += FRAME_BLOCK.size
+                yield "frames", data[offset:offset + count]
+                offset += count
+            elif record_type == RECORD_EVENT:
+                _, _, kind, key, x, y, button = EVENT.unpack_from(data, offset)
+                offset += EVENT.size
+                yield "event", _make_event(kind, key, x, y, button)
+            else:
+                raise ValueError(f"录制文件损坏，偏移 {offset} 处的记录类型未知")
+
+    return (seed, width, height), records()
+
+
+def _make_event(kind, key, x, y, button):
+    """根据录制数据重建pygame事件"""
+    event_type = EVENT_TYPES[kind]
+    if event_type in (pygame.KEYDOWN, pygame.KEYUP):
+        return pygame.event.Event(event_type, key=key, mod=0, unicode="", scancode=0)
+    if event_type == pygame.MOUSEMOTION:
+        return pygame.event.Event(event_type, pos=(x, y), rel=(0, 0), buttons=(0, 0, 0))
+    return pygame.event.Event(event_type, pos=(x, y), button=button)
+
+
+def replay(path, telemetry=None, memory=None, archive=None):
+    """
+    以最快速度回放录制文件
+
+    不创建窗口、不渲染、不等待真实时间，把录制的事件依次交给
+    GameManager.handle_event，并用录制的帧间隔驱动 GameManager.update。
+    开启profiler时每一帧都会记录到性能统计中，传入telemetry时记录遥测事件，
+    传入memory(MemoryAccountant)时按它的设置统计内存，archive 为归档已完成包裹的CSV文件。
+    F5/F9 快速存档和读档使用回放自己的临时文件，不读写玩家的快速存档。
+
+    Returns:
+        game_manager: 回放结束时的游戏管理器
+    """
+    (seed, width, height), records = read_recording(path)
+    pygame.font.init()
+    game_manager = GameManager(pygame.Surface((width, height)), seed=seed, telemetry=telemetry,
+                               memory=memory, archive=archive)
+
+    frames = 0
+    with tempfile.TemporaryDirectory() as directory:
+        game_manager.quicksave_path = os.path.join(directory, "quicksave.snap")
+        for record in records:
+            if record[0] == "event":
+                game_manager.handle_event(record[1])
+                continue
+
+            for dt_ms in record[1]:
+                profiler.begin_frame()
+                with profiler.section("update"):
+                    game_manager.update(dt_ms / 1000.0)
+                profiler.end_frame()
+            frames += len(record[1])
+
+    logger.info("回放完成: %d 帧", frames)
+    return game_manager
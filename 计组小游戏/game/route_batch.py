@@ -0,0 +1,315 @@
+"""
+批量多对多路线查询
+
+把 (起点, 终点) 对按起点分组，每个起点只做一次多目标Dijkstra搜索(所有目标都确定后停止)，
+各组可以在进程池中并行执行。地图成本数组放在共享内存中，工作进程只在启动时读取一次，
+每个任务只传递起点和目标的下标。
+
+用法:
+    with RouteBatch(game_map, workers=4) as batch:
+        result = batch.query(pairs, paths=True)
+    result.distances      # 与pairs对应的路线成本，不可达为inf
+    result.matrix         # (起点数, 终点数) 的成本矩阵，未查询的组合为nan
+    result.paths          # 与pairs对应的路径列表(paths=True时)
+
+成本模型与 AStar 相同，得到的成本与 find_path 的最优路径成本一致。
+RouteBatch(queue="bucket") 使用整数成本的桶队列(见 game.search_grid)，成本除以 SCALE 后返回。
+"""
+import heapq
+import logging
+import os
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+
+from . import search_grid
+
+logger = logging.getLogger(__name__)
+
+
+def multi_target_search(costs, neighbors, source, targets, want_parents=False, queue="heapq"):
+    """
+    从source出发的Dijkstra搜索，所有targets都确定最短距离后停止
+
+    Args:
+        costs: 扁平网格的成本列表(见 search_grid.grid_layout)
+        neighbors: 8个方向的 (下标偏移, 步长系数)
+        source: 起点下标
+        targets: 目标下标的集合
+        want_parents: 是否返回父节点表用于重建路径
+        queue: 优先队列，"heapq" 或 "bucket"
+
+    Returns:
+        (distances, parents): distances 为 {目标下标: 成本}(不可达的目标不在其中)，
+        parents 为每个下标的父节点下标列表(起点为-1)或 None
+    """
+    if search_grid.check_queue(queue) == "bucket":
+        moves = [(offset, search_grid.scale_costs(np.asarray(costs) * step)) for offset, step in neighbors]
+        return _multi_target_bucket(moves, source, targets, want_parents)
+    remaining = set(targets)
+    inf = float("inf")
+    dist = [inf] * len(costs)
+    dist[source] = 0.0
+    parents = [-1] * len(costs) if want_parents else None
+    done = bytearray(len(costs))
+    heap = [(0.0, source)]
+    found = {}
+    pop, push = heapq.heappop, heapq.heappush
+    while heap and remaining:
+        d, current = pop(heap)
+        if done[current]:
+            continue
+        done[current] = 1
+        if current in remaining:
+            remaining.discard(current)
+            found[current] = d
+        for offset, step in neighbors:
+            neighbor = current + offset
+            cost = costs[neighbor]
+            if cost < 0 or done[neighbor]:
+                continue
+            nd = d + step * cost
+            if nd < dist[neighbor]:
+                dist[neighbor] = nd
+                if want_parents:
+                    parents[neighbor] = current
+                push(heap, (nd, neighbor))
+    return found, parents
+
+
+def _multi_target_bucket(moves, source, targets, want_parents=False):
+    """
+    multi_target_search 的桶队列版本
+
+    Args:
+        moves: 8个方向的 (下标偏移, 整数成本表)，见 search_grid.integer_move_layout
+    """
+    remaining = set(targets)
+    size = len(moves[0][1])
+    dist = [-1] * size
+    dist[source] = 0
+    parents = [-1] * size if want_parents else None
+    done = bytearray(size)
+    buckets = {0: [source]}
+    keys = []
+    key, bucket = 0, buckets[0]
+    found = {}
+    pop, push = heapq.heappop, heapq.heappush
+    scale = search_grid.SCALE
+    while remaining:
+        while not bucket:
+            del buckets[key]
+            if not keys:
+                return found, parents
+            key = pop(keys)
+            bucket = buckets[key]
+        current = bucket.pop()
+        if done[current]:
+            continue
+        done[current] = 1
+        if current in remaining:
+            remaining.discard(current)
+            found[current] = key / scale
+        for offset, move_costs in moves:
+            neighbor = current + offset
+            cost = move_costs[neighbor]
+            if cost < 0 or done[neighbor]:
+                continue
+            nd = key + cost
+            if dist[neighbor] < 0 or nd < dist[neighbor]:
+                dist[neighbor] = nd
+                if want_parents:
+                    parents[neighbor] = current
+                entries = buckets.get(nd)
+                if entries is None:
+                    buckets[nd] = [neighbor]
+                    push(keys, nd)
+                else:
+                    entries.append(neighbor)
+    return found, parents
+
+
+def _trace(parents, target, stride):
+    """根据父节点表重建到target的路径，返回网格坐标列表"""
+    path = []
+    while target != -1:
+        y, x = divmod(target, stride)
+        path.append((x - 1, y - 1))
+        target = parents[target]
+    path.reverse()
+    return path
+
+
+def _run_group(costs, neighbors, stride, queue, source, targets, want_paths):
+    """
+    执行一个起点的查询，返回 (起点, {目标: 成本}, {目标: 路径} 或 None)
+
+    queue为"bucket"时neighbors为8个方向的 (下标偏移, 整数成本表)，否则为 (下标偏移, 步长系数)
+    """
+    if queue == "bucket":
+        found, parents = _multi_target_bucket(neighbors, source, targets, want_paths)
+    else:
+        found, parents = multi_target_search(costs, neighbors, source, targets, want_paths)
+    paths = {target: _trace(parents, target, stride) for target in found} if want_paths else None
+    return source, found, paths
+
+
+# 工作进程中的地图数据，由 _init_worker 设置
+_worker = {}
+
+
+def _init_worker(shm_name, shape, queue="heapq"):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    stride = shape[1]
+    costs = np.ndarray(shape, dtype=np.float64, buffer=shm.buf).ravel()
+    neighbors = search_grid.neighbor_offsets(stride)
+    if queue == "bucket":
+        neighbors = [(offset, search_grid.scale_costs(costs * step)) for offset, step in neighbors]
+    _worker["costs"] = costs.tolist()
+    _worker["neighbors"] = neighbors
+    _worker["stride"] = stride
+    _worker["queue"] = queue
+    shm.close()
+
+
+def _worker_group(task):
+    source, targets, want_paths = task
+    return _run_group(_worker["costs"], _worker["neighbors"], _worker["stride"], _worker["queue"],
+                      source, targets, want_paths)
+
+
+class BatchResult:
+    """批量查询的结果"""
+
+    def __init__(self, pairs, sources, targets, matrix, distances, paths):
+        self.pairs = pairs
+        self.sources = sources        # 去重后的起点，矩阵的行
+        self.targets = targets        # 去重后的终点，矩阵的列
+        self.matrix = matrix
+        self.distances = distances
+        self.paths = paths
+
+    def distance(self, source, target):
+        """查询一对起终点的成本"""
+        return float(self.matrix[self.sources.index(source), self.targets.index(target)])
+
+
+class RouteBatch:
+    """
+    批量路线查询器
+
+    Args:
+        game_map: 地图
+        workers: 进程数，0表示在当前进程中执行，None表示使用全部CPU
+        min_parallel_groups: 起点分组少于该数量时不使用进程池
+        queue: 优先队列，"heapq" 或 "bucket"
+    """
+
+    def __init__(self, game_map, workers=None, min_parallel_groups=8, queue="heapq"):
+        self.map = game_map
+        self.workers = os.cpu_count() if workers is None else workers
+        self.min_parallel_groups = min_parallel_groups
+        self.queue = search_grid.check_queue(queue)
+        self._pool = None
+        self._shm = None
+        self._pool_version = None
+
+    def _ensure_pool(self):
+        """启动进程池，地图改变后用新的共享内存重新启动"""
+        if self._pool is not None and self._pool_version == self.map.version:
+            return self._pool
+        self._close_pool()
+        costs = search_grid.padded_costs(self.map)
+        self._shm = shared_memory.SharedMemory(create=True, size=costs.nbytes)
+        np.ndarray(costs.shape, dtype=np.float64, buffer=self._shm.buf)[:] = costs
+        self._pool = get_context().Pool(self.workers, initializer=_init_worker,
+                                        initargs=(self._shm.name, costs.shape, self.queue))
+        self._pool_version = self.map.version
+        logger.debug("路线查询进程池已启动: %d 个进程", self.workers)
+        return self._pool
+
+    def query(self, pairs, paths=False):
+        """
+        查询多对起终点的最短路线成本
+
+        Args:
+            pairs: [(起点, 终点), ...]，坐标为网格坐标 (x, y)
+            paths: 是否同时返回路径
+
+        Returns:
+            BatchResult
+        """
+        pairs = [(tuple(source), tuple(target)) for source, target in pairs]
+        stride, costs, neighbors = search_grid.grid_layout(self.map)
+        if self.queue == "bucket":
+            neighbors = search_grid.integer_move_layout(self.map)[1]
+        width, height = self.map.width, self.map.height
+
+        def index(point):
+            x, y = int(point[0]), int(point[1])
+            if 0 <= x < width and 0 <= y < height:
+                return (y + 1) * stride + x + 1
+            return None
+
+        # 按起点分组，同一起点的所有终点只搜索一次
+        groups = {}
+        for source, target in pairs:
+            s, t = index(source), index(target)
+            if s is not None and t is not None and costs[t] >= 0:
+                groups.setdefault(s, set()).add(t)
+        tasks = [(source, targets, paths) for source, targets in groups.items()]
+
+        if self.workers > 0 and len(tasks) >= self.min_parallel_groups:
+            pool = self._ensure_pool()
+            chunksize = max(1, len(tasks) // (self.workers * 4))
+            results = pool.imap_unordered(_worker_group, tasks, chunksize)
+        else:
+            results = (_run_group(costs, neighbors, stride, self.queue, *task) for task in tasks)
+
+        found = {}
+        found_paths = {}
+        for source, distances, group_paths in results:
+            found[source] = distances
+            if paths:
+                found_paths[source] = group_paths
+
+        sources = list(dict.fromkeys(source for source, _ in pairs))
+        targets = list(dict.fromkeys(target for _, target in pairs))
+        row = {point: i for i, point in enumerate(sources)}
+        column = {point: i for i, point in enumerate(targets)}
+        matrix = np.full((len(sources), len(targets)), np.nan)
+        distances = np.empty(len(pairs))
+        path_list = [] if paths else None
+        for i, (source, target) in enumerate(pairs):
+            s, t = index(source), index(target)
+            cost = found.get(s, {}).get(t, float("inf"))
+            distances[i] = matrix[row[source], column[target]] = cost
+            if paths:
+                path_list.append(found_paths.get(s, {}).get(t, []))
+        return BatchResult(pairs, sources, targets, matrix, distances, path_list)
+
+    def _close_pool(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def close(self):
+        """关闭进程池并释放共享内存"""
+        self._close_pool()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def batch_routes(game_map, pairs, paths=False, workers=0, queue="heapq"):
+    """一次性的批量查询，默认在当前进程中执行"""
+    with RouteBatch(game_map, workers, queue=queue) as batch:
+        return batch.query(pairs, paths)
@@ -0,0 +1,215 @@
+"""
+搜索使用的网格布局、成本表和优先队列
+
+A*搜索(game.pathfinding)、批量路线查询(game.route_batch)、快递站分区(game.depots)
+和随时间变化的路线查询(game.time_routing)都在加了一圈不可通行边界的扁平网格上搜索，
+这里的布局和成本表按地图版本缓存在地图的派生图层中，共享同一地图的搜索共用。
+
+搜索的优先队列可以是 heapq(浮点成本)或桶队列("bucket")。桶队列使用乘以 SCALE 的整数成本
+(直线一步500，对角线一步707，都是精确值)，f值相同的节点放在同一个桶(列表)中，
+堆中只保存不同的f值。整数成本下相同f值的节点很多，入队大多只是列表追加，
+比每次都对 (f值, 节点) 元组做堆操作快得多。
+"""
+import heapq
+
+import numpy as np
+
+# 对角线移动的成本系数，必须与 AStar 搜索使用的值一致
+DIAGONAL = 1.414
+
+# 桶队列使用的整数成本比例: 500 * 1.414 = 707，直线和对角线的步长都是整数
+SCALE = 500
+
+# 可选的优先队列
+QUEUES = ("heapq", "bucket")
+
+
+def check_queue(name):
+    """检查优先队列名称"""
+    if name not in QUEUES:
+        raise ValueError(f"未知的优先队列: {name}，可选: {', '.join(QUEUES)}")
+    return name
+
+
+def scale_costs(table):
+    """浮点成本表(不可通行为负数)乘以 SCALE 并取整，不可通行为-1"""
+    table = np.asarray(table, dtype=np.float64)
+    return np.where(table >= 0, np.rint(table * SCALE), -1).astype(np.int64).tolist()
+
+
+def grid_layout(game_map):
+    """
+    搜索使用的扁平网格布局，按地图版本缓存
+
+    地图四周加一圈不可通行的格子，格子 (x, y) 的下标为 (y + 1) * stride + x + 1，
+    这样相邻格子的下标只差固定的偏移量，也省去了边界检查。
+
+    Returns:
+        (stride, costs, neighbors): costs 为每个下标的地形成本列表(不可通行为-1)，
+        neighbors 为8个方向的 (下标偏移, 步长系数)，顺序为上、右、下、左、右上、右下、左下、左上
+    """
+    def build():
+        stride = game_map.width + 2
+        return stride, padded_costs(game_map).ravel().tolist(), neighbor_offsets(stride)
+    return game_map.get_layer("search_layout", build)
+
+
+def padded_costs(game_map):
+    """四周加一圈不可通行格子的成本数组 (height + 2, width + 2)"""
+    padded = np.full((game_map.height + 2, game_map.width + 2), -1.0)
+    padded[1:-1, 1:-1] = game_map.get_cost_grid()
+    return padded
+
+
+# 8个方向的 (dx, dy)，顺序与 neighbor_offsets 相同
+DIRECTIONS = [(0, -1), (1, 0), (0, 1), (-1, 0), (1, -1), (1, 1), (-1, 1), (-1, -1)]
+
+
+def neighbor_offsets(stride):
+    """8个方向的 (扁平下标偏移, 步长系数)"""
+    return [(dx + dy * stride, DIAGONAL if dx and dy else 1.0) for dx, dy in DIRECTIONS]
+
+
+def move_layout(game_map, radius=0):
+    """
+    A*搜索使用的移动成本表，按地图版本和个体半径缓存
+    
+    radius > 0 时，中心净空距离(见 Map.get_clearance)不大于radius的格子不可通行，
+    对角移动要求两侧的格子都可通行(不切角)。这些限制都预先计算在成本表中，
+    搜索时不需要检查邻域。
+    
+    Returns:
+        (stride, costs, moves, reverse_moves):
+        costs 为每个下标的地形成本列表(对该半径不可通行为-1)；
+        moves 为8个方向的 (下标偏移, 成本表)，成本表[t] 为沿该方向进入t的成本(已乘步长系数)，不允许时为-1；
+        reverse_moves 与moves的偏移相同，成本表为相反方向的成本表，供反向搜索使用
+    """
+    def build():
+        stride = game_map.width + 2
+        padded = padded_costs(game_map)
+        if radius > 0:
+            padded[1:-1, 1:-1][game_map.get_clearance() <= radius] = -1.0
+        flat = padded.ravel()
+        passable = flat >= 0
+        tables = []
+        for (dx, dy), (offset, step) in zip(DIRECTIONS, neighbor_offsets(stride)):
+            allowed = passable
+            if radius > 0 and dx and dy:
+                # 两侧格子 (x - dx, y) 和 (x, y - dy)；边界格子不可通行，np.roll 的回绕不影响结果
+                allowed = passable & np.roll(passable, dx) & np.roll(passable, dy * stride)
+            tables.append((offset, np.where(allowed, step * flat, -1.0).tolist()))
+        reverse = {offset: table for offset, table in tables}
+        reverse_moves = [(offset, reverse[-offset]) for offset, _ in tables]
+        return stride, flat.tolist(), tables, reverse_moves
+    return game_map.get_layer(f"moves{radius}", build)
+
+
+def integer_move_layout(game_map, radius=0):
+    """
+    与 move_layout 相同，但成本表为乘以 SCALE 的整数(不允许的移动为-1)，供桶队列搜索使用
+
+    Returns:
+        (stride, moves, reverse_moves)
+    """
+    def build():
+        stride, _, moves, reverse_moves = move_layout(game_map, radius)
+        tables = {offset: scale_costs(table) for offset, table in moves}
+        return (stride, [(offset, tables[offset]) for offset, _ in moves],
+                [(offset, tables[-offset]) for offset, _ in moves])
+    return game_map.get_layer(f"int_moves{radius}", build)
+
+
+def distance_field(game_map, source, reverse=False, queue="heapq"):
+    """
+    从source出发的Dijkstra距离场，成本模型与A*搜索相同(进入格子的地形成本，对角线乘以1.414)
+
+    Args:
+        source: 网格坐标 (x, y)
+        reverse: 为False时计算 source 到各格子的距离，为True时计算各格子到 source 的距离
+                 (进入格子的成本使两个方向的距离不同)
+        queue: 优先队列，"heapq" 或 "bucket"
+
+    Returns:
+        field: float64数组 (height, width)，不可达为inf
+    """
+    if check_queue(queue) == "bucket":
+        return _distance_field_bucket(game_map, source, reverse)
+    stride, costs, offsets = grid_layout(game_map)
+    start = (source[1] + 1) * stride + source[0] + 1
+    inf = float("inf")
+    dist = [inf] * len(costs)
+    dist[start] = 0.0
+    heap = [(0.0, start)]
+    pop, push = heapq.heappop, heapq.heappush
+    while heap:
+        d, current = pop(heap)
+        if d > dist[current]:
+            continue
+        leave = costs[current]
+        for offset, step in offsets:
+            neighbor = current + offset
+            enter = costs[neighbor]
+            if enter < 0:
+                continue
+            nd = d + step * (leave if reverse else enter)
+            if nd < dist[neighbor]:
+                dist[neighbor] = nd
+                push(heap, (nd, neighbor))
+    return np.array(dist).reshape(game_map.height + 2, stride)[1:-1, 1:-1]
+
+
+def _distance_field_bucket(game_map, source, reverse=False):
+    """distance_field 的桶队列版本，整数距离除以 SCALE 后返回"""
+    stride, moves, reverse_moves = integer_move_layout(game_map)
+    costs = grid_layout(game_map)[1]
+    start = (source[1] + 1) * stride + source[0] + 1
+    unreached = -1
+    dist = [unreached] * len(costs)
+    dist[start] = 0
+    buckets = {0: [start]}
+    keys = []
+    key, bucket = 0, buckets[0]
+    pop, push = heapq.heappop, heapq.heappush
+    while True:
+        while not bucket:
+            del buckets[key]
+            if not keys:
+                field = np.array(dist, dtype=np.float64) / SCALE
+                field[field < 0] = np.inf
+                return field.reshape(game_map.height + 2, stride)[1:-1, 1:-1]
+            key = pop(keys)
+            bucket = buckets[key]
+        current = bucket.pop()
+        if dist[current] != key:
+            continue  # 旧条目
+        if reverse:
+            # 反向边 neighbor -> current 的成本是进入current的成本(按相反方向的成本表查current)
+            for offset, move_costs in reverse_moves:
+                neighbor = current + offset
+                cost = move_costs[current]
+                if cost < 0 or costs[neighbor] < 0:
+                    continue
+                nd = key + cost
+                if dist[neighbor] < 0 or nd < dist[neighbor]:
+                    dist[neighbor] = nd
+                    entries = buckets.get(nd)
+                    if entries is None:
+                        buckets[nd] = [neighbor]
+                        push(keys, nd)
+                    else:
+                        entries.append(neighbor)
+        else:
+            for offset, move_costs in moves:
+                neighbor = current + offset
+                cost = move_costs[neighbor]
+                if cost < 0:
+                    continue
+                nd = key + cost
+                if dist[neighbor] < 0 or nd < dist[neighbor]:
+                    dist[neighbor] = nd
+                    entries = buckets.get(nd)
+                    if entries is None:
+                        buckets[nd] = [neighbor]
+                        push(keys, nd)
+                    else:
+                        entries.append(neighbor)
@@ -0,0 +1,427 @@
+"""
+多会话模拟服务器
+
+在一个进程中托管大量无界面的游戏会话，通过本地TCP连接由外部机器人驱动。
+协议为每行一个紧凑JSON消息:
+
+客户端 -> 服务器
+    {"op": "create", "n": 10, "map": "default", "seed": 1, "rate": 60, "speed": 1.0}
+    {"op": "act", "seq": 7, "a": [[sid, "move", dx, dy], [sid, "goto", x, y], [sid, "auto"]]}
+    {"op": "reset", "ids": [...]} / {"op": "close", "ids": [...]} / {"op": "stats"}
+
+服务器 -> 客户端
+    {"t": "created", "ids": [...]}
+    {"t": "ack", "seq": 7}
+    {"t": "d", "d": {sid: {只包含变化字段的状态}}}    # 每个服务器节拍最多一条
+    {"t": "stats", ...}
+    {"t": "error", "seq": 7, "message": "..."}         # 无法处理的消息，连接保持打开
+
+一条消息中的动作先全部检查，有任何一个无效时整条消息都不生效。act、reset 和 close
+只能操作本连接创建的会话，其他会话ID按无效消息处理。客户端读取太慢
+(连接的发送缓冲超过 max_write_buffer)时暂停发送状态增量，恢复后发送累积的变化。
+
+使用相同地图的会话共享同一个只读 Map 对象和同一个 AStar(包括其路径缓存)。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+
+from .map import Map
+from .pathfinding import AStar
+from .player import Player
+from .package_manager import PackageManager
+from .event_bus import EventBus, DEPOT_REACHED, PACKAGE_DELIVERED, PACKAGE_EXPIRED
+
+logger = logging.getLogger(__name__)
+
+# 紧凑JSON编码
+_encode = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False).encode
+
+# 动作 -> 参数个数
+ACTION_ARITY = {"move": 2, "goto": 2, "auto": 0}
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+class SharedMap:
+    """按名称共享的地图和寻路器，会话之间只读共享"""
+
+    def __init__(self, game_map):
+        self.map = game_map
+        self.pathfinder = AStar(game_map)
+        self.pathfinder.any_angle = True
+        self.sessions = 0
+
+
+class Session:
+    """
+    一个无界面的游戏会话
+
+    与 GameManager 的游戏逻辑相同(玩家移动、包裹拾取配送、完成检测和时间流逝)，
+    但不包含界面和渲染，并且使用共享的地图和寻路器。
+    """
+
+    def __init__(self, session_id, shared, seed, rate, speed):
+        self.id = session_id
+        self.shared = shared
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.rate = rate            # 每秒模拟帧数
+        self.speed = speed          # 模拟时间与真实时间之比
+        self.dt = 1.0 / rate
+
+        self.bus = EventBus()
+        self.player = Player(shared.map, self.bus)
+        self.player.set_pathfinder(shared.pathfinder)
+        self.package_manager = PackageManager(shared.map, rng=self.rng, pathfinder=shared.pathfinder, bus=self.bus)
+        for topic in (DEPOT_REACHED, PACKAGE_DELIVERED, PACKAGE_EXPIRED):
+            self.bus.subscribe(topic, self._request_completion_check)
+        self.reset()
+
+    def _request_completion_check(self, **event):
+        self._completion_pending = True
+
+    def reset(self):
+        """开始新的一天"""
+        self.score = 0
+        self.time = 480
+        self.game_state = "GAMEPLAY"
+        self.game_completed = False
+        self._completion_pending = False
+        self.player.reset()
+        self.package_manager.generate_packages()
+        self.ticks = 0
+        self.started = time.perf_counter()
+        self._last_sent = {}
+
+    def due_ticks(self, now):
+        """按照会话自己的模拟速率，计算到now为止还需要模拟的帧数"""
+        target = int((now - self.started) * self.speed * self.rate)
+        return target - self.ticks
+
+    @staticmethod
+    def check_action(action):
+        """
+        检查一个动作的类型、参数个数和参数类型
+
+        Raises:
+            ValueError: 动作无效
+        """
+        if not isinstance(action, list) or not action or action[0] not in ACTION_ARITY:
+            raise ValueError(f"无效的动作: {action!r}")
+        kind, args = action[0], action[1:]
+        if len(args) != ACTION_ARITY[kind]:
+            raise ValueError(f"动作 {kind} 需要 {ACTION_ARITY[kind]} 个参数: {action!r}")
+        if kind == "goto":
+            valid = all(map(_is_int, args))
+        else:
+            valid = all(map(_is_number, args))
+        if not valid:
+            raise ValueError(f"动作 {kind} 的参数类型不正确: {action!r}")
+
+    def apply(self, action):
+        """
+        应用一个动作: ["move", dx, dy]、["goto", x, y](格子坐标，整数) 或 ["auto"]
+
+        Raises:
+            ValueError: 动作无效(见 check_action)
+        """
+        self.check_action(action)
+        kind = action[0]
+        player = self.player
+        if kind == "move":
+            dx, dy = action[1], action[2]
+            player.moving_left, player.moving_right = dx < 0, dx > 0
+            player.moving_up, player.moving_down = dy < 0, dy > 0
+            player.follow_path = False
+        elif kind == "goto":
+            current = self.shared.map.pixel_to_grid(player.x, player.y)
+            path = self.shared.pathfinder.find_path((int(current[0]), int(current[1])), (action[1], action[2]),
+                                                   radius=player.radius)
+            if path:
+                player.set_path(path)
+        elif kind == "auto":
+            player.plan_route()
+
+    def step(self):
+        """模拟一帧，与 GameManager.update 的游戏逻辑一致"""
+        self.ticks += 1
+        if self.game_state != "GAMEPLAY":
+            return
+
+        delta_time = self.dt
+        self.player.update(delta_time)
+        self.score += self.package_manager.update(delta_time, self.player, 480 - self.time)
+
+        # 只在包裹状态改变或回到快递站后检查是否提前完成
+        if self._completion_pending:
+            self._completion_pending = False
+            packages = self.package_manager
+            remaining = len(packages.active_packages) + sum(1 for p in packages.packages if p.status == "WAITING")
+            if remaining == 0 and not self.player.carrying_package and self.player.cell is not None and self.shared.map.is_depot(*self.player.cell):
+                self.game_state = "GAMEOVER"
+                self.game_completed = True
+                self.score += int(self.time)
+
+        self.time -= delta_time / 60.0
+        if self.time <= 0:
+            self.time = 0
+            self.game_state = "GAMEOVER"
+
+    def state(self):
+        """当前状态(字段名尽量短)"""
+        return {
+            "x": round(self.player.x, 1),
+            "y": round(self.player.y, 1),
+            "c": self.player.current_packages,
+            "s": self.score,
+            "t": int(self.time * 60),  # 游戏内秒
+            "g": self.game_state,
+            "dv": self.package_manager.delivered_count(),
+        }
+
+    def delta(self):
+        """与上次发送相比变化的字段，没有变化时返回None"""
+        state = self.state()
+        last = self._last_sent
+        changed = {key: value for key, value in state.items() if last.get(key) != value}
+        if not changed:
+            return None
+        self._last_sent = state
+        return changed
+
+
+class SimulationServer:
+    """托管多个会话的asyncio服务器"""
+
+    def __init__(self, host="127.0.0.1", port=8765, tick_interval=0.01, max_catchup=10,
+                 max_write_buffer=1 << 20):
+        self.host = host
+        self.port = port
+        self.tick_interval = tick_interval  # 服务器节拍间隔(秒)
+        self.max_catchup = max_catchup      # 每个节拍每个会话最多补帧数，防止过载时雪崩
+        self.max_write_buffer = max_write_buffer  # 连接的发送缓冲超过这么多字节时暂停发送状态增量
+
+        self.maps = {}        # 地图名 -> SharedMap
+        self.sessions = {}    # 会话ID -> Session
+        self.owners = {}      # 会话ID -> 连接(StreamWriter)
+        self._next_id = 1
+        self._server = None
+        self._ticker = None
+
+        # 统计数据
+        self.total_ticks = 0
+        self.skipped_deltas = 0   # 因客户端读取太慢而推迟发送的会话增量数
+        self.started = time.perf_counter()
+        self.cpu_started = time.process_time()
+
+    def get_map(self, name):
+        """按名称获取共享地图，名称为 "default" 或 "宽x高" """
+        shared = self.maps.get(name)
+        if shared is None:
+            if name == "default":
+                game_map = Map()
+            else:
+                width, height = (int(v) for v in name.split("x"))
+                game_map = Map(width, height)
+            shared = self.maps[name] = SharedMap(game_map)
+        return shared
+
+    def create_session(self, map_name="default", seed=None, rate=60, speed=1.0, owner=None):
+        """创建一个会话并返回其ID"""
+        shared = self.get_map(map_name)
+        session_id = self._next_id
+        self._next_id += 1
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        self.sessions[session_id] = Session(session_id, shared, seed, rate, speed)
+        shared.sessions += 1
+        if owner is not None:
+            self.owners[session_id] = owner
+        return session_id
+
+    def close_session(self, session_id):
+        session = self.sessions.pop(session_id, None)
+        self.owners.pop(session_id, None)
+        if session:
+            session.shared.sessions -= 1
+
+    def stats(self):
+        elapsed = time.perf_counter() - self.started
+        cpu = time.process_time() - self.cpu_started
+        return {
+            "t": "stats",
+            "sessions": len(self.sessions),
+            "maps": len(self.maps),
+            "ticks": self.total_ticks,
+            "ticks_per_s": self.total_ticks / elapsed if elapsed > 0 else 0.0,
+            "ticks_per_cpu_s": self.total_ticks / cpu if cpu > 0 else 0.0,
+            "skipped_deltas": self.skipped_deltas,
+        }
+
+    def _congested(self, writer):
+        """连接已关闭，或发送缓冲超过 max_write_buffer(客户端读取太慢)"""
+        return writer.is_closing() or writer.transport.get_write_buffer_size() > self.max_write_buffer
+
+    def tick(self):
+        """
+        推进所有到期的会话，并按连接汇总状态增量
+
+        发送缓冲已满的连接这一拍不取增量，会话的变化留到连接恢复后一起发送。
+        """
+        now = time.perf_counter()
+        outgoing = {}
+        congested = {}
+        total = 0
+        for session_id, session in self.sessions.items():
+            due = min(session.due_ticks(now), self.max_catchup)
+            if due <= 0:
+                continue
+            for _ in range(due):
+                session.step()
+            total += due
+
+            owner = self.owners.get(session_id)
+            if owner is not None:
+                if congested.setdefault(owner, self._congested(owner)):
+                    self.skipped_deltas += 1
+                    continue
+                delta = session.delta()
+                if delta:
+                    outgoing.setdefault(owner, {})[session_id] = delta
+        self.total_ticks += total
+
+        for writer, deltas in outgoing.items():
+            writer.write(_encode({"t": "d", "d": deltas}).encode() + b"\n")
+
+    async def _run_ticker(self):
+        while True:
+            started = time.perf_counter()
+            self.tick()
+            await asyncio.sleep(max(0.0, self.tick_interval - (time.perf_counter() - started)))
+
+    async def _handle_client(self, reader, writer):
+        owned = []
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = None
+                try:
+                    message = json.loads(line)
+                    if not isinstance(message, dict):
+                        raise ValueError("消息必须是JSON对象")
+                    reply = self._handle_message(message, writer, owned)
+                except Exception as exc:   # 一条无效的消息只回复错误，不影响连接上的其他会话
+                    logger.warning("无法处理的消息: %s", exc)
+                    seq = message.get("seq") if isinstance(message, dict) else None
+                    reply = {"t": "error", "seq": seq, "message": str(exc)}
+                if reply is not None:
+                    writer.write(_encode(reply).encode() + b"\n")
+                    await writer.drain()
+        except ConnectionError as exc:
+            logger.warning("客户端连接异常: %s", exc)
+        finally:
+            for session_id in owned:
+                self.close_session(session_id)
+            writer.close()
+
+    @staticmethod
+    def _owned_ids(ids, owned):
+        """
+        检查会话ID列表，只允许本连接创建的会话
+
+        Raises:
+            ValueError: 不是列表，或者包含不属于本连接的会话ID
+        """
+        if not isinstance(ids, list):
+            raise ValueError("ids 必须是会话ID列表")
+        for session_id in ids:
+            if not _is_int(session_id) or session_id not in owned:
+                raise ValueError(f"不属于本连接的会话: {session_id!r}")
+        return ids
+
+    def _handle_message(self, message, writer, owned):
+        op = message.get("op")
+        if op == "act":
+            actions = message.get("a", [])
+            if not isinstance(actions, list):
+                raise ValueError("a 必须是动作列表")
+            batch = []
+            for action in actions:
+                if not isinstance(action, list) or len(action) < 2 or not _is_int(action[0]):
+                    raise ValueError(f"无效的动作: {action!r}")
+                self._owned_ids(action[:1], owned)
+                Session.check_action(action[1:])
+                batch.append((self.sessions[action[0]], action[1:]))
+            for session, action in batch:
+                session.apply(action)
+            return {"t": "ack", "seq": message.get("seq")}
+        if op == "create":
+            seed = message.get("seed")
+            ids = []
+            for i in range(message.get("n", 1)):
+                ids.append(self.create_session(message.get("map", "default"),
+                                               None if seed is None else seed + i,
+                                               message.get("rate", 60), message.get("speed", 1.0), writer))
+            owned.extend(ids)
+            return {"t": "created", "ids": ids}
+        if op == "reset":
+            for session_id in self._owned_ids(message.get("ids", []), owned):
+                self.sessions[session_id].reset()
+            return {"t": "ack", "seq": message.get("seq")}
+        if op == "close":
+            for session_id in dict.fromkeys(self._owned_ids(message.get("ids", []), owned)):
+                self.close_session(session_id)
+                owned.remove(session_id)
+            return {"t": "ack", "seq": message.get("seq")}
+        if op == "stats":
+            return self.stats()
+        return {"t": "error", "message": f"未知操作: {op}"}
+
+    async def start(self):
+        """开始监听并启动节拍任务"""
+        self._server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ticker = asyncio.create_task(self._run_ticker())
+        logger.info("模拟服务器已启动: %s:%d", self.host, self.port)
+
+    async def stop(self):
+        if self._ticker:
+            self._ticker.cancel()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def serve_forever(self):
+        await self.start()
+        await self._server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多会话模拟服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--tick", type=float, default=0.01, help="服务器节拍间隔(秒)")
+    parser.add_argument("--log-level", default="INFO")
+    args = parser.parse_args()
+    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.INFO),
+                        format="%(levelname)s %(name)s: %(message)s")
+    try:
+        asyncio.run(SimulationServer(args.host, args.port, args.tick).serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+"""
+二进制存档
+
+把完整游戏状态编码为一段紧凑的二进制数据: 固定格式的文件头之后依次是地形数组、配送点、
+路径、包裹记录、各包裹列表的下标、随机数状态和等待生成的包裹，全部为numpy原始缓冲区。
+
+地图和路径的存取只需几毫秒；包裹仍然是Python对象，逐个创建和读取属性的开销决定了
+总耗时，10万个包裹的存档和读档各约需100毫秒。这是已知的限制，要降到几毫秒需要
+把包裹改为列式存储。
+"""
+import gc
+import logging
+import os
+import struct
+from contextlib import contextmanager
+from itertools import chain
+from operator import attrgetter
+
+import numpy as np
+
+from .package_manager import Package
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"CDSS"
+VERSION = 5
+
+# 文件头: 游戏状态、日期和模拟时间、地图尺寸、玩家状态、包裹数量、随机数生成器的高斯缓存、已归档的包裹数、
+# 订单日志的读取位置和等待路径查询的新包裹数
+HEADER = struct.Struct(
+    "<4sBQqdBBBi"   # 魔数, 版本, 种子, 得分, 剩余时间, 游戏状态, 天气, 是否完成, 时间奖励
+    "Id"            # 当前日期(遥测中的天), 累计的模拟时间(秒，内存统计按它采样)
+    "IIHiiI"        # 地图宽, 高, 格子大小, 起点x, 起点y, 配送点数量
+    "ddiBBiI"       # 玩家x, y, 携带数量, 是否携带, 是否跟随路径, 路径下标, 路径长度
+    "IIIII"         # 包裹记录数, packages/active/delivered/expired 列表长度
+    "dB"            # 随机数生成器的高斯缓存值及其是否存在
+    "B"             # 地形数组dtype描述的长度
+    "II"            # 已归档(移出包裹列表)的已配送和已过期包裹数
+    "BiQQQ"         # 是否使用订单日志, 日志的当前天, 读取位置, 已交出的订单数, 跳过的订单数
+    "I"             # 等待路径查询的新包裹数
+)
+
+GAME_STATES = ["PREVIEW", "MENU", "GAMEPLAY", "PAUSE", "GAMEOVER"]
+WEATHERS = ["SUNNY", "RAINY", "FOGGY"]
+PACKAGE_STATUSES = ["WAITING", "PICKED", "DELIVERED", "EXPIRED"]
+
+# 包裹编号的类型，可以容纳订单日志中的任意 order_id(<u4)，遥测中同样使用
+ID_DTYPE = "<i8"
+
+# 包裹记录的打包布局，pickup_time 为 NaN 表示尚未拾取
+PACKAGE_DTYPE = np.dtype([
+    ("id", ID_DTYPE),
+    ("start", "<i4", 2),
+    ("destination", "<i4", 2),
+    ("deadline", "<f8"),
+    ("value", "<i4"),
+    ("pickup_time", "<f8"),
+    ("status", "u1"),
+])
+
+# 等待路径查询完成的新包裹(见 PackageManager.pending_spawns)
+SPAWN_DTYPE = np.dtype([
+    ("depot", "<i4", 2),
+    ("destination", "<i4", 2),
+    ("deadline", "<f8"),
+    ("id", ID_DTYPE),
+])
+
+# random.Random 的内部状态为625个32位整数
+RNG_STATE_SIZE = 625
+
+
+
+@contextmanager
+def _gc_paused():
+    """批量创建或遍历大量对象时暂停垃圾回收，避免反复触发分代回收"""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _column(packages, name):
+    return list(map(attrgetter(name), packages))
+
+
+def _pack_packages(package_manager):
+    """
+    把所有包裹列表打包为记录数组和每个列表的下标数组
+
+    同一个包裹对象可能同时出现在多个列表中(例如 packages 和 active_packages)，
+    记录数组中只保存一次，各列表保存指向记录的下标。
+    """
+    unique = list(package_manager.packages)
+    index_of = dict(zip(map(id, unique), range(len(unique))))
+    list_indices = [np.arange(len(unique), dtype="<u4")]
+    for packages in (package_manager.active_packages, package_manager.delivered_packages,
+                     package_manager.expired_packages):
+        indices = []
+        for package in packages:
+            index = index_of.get(id(package))
+            if index is None:
+                index = index_of[id(package)] = len(unique)
+                unique.append(package)
+            indices.append(index)
+        list_indices.append(np.array(indices, dtype="<u4"))
+
+    n = len(unique)
+    records = np.zeros(n, dtype=PACKAGE_DTYPE)
+    if n:
+        records["id"] = _column(unique, "id")
+        records["start"] = np.fromiter(chain.from_iterable(_column(unique, "start_point")),
+                                       "<i4", count=2 * n).reshape(n, 2)
+        records["destination"] = np.fromiter(chain.from_iterable(_column(unique, "destination")),
+                                             "<i4", count=2 * n).reshape(n, 2)
+        records["deadline"] = _column(unique, "deadline")
+        records["value"] = _column(unique, "value")
+        records["pickup_time"] = np.array(_column(unique, "pickup_time"), dtype=object).astype("<f8")  # None 转为 NaN
+        status_codes = {name: code for code, name in enumerate(PACKAGE_STATUSES)}
+        records["status"] = list(map(status_codes.__getitem__, _column(unique, "status")))
+    return records, list_indices
+
+
+def _make_package(fields, new=Package.__new__):
+    # 跳过 __init__ 直接设置属性，避免消耗随机数生成器
+    package = new(Package)
+    (package.start_point, package.destination, package.deadline, package.value,
+     package.pickup_time, package.status, package.id) = fields
+    return package
+
+
+def _unpack_packages(records, list_indices):
+    """根据记录数组重建包裹对象和各个列表"""
+    start = records["start"]
+    destination = records["destination"]
+    starts = list(zip(start[:, 0].tolist(), start[:, 1].tolist()))
+    destinations = list(zip(destination[:, 0].tolist(), destination[:, 1].tolist()))
+
+    deadline = records["deadline"]
+    if np.array_equal(deadline, np.floor(deadline)):
+        deadlines = deadline.astype(np.int64).tolist()
+    else:
+        deadlines = deadline.tolist()
+
+    pickup = records["pickup_time"]
+    pickups = pickup.astype(object)
+    pickups[np.isnan(pickup)] = None
+
+    statuses = np.array(PACKAGE_STATUSES, dtype=object)[records["status"]]
+
+    packages = list(map(_make_package, zip(starts, destinations, deadlines, records["value"].tolist(),
+                                           pickups.tolist(), statuses.tolist(), records["id"].tolist())))
+    return [[packages[i] for i in indices.tolist()] for indices in list_indices]
+
+
+def dump_snapshot(game_manager):
+    """
+    把完整游戏状态编码为紧凑的二进制数据
+
+    数组(地形、配送点、路径、包裹记录、随机数状态、等待生成的包裹)直接写入numpy原始缓冲区。
+    使用订单日志时同时保存日志的读取位置，读档后从同一条订单继续。
+
+    Returns:
+        data: bytes
+    """
+    game_map = game_manager.map
+    player = game_manager.player
+    package_manager = game_manager.package_manager
+
+    with _gc_paused():
+        records, list_indices = _pack_packages(package_manager)
+    delivery_points = np.array(game_map.delivery_points, dtype="<i4").reshape(-1, 2)
+    path = np.array(player.current_path, dtype="<i4").reshape(-1, 2)
+    grid = np.ascontiguousarray(game_map.grid)
+    grid_dtype = grid.dtype.str.encode()
+
+    _, rng_state, gauss = game_manager.rng.getstate()
+    rng_array = np.array(rng_state, dtype="<u4")
+
+    pending = package_manager.pending_spawns()
+    spawns = np.zeros(len(pending), dtype=SPAWN_DTYPE)
+    if pending:
+        depots, destinations, deadlines, ids = zip(*pending)
+        spawns["depot"] = depots
+        spawns["destination"] = destinations
+        spawns["deadline"] = deadlines
+        spawns["id"] = ids
+
+    feed = package_manager.order_feed
+    feed_state = (0, 0, 0, 0) if feed is None else feed.state()
+
+    header = HEADER.pack(
+        MAGIC, VERSION, game_manager.seed, int(game_manager.score), float(game_manager.time),
+        GAME_STATES.index(game_manager.game_state), WEATHERS.index(game_manager.weather),
+        int(game_manager.game_completed), int(game_manager.time_bonus),
+        game_manager.day, float(game_manager.elapsed),
+        game_map.width, game_map.height, game_map.cell_size,
+        int(game_map.start_point[0]), int(game_map.start_point[1]), len(delivery_points),
+        float(player.x), float(player.y), player.current_packages, int(player.carrying_package),
+        int(player.follow_path), player.path_index, len(path),
+        len(records), *(len(indices) for indices in list_indices),
+        0.0 if gauss is None else gauss, int(gauss is not None),
+        len(grid_dtype),
+        package_manager.archived_delivered, package_manager.archived_expired,
+        int(feed is not None), *feed_state,
+        len(spawns),
+    )
+    parts = [header, grid_dtype, grid.tobytes(), delivery_points.tobytes(), path.tobytes(),
+             records.tobytes()]
+    parts += [indices.tobytes() for indices in list_indices]
+    parts += [rng_array.tobytes(), spawns.tobytes()]
+    return b"".join(parts)
+
+
+def restore_snapshot(game_manager, data):
+    """
+    把 dump_snapshot 生成的数据恢复到一个 GameManager 上
+
+    Raises:
+        ValueError: 数据不是存档，或者存档版本不是 VERSION
+    """
+    if len(data) < 5 or data[:4] != MAGIC:
+        raise ValueError("不是有效的存档数据")
+    version = data[4]
+    if version != VERSION:
+        raise ValueError(f"不支持的存档版本: {version}")
+    if len(data) < HEADER.size:
+        raise ValueError("不是有效的存档数据")
+    fields = HEADER.unpack_from(data, 0)
+    offset = HEADER.size
+    (magic, version, seed, score, time_left, state, weather, completed, time_bonus, day, elapsed,
+     width, height, cell_size, start_x, start_y, n_delivery,
+     player_x, player_y, current_packages, carrying, follow_path, path_index, path_len,
+     n_records, n_packages, n_active, n_delivered, n_expired,
+     gauss, has_gauss, dtype_len, archived_delivered, archived_expired,
+     has_feed, feed_day, feed_position, feed_ingested, feed_dropped, n_spawns) = fields
+
+    grid_dtype = np.dtype(data[offset:offset + dtype_len].decode())
+    offset += dtype_len
+
+    def take(dtype, count, shape=None):
+        nonlocal offset
+        array = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+        offset += array.nbytes
+        return array if shape is None else array.reshape(shape)
+
+    grid = take(grid_dtype, width * height, (height, width)).copy()
+    delivery_points = take("<i4", n_delivery * 2, (n_delivery, 2))
+    path = take("<i4", path_len * 2, (path_len, 2))
+    records = take(PACKAGE_DTYPE, n_records)
+    list_indices = [take("<u4", n) for n in (n_packages, n_active, n_delivered, n_expired)]
+    rng_state = take("<u4", RNG_STATE_SIZE)
+    spawns = take(SPAWN_DTYPE, n_spawns)
+
+    # 地图
+    game_map = game_manager.map
+    game_map.cell_size = cell_size
+    game_map.set_grid(grid, (start_x, start_y), delivery_points.tolist())
+
+    # 包裹
+    package_manager = game_manager.package_manager
+    with _gc_paused():
+        (package_manager.packages, package_manager.active_packages,
+         package_manager.delivered_packages, package_manager.expired_packages) = _unpack_packages(records, list_indices)
+    package_manager.archived_delivered = archived_delivered
+    package_manager.archived_expired = archived_expired
+    package_manager.invalidate()
+    package_manager.restore_spawns([
+        (tuple(depot), tuple(destination), int(deadline) if deadline.is_integer() else deadline, package_id)
+        for depot, destination, deadline, package_id in zip(
+            spawns["depot"].tolist(), spawns["destination"].tolist(),
+            spawns["deadline"].tolist(), spawns["id"].tolist())])
+
+    # 订单日志回到存档时的读取位置
+    feed = package_manager.order_feed
+    if has_feed and feed is not None:
+        feed.seek((feed_day, feed_position, feed_ingested, feed_dropped))
+    elif has_feed:
+        logger.warning("存档使用了订单日志，但当前游戏没有打开订单日志")
+
+    # 玩家
+    player = game_manager.player
+    player.x = player_x
+    player.y = player_y
+    player.current_packages = current_packages
+    player.carrying_package = bool(carrying)
+    player.current_path = [tuple(p) for p in path.tolist()]
+    player.path_index = path_index
+    player.follow_path = bool(follow_path)
+    player.moving_left = player.moving_right = player.moving_up = player.moving_down = False
+    player.cell = None  # 下一次更新时重新发布所在格子
+    player.cancel_route()  # 读档前提交的路线查询不再适用
+
+    # 游戏状态和随机数生成器
+    game_manager.seed = seed
+    game_manager.score = score
+    game_manager.time = time_left
+    game_manager.game_state = GAME_STATES[state]
+    game_manager.weather = WEATHERS[weather]
+    game_manager.game_completed = bool(completed)
+    game_manager.time_bonus = time_bonus
+    game_manager.elapsed = elapsed
+    game_manager.day = day
+    if game_manager.telemetry:
+        game_manager.telemetry.start_day(day)
+    game_manager.rng.setstate((3, tuple(rng_state.tolist()), gauss if has_gauss else None))
+
+
+def save_snapshot(game_manager, path):
+    """把游戏状态保存到文件"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    data = dump_snapshot(game_manager)
+    with open(path, "wb") as f:
+        f.write(data)
+    logger.info("已保存存档: %s (%d 字节)", path, len(data))
+
+
+def load_snapshot(game_manager, path):
+    """从文件读取游戏状态"""
+    with open(path, "rb") as f:
+        data = f.read()
+    restore_snapshot(game_manager, data)
+    logger.info("已读取存档: %s", path)
@@ -0,0 +1,242 @@
+"""
+包裹、目的地标记和快递员的精灵渲染
+
+每种外观只渲染一次并缓存(包裹ID标签按文字缓存)，精灵由 pygame.sprite.LayeredDirty 管理。
+地图背景按地图版本渲染一次，精灵画在常驻的世界画布上，每帧只重绘移动或外观改变的精灵
+覆盖的区域，最后把世界画布整体贴到屏幕上。外观与 Player.draw / PackageManager.draw 相同。
+"""
+import logging
+from collections import OrderedDict
+
+import pygame
+
+from .memory import estimate_size, surface_bytes
+
+logger = logging.getLogger(__name__)
+
+# 图层: 数值大的画在上面
+LAYER_PACKAGES = 0
+LAYER_MARKERS = 1
+LAYER_COURIERS = 2
+
+PACKAGE_COLOR = (150, 100, 50)
+MARKER_COLOR = (255, 100, 100)
+LABEL_COLOR = (0, 0, 0)
+LABEL_OFFSET = 25  # ID标签顶部在中心点上方的距离
+
+
+class ImageCache:
+    """按外观缓存预渲染的精灵图像"""
+
+    # 最多缓存的图像数，超过时淘汰最久未使用的(每个包裹ID有标签、包裹和标记三张图像，
+    # 长时间运行时包裹ID不断增加)；已经创建的精灵保留自己的图像，不受淘汰影响
+    MAX_IMAGES = 1024
+
+    def __init__(self):
+        self._font = None
+        self._images = OrderedDict()
+
+    def _get(self, key):
+        cached = self._images.get(key)
+        if cached is not None:
+            self._images.move_to_end(key)
+        return cached
+
+    def _put(self, key, cached):
+        self._images[key] = cached
+        if len(self._images) > self.MAX_IMAGES:
+            self._images.popitem(last=False)
+        return cached
+
+    def clear(self):
+        """清空图像缓存"""
+        self._images.clear()
+
+    def memory_usage(self):
+        """缓存的图像占用的字节数估计"""
+        return estimate_size(self._images)
+
+    def label(self, text):
+        """包裹ID标签"""
+        key = ("label", text)
+        image = self._get(key)
+        if image is None:
+            if self._font is None:
+                self._font = pygame.font.SysFont(None, 20)
+            image = self._put(key, self._font.render(text, True, LABEL_COLOR))
+        return image
+
+    def _with_label(self, kind, text, body, body_size):
+        """
+        把图形和上方的ID标签合成一张图像
+
+        Returns:
+            (image, anchor): anchor 为中心点在图像中的位置
+        """
+        key = (kind, text)
+        cached = self._get(key)
+        if cached is not None:
+            return cached
+        label = self.label(text)
+        half = body_size // 2
+        width = max(body_size, label.get_width())
+        height = LABEL_OFFSET + half + 1
+        image = pygame.Surface((width, height), pygame.SRCALPHA)
+        anchor = (width // 2, LABEL_OFFSET)
+        body(image, anchor)
+        image.blit(label, (anchor[0] - label.get_width() // 2, 0))
+        return self._put(key, (image, anchor))
+
+    def package(self, package_id):
+        """在快递站等待的包裹: 方块和ID"""
+        def body(image, center):
+            pygame.draw.rect(image, PACKAGE_COLOR, (center[0] - 5, center[1] - 5, 10, 10))
+        return self._with_label("package", str(package_id), body, 10)
+
+    def marker(self, package_id):
+        """目的地标记: 圆环和ID"""
+        def body(image, center):
+            pygame.draw.circle(image, MARKER_COLOR, center, 8, 2)
+        return self._with_label("marker", str(package_id), body, 17)
+
+    def courier(self, color, radius, carrying):
+        """快递员: 圆形，携带包裹时上方有一个方块"""
+        key = ("courier", color, radius, carrying)
+        cached = self._get(key)
+        if cached is not None:
+            return cached
+        top = max(radius, 20)
+        image = pygame.Surface((radius * 2 + 1, top + radius + 1), pygame.SRCALPHA)
+        anchor = (radius, top)
+        pygame.draw.circle(image, color, anchor, radius)
+        if carrying:
+            pygame.draw.rect(image, PACKAGE_COLOR, (anchor[0] - 5, anchor[1] - 20, 10, 10))
+        return self._put(key, (image, anchor))
+
+
+class StaticSprite(pygame.sprite.DirtySprite):
+    """位置和外观都不变的精灵(等待中的包裹、目的地标记)"""
+
+    def __init__(self, image, anchor, center, layer):
+        super().__init__()
+        self._layer = layer
+        self.image = image
+        self.rect = image.get_rect(topleft=(center[0] - anchor[0], center[1] - anchor[1]))
+
+
+class CourierSprite(pygame.sprite.DirtySprite):
+    """跟随玩家位置的快递员精灵，只在移动或携带状态改变时标记为需要重绘"""
+
+    def __init__(self, player, images):
+        super().__init__()
+        self._layer = LAYER_COURIERS
+        self.player = player
+        self.images = images
+        self._state = None
+        self.sync()
+
+    def sync(self):
+        player = self.player
+        state = (int(player.x), int(player.y), player.carrying_package)
+        if state == self._state:
+            return
+        self._state = state
+        image, anchor = self.images.courier(player.color, player.radius, state[2])
+        self.image = image
+        self.rect = image.get_rect(topleft=(state[0] - anchor[0], state[1] - anchor[1]))
+        self.dirty = 1
+
+
+class SpriteRenderer:
+    """
+    世界层(地图背景、包裹、标记和快递员)的渲染器
+
+    用法:
+        renderer = SpriteRenderer(game_map)
+        renderer.draw(screen, package_manager, [player])
+    """
+
+    def __init__(self, game_map):
+        self.map = game_map
+        self.images = ImageCache()
+        # 关闭 LayeredDirty 在单帧较慢时自动切换为整屏重绘的行为，精灵很多时整屏重绘反而最慢
+        self.group = pygame.sprite.LayeredDirty(_use_update=True, _time_threshold=float("inf"))
+        self.world = None
+        self._world_version = None
+
+        # 数据对象 -> 精灵
+        self._packages = {}
+        self._markers = {}
+        self._couriers = {}
+
+    def background(self):
+        """按地图版本缓存的地图背景"""
+        def build():
+            surface = self.map.get_terrain_surface()
+            if pygame.display.get_surface() is not None:
+                surface = surface.convert()
+            return surface
+        return self.map.get_layer("background", build)
+
+    def _ensure_world(self):
+        """地图改变后用新背景重建世界画布，并让所有精灵重绘"""
+        if self.world is not None and self._world_version == self.map.version:
+            return self.world
+        background = self.background()
+        self.world = background.copy()
+        self.group.clear(self.world, background)
+        self.group.set_clip(self.world.get_rect())
+        self.group.repaint_rect(self.world.get_rect())
+        self._world_version = self.map.version
+        logger.debug("世界画布已重建: 地图版本 %d", self.map.version)
+        return self.world
+
+    def _sync_static(self, sprites, items, make):
+        """让精灵与数据对象一致: 新出现的对象创建精灵，消失的对象移除精灵"""
+        current = set(items)
+        for item in current.difference(sprites):
+            sprite = sprites[item] = make(item)
+            self.group.add(sprite)
+        for item in set(sprites).difference(current):
+            sprites.pop(item).kill()
+
+    def sync(self, package_manager, couriers):
+        """根据包裹状态和玩家位置更新精灵"""
+        grid_to_pixel = self.map.grid_to_pixel
+        images = self.images
+
+        def make_package(package):
+            image, anchor = images.package(package.id)
+            return StaticSprite(image, anchor, grid_to_pixel(*package.start_point), LAYER_PACKAGES)
+
+        def make_marker(package):
+            image, anchor = images.marker(package.id)
+            return StaticSprite(image, anchor, grid_to_pixel(*package.destination), LAYER_MARKERS)
+
+        waiting = [package for package in package_manager.packages if package.status == "WAITING"]
+        self._sync_static(self._packages, waiting, make_package)
+        self._sync_static(self._markers, package_manager.active_packages, make_marker)
+
+        def make_courier(player):
+            return CourierSprite(player, images)
+
+        self._sync_static(self._couriers, couriers, make_courier)
+        for sprite in self._couriers.values():
+            sprite.sync()
+
+    def memory_usage(self):
+        """图像缓存和世界画布占用的字节数估计(地图背景在地图的图层中统计)"""
+        return {"images": self.images.memory_usage(), "world": surface_bytes(self.world)}
+
+    def draw(self, screen, package_manager, couriers):
+        """
+        绘制世界层
+
+        Returns:
+            rects: 本帧世界画布上重绘的区域
+        """
+        world = self._ensure_world()
+        self.sync(package_manager, couriers)
+        rects = self.group.draw(world)
+        screen.blit(world, (0, 0))
+        return rects
@@ -0,0 +1,245 @@
+"""
+配送事件和快递员位置的遥测
+
+Telemetry 在游戏循环中把事件写入列式缓冲区，由后台线程保存为压缩的分块文件；
+TelemetryStore 逐块读取这些文件并按运行和日期汇总。同一目录可以累积多次运行的数据，
+每次运行的事件带有各自的运行编号，不同运行的同一天不会合并。
+"""
+import glob
+import logging
+import os
+import queue
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 事件类型
+SPAWN = 0
+PICKUP = 1
+DELIVER = 2
+EXPIRE = 3
+POSITION = 4
+EVENT_NAMES = {SPAWN: "spawn", PICKUP: "pickup", DELIVER: "deliver", EXPIRE: "expire", POSITION: "position"}
+
+# 列式缓冲区的列及其类型
+#   run: 运行编号，即该次运行写入的第一个分块的编号(没有此列的旧分块按0处理)
+#   time: 游戏内已过去的分钟数
+#   x, y: 包裹事件为目的地网格坐标，位置采样为像素坐标
+#   value: 生成时为包裹价值，配送时为得分
+#   aux: 生成时为截止时间，配送时为从拾取到送达的分钟数
+COLUMNS = {
+    "run": np.int32,
+    "day": np.int32,
+    "kind": np.uint8,
+    "time": np.float32,
+    "courier": np.int32,
+    "package": np.int64,     # 包裹编号，与订单日志的 order_id(<u4)和存档一致
+    "x": np.float32,
+    "y": np.float32,
+    "value": np.int32,
+    "aux": np.float32,
+}
+
+
+class _Chunk:
+    """一块固定容量的列式缓冲区"""
+    __slots__ = ("columns", "size")
+
+    def __init__(self, capacity):
+        self.columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in COLUMNS.items()}
+        self.size = 0
+
+
+class Telemetry:
+    """
+    配送事件和快递员位置的遥测数据流
+
+    事件先写入内存中的列式缓冲区，缓冲区写满后交给后台线程批量写成
+    压缩的 .npz 分块文件。写入队列已满时直接丢弃该块并计数，
+    保证帧循环永远不会因为磁盘写入而阻塞；缓冲区数量固定，内存占用有上限。
+    """
+
+    def __init__(self, directory, chunk_size=65536, max_pending_chunks=4, sample_interval=1.0):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.sample_interval = sample_interval  # 位置采样间隔(游戏内分钟)
+        self.day = 0
+        os.makedirs(directory, exist_ok=True)
+
+        # 缓冲区池: 写入线程写完一块后放回池中复用
+        self._free = queue.Queue()
+        for _ in range(max_pending_chunks + 1):
+            self._free.put(_Chunk(chunk_size))
+        self._pending = queue.Queue(maxsize=max_pending_chunks)
+        self._chunk = self._free.get()
+        self._sequence = self._next_sequence()
+        self.run = self._sequence   # 分块编号跨运行递增，用第一个分块的编号区分各次运行
+
+        # 每个快递员上一次采样位置的时间
+        self._last_sample = {}
+
+        # 统计数据: 交给写入线程的事件数和被丢弃的事件数
+        self.recorded = 0
+        self.dropped = 0
+
+        self._writer = threading.Thread(target=self._write_loop, name="telemetry-writer", daemon=True)
+        self._writer.start()
+
+    def _next_sequence(self):
+        """继续已有文件的编号，避免覆盖之前运行写入的分块"""
+        existing = glob.glob(os.path.join(self.directory, "chunk_*.npz"))
+        numbers = [int(os.path.basename(path)[6:-4]) for path in existing]
+        return max(numbers, default=-1) + 1
+
+    def record(self, kind, time, package=-1, x=0.0, y=0.0, value=0, aux=0.0, courier=0):
+        """记录一个事件"""
+        chunk = self._chunk
+        if chunk is None:
+            # 没有可用缓冲区(写入线程跟不上)，丢弃事件
+            chunk = self._chunk = self._try_get_free()
+            if chunk is None:
+                self.dropped += 1
+                return
+
+        i = chunk.size
+        columns = chunk.columns
+        columns["run"][i] = self.run
+        columns["day"][i] = self.day
+        columns["kind"][i] = kind
+        columns["time"][i] = time
+        columns["courier"][i] = courier
+        columns["package"][i] = package
+        columns["x"][i] = x
+        columns["y"][i] = y
+        columns["value"][i] = value
+        columns["aux"][i] = aux
+        chunk.size = i + 1
+        self.recorded += 1
+
+        if chunk.size == self.chunk_size:
+            self.flush()
+
+    def sample_position(self, time, x, y, courier=0):
+        """按采样间隔记录快递员位置，未到采样时间时只做一次比较"""
+        last = self._last_sample.get(courier)
+        if last is not None and time - last < self.sample_interval:
+            return
+        self._last_sample[courier] = time
+        self.record(POSITION, time, x=x, y=y, courier=courier)
+
+    def start_day(self, day):
+        """开始新的一天，之后的事件记到该日期下"""
+        self.day = day
+        self._last_sample.clear()
+
+    def flush(self):
+        """把当前缓冲区交给写入线程(不等待写入完成)"""
+        chunk = self._chunk
+        if chunk is None or chunk.size == 0:
+            return
+        try:
+            self._pending.put_nowait((self._sequence, chunk))
+            self._sequence += 1
+        except queue.Full:
+            self.recorded -= chunk.size
+            self.dropped += chunk.size
+            chunk.size = 0
+            self._free.put(chunk)
+            logger.warning("遥测写入跟不上，丢弃 %d 条事件", self.dropped)
+        self._chunk = self._try_get_free()
+
+    def _try_get_free(self):
+        try:
+            return self._free.get_nowait()
+        except queue.Empty:
+            return None
+
+    def _write_loop(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                return
+            sequence, chunk = item
+            path = os.path.join(self.directory, f"chunk_{sequence:06d}.npz")
+            try:
+                np.savez_compressed(path, **{name: column[:chunk.size] for name, column in chunk.columns.items()})
+            except OSError as exc:
+                logger.error("遥测分块写入失败 %s: %s", path, exc)
+            chunk.size = 0
+            self._free.put(chunk)
+
+    def close(self):
+        """写出剩余数据并等待写入线程结束"""
+        self.flush()
+        self._pending.put(None)
+        self._writer.join()
+        logger.info("遥测已关闭: 记录 %d 条，丢弃 %d 条", self.recorded, self.dropped)
+
+
+class TelemetryStore:
+    """读取遥测分块文件并计算按运行和日期汇总的统计数据，每次只加载一个分块"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def chunk_paths(self):
+        return sorted(glob.glob(os.path.join(self.directory, "chunk_*.npz")))
+
+    def iter_chunks(self):
+        """依次产生每个分块的列字典"""
+        for path in self.chunk_paths():
+            with np.load(path) as data:
+                columns = {name: data[name] for name in data.files}
+            if "run" not in columns:
+                columns["run"] = np.zeros(len(columns["day"]), dtype=COLUMNS["run"])
+            yield columns
+
+    def daily_aggregates(self):
+        """
+        按运行和日期汇总
+
+        Returns:
+            aggregates: {(运行编号, 日期): {spawned, picked, delivered, expired, score,
+                                mean_delivery_minutes, distance_px}}
+        """
+        days = {}
+        last_position = {}  # (运行编号, 日期, 快递员) -> 上一个采样位置
+
+        for columns in self.iter_chunks():
+            keys = np.stack((columns["run"], columns["day"]), axis=1)
+            for run, day in np.unique(keys, axis=0).tolist():
+                in_day = (columns["run"] == run) & (columns["day"] == day)
+                kind = columns["kind"][in_day]
+                stats = days.setdefault((run, day), {"spawned": 0, "picked": 0, "delivered": 0, "expired": 0,
+                                              "score": 0, "delivery_minutes": 0.0, "distance_px": 0.0})
+                stats["spawned"] += int(np.count_nonzero(kind == SPAWN))
+                stats["picked"] += int(np.count_nonzero(kind == PICKUP))
+                stats["expired"] += int(np.count_nonzero(kind == EXPIRE))
+
+                delivered = kind == DELIVER
+                stats["delivered"] += int(np.count_nonzero(delivered))
+                stats["score"] += int(columns["value"][in_day][delivered].sum())
+                stats["delivery_minutes"] += float(columns["aux"][in_day][delivered].sum())
+
+                # 按快递员累加相邻采样点之间的距离
+                positions = kind == POSITION
+                couriers = columns["courier"][in_day][positions]
+                xs = columns["x"][in_day][positions]
+                ys = columns["y"][in_day][positions]
+                for courier in np.unique(couriers).tolist():
+                    mine = couriers == courier
+                    px = xs[mine]
+                    py = ys[mine]
+                    previous = last_position.get((run, day, courier))
+                    if previous is not None:
+                        px = np.concatenate(([previous[0]], px))
+                        py = np.concatenate(([previous[1]], py))
+                    stats["distance_px"] += float(np.hypot(np.diff(px), np.diff(py)).sum())
+                    last_position[(run, day, courier)] = (px[-1], py[-1])
+
+        for stats in days.values():
+            delivery_minutes = stats.pop("delivery_minutes")
+            stats["mean_delivery_minutes"] = delivery_minutes / stats["delivered"] if stats["delivered"] else 0.0
+        return days
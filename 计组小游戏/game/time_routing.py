@@ -0,0 +1,278 @@
+"""
+随时间变化的通行成本和最早到达时间查询
+
+一天中的通行成本不是固定的，例如课间道路拥挤。CostProfile 把格子分为若干区域(zone)，
+每个时间段(bucket)为每个区域保存一个成本倍数，占用 时间段数 x 区域数 个浮点数加上每格一个字节，
+与地图上的格子数和时间段数的乘积无关。
+
+TimeDependentRouter 按快递员实际到达每个格子的时间计算通过该格子的耗时，回答最早到达时间查询。
+穿过格子的过程中进入新的时间段时按新的倍数继续计算(速度随时间变化而不是成本在出发时确定)，
+因此晚出发永远不会早到达(FIFO)，按到达时间做 A* 搜索得到的就是最早到达时间。
+
+时间都是游戏时间(从一天开始计的分钟数，与 PackageManager 的 game_time 和 Package.deadline 相同)。
+
+用法:
+    profile = CostProfile.rush_hours(game_map)
+    router = TimeDependentRouter(game_map, profile)
+    arrival, path = router.earliest_arrival(start, end, depart=game_time)
+    packages = router.feasible_packages(start, packages, game_time)
+"""
+import heapq
+import logging
+
+import numpy as np
+
+from . import heuristics, search_grid
+
+logger = logging.getLogger(__name__)
+
+DAY_MINUTES = 480
+COURIER_SPEED = 150  # 像素/秒，与 Player.speed 相同
+
+# 默认的课间时段(游戏时间，分钟): 工作日从8:00开始
+CLASS_CHANGES = ((95, 115), (240, 270), (335, 350), (420, 440))
+
+# 区域
+ZONE_OPEN = 0      # 草地等不受人流影响的格子
+ZONE_ROAD = 1      # 道路
+ZONE_CAMPUS = 2    # 紧邻建筑物的道路，课间最拥挤
+
+
+class CostProfile:
+    """
+    按时间段和区域保存的成本倍数
+
+    Args:
+        zones: 每个格子所属的区域 (height, width)
+        multipliers: 成本倍数 (时间段数, 区域数)，必须大于0
+        bucket_minutes: 每个时间段的长度(分钟)，最后一个时间段一直持续到一天结束之后
+    """
+
+    def __init__(self, zones, multipliers, bucket_minutes):
+        self.zones = np.asarray(zones, dtype=np.uint8)
+        self.multipliers = np.asarray(multipliers, dtype=np.float32)
+        if self.multipliers.ndim != 2 or self.multipliers.shape[1] <= int(self.zones.max()):
+            raise ValueError("成本倍数的形状必须是 (时间段数, 区域数)")
+        if (self.multipliers <= 0).any():
+            raise ValueError("成本倍数必须大于0")
+        self.bucket_minutes = float(bucket_minutes)
+
+    @property
+    def buckets(self):
+        return self.multipliers.shape[0]
+
+    @property
+    def nbytes(self):
+        return self.zones.nbytes + self.multipliers.nbytes
+
+    @classmethod
+    def uniform(cls, game_map, buckets=1, day_minutes=DAY_MINUTES):
+        """成本不随时间变化的配置(与 AStar 的成本模型相同)"""
+        zones = np.zeros((game_map.height, game_map.width), dtype=np.uint8)
+        return cls(zones, np.ones((buckets, 1)), day_minutes / buckets)
+
+    @classmethod
+    def rush_hours(cls, game_map, bucket_minutes=5, class_changes=CLASS_CHANGES,
+                   road_crowd=1.5, campus_crowd=2.5, day_minutes=DAY_MINUTES):
+        """
+        课间道路拥挤的配置
+
+        课间时段内道路的成本乘以road_crowd，紧邻建筑物的道路乘以campus_crowd，草地不变。
+        """
+        costs = game_map.get_cost_grid()
+        road = costs == min(cost for cost in game_map.TERRAIN_COSTS.values() if cost > 0)
+        building = np.pad(game_map.grid == game_map.BUILDING, 1)
+        near_building = np.zeros_like(road)
+        height, width = road.shape
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                near_building |= building[1 + dy:1 + dy + height, 1 + dx:1 + dx + width]
+        zones = np.full(road.shape, ZONE_OPEN, dtype=np.uint8)
+        zones[road] = ZONE_ROAD
+        zones[road & near_building] = ZONE_CAMPUS
+
+        buckets = int(np.ceil(day_minutes / bucket_minutes))
+        starts = np.arange(buckets) * bucket_minutes
+        multipliers = np.ones((buckets, 3))
+        for begin, end in class_changes:
+            crowded = (starts + bucket_minutes > begin) & (starts < end)
+            multipliers[crowded, ZONE_ROAD] = road_crowd
+            multipliers[crowded, ZONE_CAMPUS] = campus_crowd
+        return cls(zones, multipliers, bucket_minutes)
+
+    def multiplier(self, minute, grid_x, grid_y):
+        """某一时刻某个格子的成本倍数"""
+        bucket = min(max(int(minute // self.bucket_minutes), 0), self.buckets - 1)
+        return float(self.multipliers[bucket, self.zones[grid_y, grid_x]])
+
+
+class TimeDependentRouter:
+    """
+    最早到达时间查询
+
+    Args:
+        game_map: 地图
+        profile: CostProfile
+        unit_minutes: 成本为1的一步在倍数为1时花费的游戏时间(分钟)，
+                      默认按快递员速度换算(每格 cell_size / COURIER_SPEED 秒，60秒为1游戏分钟)
+    """
+
+    def __init__(self, game_map, profile, unit_minutes=None):
+        self.map = game_map
+        self.profile = profile
+        if unit_minutes is None:
+            unit_minutes = game_map.cell_size / COURIER_SPEED / 60.0
+        self.unit_minutes = unit_minutes
+        self._layout = None
+        self._layout_key = None
+
+        # 最近一次搜索展开的节点数
+        self.last_expanded = 0
+
+    def _prepare(self):
+        """扁平网格上每个下标的区域，以及每个时间段的倍数表，随地图版本和配置更新"""
+        key = (self.map.version, id(self.profile), self.unit_minutes)
+        if self._layout_key != key:
+            stride, costs, neighbors = search_grid.grid_layout(self.map)
+            zones = np.zeros((self.map.height + 2, stride), dtype=np.int64)
+            zones[1:-1, 1:-1] = self.profile.zones
+            # 每一步的耗时(分钟，倍数为1时) = 步长系数 * 地形成本 * unit_minutes
+            unit = self.unit_minutes
+            moves = [(offset, step * unit) for offset, step in neighbors]
+            table = self.profile.multipliers.astype(float).tolist()
+            floor = float(self.profile.multipliers.min()) * unit
+            self._layout = (stride, costs, zones.ravel().tolist(), moves, table, floor)
+            self._layout_key = key
+        return self._layout
+
+    def _traverse(self, table, t, work, zone):
+        """从时刻t开始，完成倍数为1时需要work分钟的一步，返回完成的时刻(跨越时间段时分段计算)"""
+        size = self.profile.bucket_minutes
+        last = len(table) - 1
+        bucket = min(max(int(t // size), 0), last)
+        while True:
+            factor = table[bucket][zone]
+            finish = t + work * factor
+            if bucket == last:
+                return finish
+            end = (bucket + 1) * size
+            if finish <= end:
+                return finish
+            work -= (end - t) / factor
+            t = end
+            bucket += 1
+
+    def _index(self, point, stride):
+        return (int(point[1]) + 1) * stride + int(point[0]) + 1
+
+    def _search(self, source, targets, depart, goal=None, want_parents=False):
+        """
+        按到达时间的 A*(goal为None时为多目标Dijkstra)，所有目标确定后停止
+
+        Returns:
+            (found, parents): found 为 {目标下标: 到达时刻}
+        """
+        stride, costs, zones, moves, table, floor = self._prepare()
+        size = self.profile.bucket_minutes
+        last = len(table) - 1
+        if goal is not None:
+            # 启发式: 成本下界乘以最快的倍数，可采纳且一致
+            octile = heuristics.OctileHeuristic(self.map).bind_index(goal)
+
+            def h(index):
+                return octile(index) * floor
+        else:
+            def h(index):
+                return 0.0
+
+        inf = float("inf")
+        arrival = {source: depart}
+        parents = {source: -1} if want_parents else None
+        closed = set()
+        remaining = set(targets)
+        found = {}
+        heap = [(depart + h(source), source)]
+        pop, push = heapq.heappop, heapq.heappush
+        traverse = self._traverse
+        expanded = 0
+        while heap and remaining:
+            _, current = pop(heap)
+            if current in closed:
+                continue
+            closed.add(current)
+            t = arrival[current]
+            if current in remaining:
+                remaining.discard(current)
+                found[current] = t
+                if not remaining:
+                    break
+            expanded += 1
+            bucket = min(max(int(t // size), 0), last)
+            row = table[bucket]
+            end = (bucket + 1) * size
+            for offset, step in moves:
+                neighbor = current + offset
+                cost = costs[neighbor]
+                if cost < 0 or neighbor in closed:
+                    continue
+                zone = zones[neighbor]
+                work = step * cost
+                finish = t + work * row[zone]
+                if finish > end and bucket < last:
+                    finish = traverse(table, t, work, zone)
+                if finish < arrival.get(neighbor, inf):
+                    arrival[neighbor] = finish
+                    if want_parents:
+                        parents[neighbor] = current
+                    push(heap, (finish + h(neighbor), neighbor))
+        self.last_expanded = expanded
+        return found, parents
+
+    def earliest_arrival(self, start, end, depart):
+        """
+        在时刻depart从start出发，到达end的最早时刻
+
+        Returns:
+            (arrival, path): 不可达时为 (inf, [])
+        """
+        width, height = self.map.width, self.map.height
+        if not (0 <= start[0] < width and 0 <= start[1] < height and 0 <= end[0] < width and 0 <= end[1] < height):
+            return float("inf"), []
+        stride = self.map.width + 2
+        source, target = self._index(start, stride), self._index(end, stride)
+        found, parents = self._search(source, {target}, depart, goal=end, want_parents=True)
+        if target not in found:
+            return float("inf"), []
+        path = []
+        current = target
+        while current != -1:
+            y, x = divmod(current, stride)
+            path.append((x - 1, y - 1))
+            current = parents[current]
+        path.reverse()
+        return found[target], path
+
+    def arrival_times(self, start, targets, depart):
+        """
+        一次搜索求出到多个目标的最早到达时刻
+
+        Returns:
+            {目标: 到达时刻}，不可达的目标为inf
+        """
+        stride = self.map.width + 2
+        index = {tuple(target): self._index(target, stride) for target in targets
+                 if 0 <= target[0] < self.map.width and 0 <= target[1] < self.map.height}
+        found = {}
+        if 0 <= start[0] < self.map.width and 0 <= start[1] < self.map.height and index:
+            found, _ = self._search(self._index(start, stride), set(index.values()), depart)
+        return {tuple(target): found.get(index.get(tuple(target)), float("inf")) for target in targets}
+
+    def feasible_packages(self, start, packages, now):
+        """
+        在时刻now从start出发，能在截止时间前送达的包裹
+
+        Args:
+            packages: Package 列表，使用其 destination 和 deadline
+        """
+        arrivals = self.arrival_times(start, [package.destination for package in packages], now)
+        return [package for package in packages if arrivals[tuple(package.destination)] <= package.deadline]
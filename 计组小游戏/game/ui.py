@@ -1,20 +1,136 @@
+"""
+用户界面
+
+界面由预先布局的控件组成(保留模式): 每个画面(信息面板、菜单、游戏结束)是一个 View，
+静态部分(面板底色和边框、半透明遮罩、标题、按钮的普通和悬停两种外观)只渲染一次，
+文字控件绑定一个值，值改变时才重新渲染。每帧只是把缓存的surface依次贴到屏幕上。
+按钮的命中检测只查当前画面中预先建立的矩形。
+"""
+import logging
 import pygame
-import os
+from .event_bus import SCORE_CHANGED
+
+logger = logging.getLogger(__name__)
+
+_UNSET = object()
+
+
+def _prepared(surface, alpha=False):
+    """转换为显示器的像素格式以加快贴图(还没有创建窗口时保持原样)"""
+    if pygame.display.get_surface() is None:
+        return surface
+    return surface.convert_alpha() if alpha else surface.convert()
+
+
+class Label:
+    """
+    绑定一个值的控件，值改变时才重新渲染
+
+    Args:
+        render: 值 -> surface 的函数
+        position: 位置(屏幕坐标)
+        anchor: position 对应的矩形属性，例如 "topleft"、"midtop"、"topright"、"center"
+    """
+
+    def __init__(self, render, position, anchor="topleft"):
+        self.render = render
+        self.position = position
+        self.anchor = anchor
+        self.value = _UNSET
+        self.surface = None
+        self.rect = None
+
+    def set(self, value):
+        """设置绑定的值，返回是否重新渲染"""
+        if value == self.value:
+            return False
+        self.value = value
+        self.surface = self.render(value)
+        self.rect = self.surface.get_rect(**{self.anchor: self.position})
+        return True
+
+    def draw(self, screen):
+        if self.surface is not None:
+            screen.blit(self.surface, self.rect)
+
+
+class Button:
+    """普通和悬停两种外观都预先渲染的按钮"""
+
+    def __init__(self, name, rect, text_surface, color, hover_color, border_color=(100, 100, 100),
+                 border_radius=0):
+        self.name = name
+        self.rect = pygame.Rect(rect)
+        self._images = [self._render(fill, border_color, border_radius, text_surface)
+                        for fill in (color, hover_color)]
+
+    def _render(self, fill, border_color, border_radius, text_surface):
+        image = pygame.Surface(self.rect.size, pygame.SRCALPHA if border_radius else 0)
+        local = image.get_rect()
+        pygame.draw.rect(image, fill, local, border_radius=border_radius)
+        pygame.draw.rect(image, border_color, local, 2, border_radius=border_radius)
+        image.blit(text_surface, text_surface.get_rect(center=local.center))
+        return image
+
+    def draw(self, screen, hover):
+        screen.blit(self._images[hover], self.rect)
+
+
+class View:
+    """
+    一个画面: 静态背景、绑定值的文字控件和按钮
+
+    Args:
+        background: 只渲染一次的静态背景 surface，None表示没有
+        position: 背景在屏幕上的位置
+    """
+
+    def __init__(self, background=None, position=(0, 0)):
+        self.background = background
+        self.position = position
+        self.labels = {}
+        self.buttons = {}
+        self.rects = {}     # 按钮名 -> 矩形，用于命中检测
+
+    def add_label(self, name, label):
+        self.labels[name] = label
+        return label
+
+    def add_button(self, button):
+        self.buttons[button.name] = button
+        self.rects[button.name] = button.rect
+        return button
+
+    def set(self, name, value):
+        """设置一个文字控件绑定的值"""
+        return self.labels[name].set(value)
+
+    def draw(self, screen, hover=None):
+        if self.background is not None:
+            screen.blit(self.background, self.position)
+        for label in self.labels.values():
+            label.draw(screen)
+        for name, button in self.buttons.items():
+            button.draw(screen, name == hover)
+
 
 class UI:
-    def __init__(self, screen):
+    # 信息面板的时钟显示到秒；为False时只显示到分钟，时钟文字每游戏分钟才重新渲染一次
+    SHOW_SECONDS = True
+
+    def __init__(self, screen, bus=None):
         self.screen = screen
         self.width = screen.get_width()
         self.height = screen.get_height()
-        
+
         # 字体设置 - 减小字体大小
         pygame.font.init()
-        
+
         # 使用系统默认字体，但用英文替代中文显示（解决中文字体问题）
         self.font_large = pygame.font.Font(pygame.font.get_default_font(), 36)  # 减小字体
         self.font_medium = pygame.font.Font(pygame.font.get_default_font(), 24)  # 减小字体
         self.font_small = pygame.font.Font(pygame.font.get_default_font(), 18)  # 减小字体
-        
+
         # 颜色设置
         self.color_text = (50, 50, 50)
         self.color_highlight = (255, 100, 100)
@@ -22,11 +138,11 @@ class UI:
         self.color_panel = (200, 200, 200)
         self.color_button = (180, 180, 180)
         self.color_button_hover = (220, 220, 220)
-        
-        # UI元素状态
+
+        # UI元素状态: buttons 为最近绘制的画面中的按钮矩形(预先建立，不在每帧重建)
         self.buttons = {}
         self.active_button = None
-        
+
         # 回调函数，用于处理按钮点击
         self.button_callbacks = {
             "start": None,
@@ -35,77 +151,154 @@ class UI:
             "help": None,
             "quit": None
         }
-    
+
+        # 各画面的控件只建立一次
+        self._info_view = self._build_info_view()
+        self._menu_view = self._build_menu_view()
+        self._game_over_view = self._build_game_over_view()
+
+        # 得分文字随 SCORE_CHANGED 事件更新，没有事件总线时在绘制时更新
+        self._score_from_events = bus is not None
+        if bus is not None:
+            bus.subscribe(SCORE_CHANGED, self._on_score_changed)
+
+    def _on_score_changed(self, score):
+        self._info_view.set("score", score)
+
+    def _text(self, font, format, color=None):
+        """值 -> 文字surface 的渲染函数"""
+        color = color or self.color_text
+        return lambda value: font.render(format(value), True, color)
+
+    def _build_info_view(self):
+        """顶部信息面板: 底色和边框预先画好，得分、时间和天气随值改变重新渲染"""
+        panel_rect = pygame.Rect(10, 10, self.width - 20, 40)
+        panel = pygame.Surface(panel_rect.size)
+        panel.fill(self.color_panel)
+        pygame.draw.rect(panel, (100, 100, 100), panel.get_rect(), 2)
+        view = View(_prepared(panel), panel_rect.topleft)
+        view.add_label("score", Label(self._text(self.font_medium, "Score: {}".format), (20, 15)))  # 英文
+        view.add_label("time", Label(self._text(self.font_medium, self._format_time),
+                                     (self.width // 2, 15), "midtop"))
+        view.add_label("weather", Label(self._text(self.font_medium, self._format_weather),
+                                        (self.width - 20, 15), "topright"))
+        return view
+
+    def _build_menu_view(self):
+        """菜单: 背景和标题合成一张图像，按钮预先渲染"""
+        background = pygame.Surface((self.width, self.height))
+        background.fill(self.color_background)
+        title_surface = self.font_large.render("Campus Delivery Simulator", True, self.color_text)  # 英文标题
+        background.blit(title_surface, (self.width // 2 - title_surface.get_width() // 2, 100))
+        view = View(_prepared(background))
+
+        button_width, button_height = 200, 50
+        for name, text, y in [("start", "Start Game", 200), ("help", "Help", 300), ("quit", "Quit", 400)]:  # 英文
+            rect = (self.width // 2 - button_width // 2, y, button_width, button_height)
+            view.add_button(Button(name, rect, self.font_medium.render(text, True, self.color_text),
+                                   self.color_button, self.color_button_hover))
+        return view
+
+    def _build_game_over_view(self):
+        """游戏结束: 半透明遮罩只创建一次，得分和剩余时间随值改变重新渲染"""
+        overlay = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
+        overlay.fill((0, 0, 0, 180))
+        view = View(_prepared(overlay, alpha=True))
+
+        def render_title(completed):
+            if completed:
+                return self.font_large.render("Congratulations! Mission Completed", True, (255, 255, 100))
+            return self.font_large.render("Game Over", True, (255, 255, 255))
+
+        white = (255, 255, 255)
+        center = self.width // 2
+        view.add_label("title", Label(render_title, (center, 100), "center"))
+        view.add_label("score", Label(self._text(self.font_medium, "Final Score: {}".format, white),
+                                      (center, 170), "center"))
+        view.add_label("time", Label(self._text(self.font_medium, "Time Left: {} min".format, white),
+                                     (center, 210), "center"))
+
+        # 一个较小的"再试一次"按钮，放在屏幕下方居中
+        button_width, button_height = 150, 40
+        rect = (center - button_width // 2, 300, button_width, button_height)
+        view.add_button(Button("restart", rect, self.font_small.render("Try Again", True, self.color_text),
+                               self.color_button, self.color_button_hover, border_radius=5))
+        return view
+
+    def _show(self, view):
+        """命中检测改用view中预先建立的按钮矩形"""
+        self.buttons = view.rects
+
     def set_callback(self, button_name, callback_function):
         """设置按钮点击的回调函数"""
         if button_name in self.button_callbacks:
             self.button_callbacks[button_name] = callback_function
-    
+
     def handle_event(self, event):
         """处理UI相关事件"""
         if event.type == pygame.MOUSEMOTION:
-            # 检查鼠标悬停在哪个按钮上
-            mouse_pos = pygame.mouse.get_pos()
-            self.active_button = None
-            for name, rect in self.buttons.items():
-                if rect.collidepoint(mouse_pos):
-                    self.active_button = name
-        
+            # 检查鼠标悬停在哪个按钮上(使用事件中的坐标，回放时同样有效)
+            self.active_button = self._hit_test(event.pos)
+
         elif event.type == pygame.MOUSEBUTTONDOWN:
             # 检查是否点击按钮
-            mouse_pos = pygame.mouse.get_pos()
-            for name, rect in self.buttons.items():
-                if rect.collidepoint(mouse_pos):
-                    self._handle_button_click(name)
-                    return True  # 返回True表示处理了事件
+            name = self._hit_test(event.pos)
+            if name is not None:
+                self._handle_button_click(name)
+                return True  # 返回True表示处理了事件
         return False  # 返回False表示没有处理事件
-    
+
+    def _hit_test(self, pos):
+        """当前画面中pos处的按钮名，没有时为None"""
+        for name, rect in self.buttons.items():
+            if rect.collidepoint(pos):
+                return name
+        return None
+
     def _handle_button_click(self, button_name):
         """处理按钮点击事件"""
-        print(f"Button clicked: {button_name}")
-        
+        logger.debug("Button clicked: %s", button_name)
+
         # 如果该按钮有回调函数，调用它
         if button_name in self.button_callbacks and self.button_callbacks[button_name]:
             self.button_callbacks[button_name]()
             return True
         return False
-    
+
     def draw(self, screen, score, time, weather):
         """绘制游戏主界面UI"""
         # 绘制顶部信息面板
         self._draw_info_panel(screen, score, time, weather)
-    
+
     def _draw_info_panel(self, screen, score, time, weather):
-        """绘制顶部信息面板"""
-        # 绘制面板背景
-        panel_rect = pygame.Rect(10, 10, self.width - 20, 40)
-        pygame.draw.rect(screen, self.color_panel, panel_rect)
-        pygame.draw.rect(screen, (100, 100, 100), panel_rect, 2)
-        
-        # 绘制得分
-        score_text = f"Score: {score}"  # 英文
-        score_surface = self.font_medium.render(score_text, True, self.color_text)
-        screen.blit(score_surface, (20, 15))
-        
-        # 绘制时间 - 修正时间计算
+        """绘制顶部信息面板(只有显示的值改变时才重新渲染文字)"""
+        view = self._info_view
+        self._show(view)
+        if not self._score_from_events:
+            view.set("score", score)
+
+        # 时钟的值是显示的 (分钟, 秒)，同一秒内不重新渲染
         total_minutes = int(time)
+        if self.SHOW_SECONDS:
+            # 确保秒数不超过59
+            view.set("time", (total_minutes, min(int((time - total_minutes) * 60), 59)))
+        else:
+            view.set("time", (total_minutes, None))
+        view.set("weather", weather)
+        view.draw(screen)
+
+    @staticmethod
+    def _format_time(value):
+        total_minutes, seconds = value
         hours = total_minutes // 60
         minutes = total_minutes % 60
-        seconds = int((time - total_minutes) * 60)
-        
-        # 确保秒数不超过59
-        if seconds >= 60:
-            seconds = 59
-            
-        time_text = f"Time: {hours:02d}:{minutes:02d}:{seconds:02d}"  # 英文
-        time_surface = self.font_medium.render(time_text, True, self.color_text)
-        screen.blit(time_surface, (self.width // 2 - time_surface.get_width() // 2, 15))
-        
-        # 绘制天气
-        weather_text = f"Weather: {self._get_weather_name(weather)}"  # 英文
-        weather_surface = self.font_medium.render(weather_text, True, self.color_text)
-        screen.blit(weather_surface, (self.width - 20 - weather_surface.get_width(), 15))
-    
+        if seconds is None:
+            return f"Time: {hours:02d}:{minutes:02d}"  # 英文
+        return f"Time: {hours:02d}:{minutes:02d}:{seconds:02d}"  # 英文
+
+    def _format_weather(self, weather):
+        return f"Weather: {self._get_weather_name(weather)}"  # 英文
+
     def _get_weather_name(self, weather):
         """获取天气的名称 (英文)"""
         weather_names = {
@@ -114,86 +307,17 @@ class UI:
             "FOGGY": "Foggy"
         }
         return weather_names.get(weather, "Unknown")
-    
+
     def draw_menu(self, screen):
         """绘制游戏菜单界面"""
-        # 填充背景
-        screen.fill(self.color_background)
-        
-        # 绘制标题
-        title = "Campus Delivery Simulator"  # 英文标题
-        title_surface = self.font_large.render(title, True, self.color_text)
-        screen.blit(title_surface, 
-                   (self.width // 2 - title_surface.get_width() // 2, 100))
-        
-        # 绘制按钮
-        buttons = [
-            ("start", "Start Game", 200),  # 英文
-            ("help", "Help", 300),         # 英文
-            ("quit", "Quit", 400)          # 英文
-        ]
-        
-        self.buttons = {}
-        for name, text, y in buttons:
-            button_width = 200
-            button_height = 50
-            button_x = self.width // 2 - button_width // 2
-            
-            button_rect = pygame.Rect(button_x, y, button_width, button_height)
-            self.buttons[name] = button_rect
-            
-            # 绘制按钮
-            color = self.color_button_hover if name == self.active_button else self.color_button
-            pygame.draw.rect(screen, color, button_rect)
-            pygame.draw.rect(screen, (100, 100, 100), button_rect, 2)
-            
-            # 绘制按钮文本
-            text_surface = self.font_medium.render(text, True, self.color_text)
-            screen.blit(text_surface, 
-                       (button_x + button_width // 2 - text_surface.get_width() // 2, 
-                        y + button_height // 2 - text_surface.get_height() // 2))
-    
+        self._show(self._menu_view)
+        self._menu_view.draw(screen, self.active_button)
+
     def draw_game_over(self, screen, score, time_left=0, game_completed=False):
         """绘制游戏结束界面"""
-        # 创建一个半透明的面板覆盖在游戏上
-        overlay = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
-        pygame.draw.rect(overlay, (0, 0, 0, 180), (0, 0, self.width, self.height))
-        screen.blit(overlay, (0, 0))
-        
-        # 显示游戏结束的标题
-        if game_completed:
-            title_text = self.font_large.render("Congratulations! Mission Completed", True, (255, 255, 100))
-        else:
-            title_text = self.font_large.render("Game Over", True, (255, 255, 255))
-        
-        title_rect = title_text.get_rect(center=(self.width // 2, 100))
-        screen.blit(title_text, title_rect)
-        
-        # 显示游戏得分
-        score_text = self.font_medium.render(f"Final Score: {score}", True, (255, 255, 255))
-        score_rect = score_text.get_rect(center=(self.width // 2, 170))
-        screen.blit(score_text, score_rect)
-        
-        # 显示剩余时间
-        time_text = self.font_medium.render(f"Time Left: {time_left} min", True, (255, 255, 255))
-        time_rect = time_text.get_rect(center=(self.width // 2, 210))
-        screen.blit(time_text, time_rect)
-        
-        # 创建一个更小的"再试一次"按钮，放在屏幕下方居中
-        button_width, button_height = 150, 40  # 缩小按钮尺寸
-        button_x = self.width // 2 - button_width // 2
-        button_y = 300  # 更靠上的位置
-        
-        button_color = self.color_button_hover if self.active_button == "restart" else self.color_button
-        
-        restart_button = pygame.Rect(button_x, button_y, button_width, button_height)
-        pygame.draw.rect(screen, button_color, restart_button, border_radius=5)  # 圆角更小
-        pygame.draw.rect(screen, (100, 100, 100), restart_button, 2, border_radius=5)
-        
-        restart_text = self.font_small.render("Try Again", True, self.color_text)
-        restart_text_rect = restart_text.get_rect(center=restart_button.center)
-        screen.blit(restart_text, restart_text_rect)
-        
-        # 保存按钮以便检测点击
-        self.buttons = {}  # 清除之前的按钮
-        self.buttons["restart"] = restart_button 
\ No newline at end of file
+        view = self._game_over_view
+        self._show(view)
+        view.set("title", bool(game_completed))
+        view.set("score", score)
+        view.set("time", time_left)
+        view.draw(screen, self.active_button)
@@ -0,0 +1,280 @@
+"""
+向量化的多环境模拟
+
+把N个相互独立的游戏副本的状态(地图可行走图层、玩家位置、包裹表和时钟)
+保存在批量numpy数组中，reset/step 一次推进全部环境，不对单个环境做Python循环。
+游戏规则与 GameManager.update 一致: 玩家按方向移动并做可行走检查，
+包裹过期、拾取(受背包容量限制)、配送得分(与 Package.deliver 相同)、
+提前完成奖励以及工作日结束。与 PackageManager 相同，每个包裹在到达目的地最快的快递站
+(game.depots.assign_depot)等待，回到任意一个快递站(Map.get_depots)都可以提前完成。
+
+动作为每个环境一个整数，对应键盘方向组合:
+    0 不动, 1 上, 2 右上, 3 右, 4 右下, 5 下, 6 左下, 7 左, 8 左上
+"""
+import numpy as np
+
+from .depots import assign_depot
+from .map import Map
+from .pathfinding import AStar
+
+# 包裹状态
+WAITING = 0
+PICKED = 1
+DELIVERED = 2
+EXPIRED = 3
+
+# 动作对应的移动方向(对角线方向已标准化，与 Player._move_by_input 一致)
+_DIAGONAL = 2 ** -0.5
+ACTION_DIRECTIONS = np.array([
+    (0, 0), (0, -1), (_DIAGONAL, -_DIAGONAL), (1, 0), (_DIAGONAL, _DIAGONAL),
+    (0, 1), (-_DIAGONAL, _DIAGONAL), (-1, 0), (-_DIAGONAL, -_DIAGONAL),
+])
+NUM_ACTIONS = len(ACTION_DIRECTIONS)
+
+DAY_MINUTES = 480
+
+
+class VectorEnv:
+    """
+    N个独立游戏环境的批量模拟
+
+    Args:
+        num_envs: 环境数量
+        maps: None(全部使用默认地图)、一个 Map(全部共享) 或长度为N的 Map 列表(尺寸必须相同)
+        packages_per_env: 每个环境每天的包裹数量
+        seed: numpy随机种子
+        dt: 每步的模拟时间(秒)
+        auto_reset: 为True时 step 会自动重置已结束的环境
+    """
+
+    def __init__(self, num_envs, maps=None, packages_per_env=3, seed=None, dt=1 / 60,
+                 auto_reset=True):
+        if maps is None:
+            maps = Map()
+        if isinstance(maps, Map):
+            maps = [maps] * num_envs
+        if len(maps) != num_envs:
+            raise ValueError("地图数量与环境数量不一致")
+        shapes = {(m.height, m.width, m.cell_size) for m in maps}
+        if len(shapes) != 1:
+            raise ValueError("所有地图的尺寸和格子大小必须相同")
+        (self.height, self.width, self.cell_size), = shapes
+
+        self.num_envs = num_envs
+        self.num_packages = packages_per_env
+        self.dt = dt
+        self.auto_reset = auto_reset
+        self.rng = np.random.default_rng(seed)
+        self.speed = 150.0      # 与 Player.speed 相同(像素/秒)
+        self.capacity = 3       # 与 Player.max_packages 相同
+        self.radius = 10        # 与 Player.radius 相同(像素)
+
+        self._load_maps(maps)
+
+        n, p = num_envs, packages_per_env
+        self.x = np.zeros(n)
+        self.y = np.zeros(n)
+        self.carrying = np.zeros(n, dtype=np.int64)
+        self.time = np.zeros(n)                 # 剩余时间(游戏内分钟)
+        self.score = np.zeros(n, dtype=np.int64)
+        self.done = np.zeros(n, dtype=bool)
+        self.completed = np.zeros(n, dtype=bool)
+
+        self.pkg_start = np.zeros((n, p, 2), dtype=np.int64)
+        self.pkg_dest = np.zeros((n, p, 2), dtype=np.int64)
+        self.pkg_deadline = np.zeros((n, p))
+        self.pkg_value = np.zeros((n, p), dtype=np.int64)
+        self.pkg_pickup = np.full((n, p), np.nan)
+        self.pkg_status = np.zeros((n, p), dtype=np.uint8)
+
+        self.reset()
+
+    def _load_maps(self, maps):
+        """
+        把每张不同的地图的快递站图层堆叠为 (M, H, W)，
+        并为每张不同的地图预先确定各配送点的快递站和从该快递站出发的路径长度
+        """
+        unique = {}
+        for game_map in maps:
+            unique.setdefault(id(game_map), game_map)
+        max_points = max(len(m.delivery_points) for m in unique.values())
+
+        per_map = {}
+        for key, game_map in unique.items():
+            pathfinder = AStar(game_map)
+            points = np.zeros((max_points, 2), dtype=np.int64)
+            depots = np.zeros((max_points, 2), dtype=np.int64)
+            lengths = np.full(max_points, -1, dtype=np.int64)  # -1 表示不可达
+            for i, point in enumerate(game_map.delivery_points):
+                points[i] = point
+                depot = assign_depot(game_map, point)
+                path = pathfinder.find_path(depot, point) if depot is not None else []
+                if path:
+                    depots[i] = depot
+                    lengths[i] = len(path)
+            if not (lengths >= 0).any():
+                raise ValueError("地图上没有可以到达的配送点")
+            depot_mask = np.zeros((self.height, self.width), dtype=bool)
+            xs, ys = zip(*game_map.get_depots())
+            depot_mask[list(ys), list(xs)] = True
+            per_map[key] = (game_map.start_point, points, lengths, depots, depot_mask)
+
+        rows = [per_map[id(m)] for m in maps]
+        # 圆形碰撞检测交给各地图的 Map.walkable_at(按格子的净空距离)，共享同一张地图的环境只检查一次
+        slot = {key: i for i, key in enumerate(unique)}
+        self._maps = list(unique.values())
+        self._map_index = np.array([slot[id(m)] for m in maps], dtype=np.int64)
+        self._map_envs = [np.flatnonzero(self._map_index == i) for i in range(len(self._maps))]
+        self.start = np.array([row[0] for row in rows], dtype=np.int64)
+        self.delivery_points = np.stack([row[1] for row in rows])
+        self.delivery_lengths = np.stack([row[2] for row in rows])
+        self.delivery_depots = np.stack([row[3] for row in rows])     # 各配送点的包裹从哪个快递站发出
+        self.depot_mask = np.stack([per_map[key][4] for key in unique])   # 按 _map_index 取各环境的图层
+        self._env_index = np.arange(len(maps))
+
+    def reset(self, mask=None):
+        """
+        开始新的一天
+
+        Args:
+            mask: 需要重置的环境的布尔数组，None表示全部重置
+
+        Returns:
+            observation: 见 observe()
+        """
+        if mask is None:
+            mask = np.ones(self.num_envs, dtype=bool)
+        envs = np.flatnonzero(mask)
+        if len(envs) == 0:
+            return self.observe()
+
+        cell = self.cell_size
+        start = self.start[envs]
+        self.x[envs] = start[:, 0] * cell + cell // 2
+        self.y[envs] = start[:, 1] * cell + cell // 2
+        self.carrying[envs] = 0
+        self.time[envs] = DAY_MINUTES
+        self.score[envs] = 0
+        self.done[envs] = False
+        self.completed[envs] = False
+
+        # 在可到达的配送点中均匀随机选择目的地(不可达的点权重为0)
+        reachable = self.delivery_lengths[envs] >= 0
+        noise = self.rng.random((len(envs), self.num_packages, reachable.shape[1]))
+        choice = np.argmax(noise * reachable[:, None, :], axis=2)
+        rows = envs[:, None]
+        self.pkg_start[envs] = self.delivery_depots[rows, choice]
+        self.pkg_dest[envs] = self.delivery_points[rows, choice]
+        self.pkg_deadline[envs] = self.rng.integers(120, 241, size=(len(envs), self.num_packages))
+        self.pkg_value[envs] = 10 + self.delivery_lengths[rows, choice] * 2
+        self.pkg_pickup[envs] = np.nan
+        self.pkg_status[envs] = WAITING
+        return self.observe()
+
+    def _walkable_at(self, x, y, radius=0):
+        """批量版本的 Map.is_walkable: 半径为radius的圆不与不可通行格子重叠"""
+        if len(self._maps) == 1:
+            return self._maps[0].walkable_at(x, y, radius)
+        radius = np.broadcast_to(radius, x.shape)
+        result = np.zeros(x.shape, dtype=bool)
+        for game_map, envs in zip(self._maps, self._map_envs):
+            result[envs] = game_map.walkable_at(x[envs], y[envs], radius[envs])
+        return result
+
+    def step(self, actions):
+        """
+        所有环境同时前进一步
+
+        Args:
+            actions: 长度为N的整数数组，取值见 ACTION_DIRECTIONS
+
+        Returns:
+            (observation, reward, done): reward 为本步得分，done 为本步结束的环境。
+            开启 auto_reset 时结束的环境已被重置，observation 为新一天的初始状态
+        """
+        active = ~self.done
+        reward = np.zeros(self.num_envs, dtype=np.int64)
+
+        # 移动: 与 Player._move_by_input 相同，先整体移动，不可行走时依次尝试水平、垂直移动
+        direction = ACTION_DIRECTIONS[np.asarray(actions)]
+        step = self.speed * self.dt
+        new_x = self.x + direction[:, 0] * step
+        new_y = self.y + direction[:, 1] * step
+        radius = np.where(self._walkable_at(self.x, self.y, self.radius), self.radius, 0)
+        both = self._walkable_at(new_x, new_y, radius)
+        horizontal = ~both & self._walkable_at(new_x, self.y, radius)
+        vertical = ~both & ~horizontal & self._walkable_at(self.x, new_y, radius)
+        move_x = active & (both | horizontal)
+        move_y = active & (both | vertical)
+        self.x = np.where(move_x, new_x, self.x)
+        self.y = np.where(move_y, new_y, self.y)
+
+        game_time = DAY_MINUTES - self.time
+        status = self.pkg_status
+        live = active[:, None]
+
+        # 过期: 超过截止时间仍未拾取
+        status[live & (status == WAITING) & (game_time[:, None] > self.pkg_deadline)] = EXPIRED
+
+        # 拾取: 在包裹所在的快递站按包裹顺序拾取，直到背包装满
+        player_cell = np.stack([np.floor_divide(self.x, self.cell_size),
+                                np.floor_divide(self.y, self.cell_size)], axis=1).astype(np.int64)
+        at_depot = (self.pkg_start == player_cell[:, None, :]).all(axis=2)
+        eligible = live & (status == WAITING) & at_depot
+        free = self.capacity - self.carrying
+        picked = eligible & (np.cumsum(eligible, axis=1) <= free[:, None])
+        status[picked] = PICKED
+        self.pkg_pickup[picked] = np.broadcast_to(game_time[:, None], picked.shape)[picked]
+        self.carrying += picked.sum(axis=1)
+
+        # 配送: 得分规则与 Package.deliver 相同
+        at_dest = (self.pkg_dest == player_cell[:, None, :]).all(axis=2)
+        delivered = live & (status == PICKED) & at_dest
+        bonus = np.maximum(0, self.pkg_deadline - game_time[:, None]) / 30
+        points = (self.pkg_value * (1 + bonus)).astype(np.int64)
+        reward += np.where(delivered, points, 0).sum(axis=1)
+        status[delivered] = DELIVERED
+        self.carrying -= delivered.sum(axis=1)
+
+        # 提前完成: 没有等待和携带中的包裹，且回到任意一个快递站
+        remaining = ((status == WAITING) | (status == PICKED)).any(axis=1)
+        at_home = self.depot_mask[self._map_index,
+                                  np.clip(player_cell[:, 1], 0, self.height - 1),
+                                  np.clip(player_cell[:, 0], 0, self.width - 1)]
+        finished = active & ~remaining & (self.carrying == 0) & at_home
+        reward += np.where(finished, self.time.astype(np.int64), 0)
+        self.completed |= finished
+        self.score += reward
+
+        # 时间流逝
+        self.time = np.where(active, self.time - self.dt / 60.0, self.time)
+        out_of_time = active & (self.time <= 0)
+        self.time[out_of_time] = 0
+        just_done = finished | out_of_time
+        self.done |= just_done
+
+        if self.auto_reset and just_done.any():
+            self.reset(just_done)
+        return self.observe(), reward, just_done
+
+    def observe(self):
+        """
+        当前观测，形状为 (N, 4 + 4 * 包裹数) 的float32数组
+
+        每行依次为: 玩家x、y(按地图像素尺寸归一化)、携带比例、剩余时间比例，
+        然后每个包裹为: 状态、目的地x、y(归一化)、距截止时间(按240分钟归一化)
+        """
+        n, p = self.num_envs, self.num_packages
+        width_px = self.width * self.cell_size
+        height_px = self.height * self.cell_size
+        observation = np.empty((n, 4 + 4 * p), dtype=np.float32)
+        observation[:, 0] = self.x / width_px
+        observation[:, 1] = self.y / height_px
+        observation[:, 2] = self.carrying / self.capacity
+        observation[:, 3] = self.time / DAY_MINUTES
+        packages = observation[:, 4:].reshape(n, p, 4)
+        packages[:, :, 0] = self.pkg_status
+        packages[:, :, 1] = self.pkg_dest[:, :, 0] / self.width
+        packages[:, :, 2] = self.pkg_dest[:, :, 1] / self.height
+        packages[:, :, 3] = (self.pkg_deadline - (DAY_MINUTES - self.time)[:, None]) / 240
+        return observation
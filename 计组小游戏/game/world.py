@@ -0,0 +1,531 @@
+"""
+分块加载的城市级世界
+
+整个世界按 CHUNK_SIZE x CHUNK_SIZE 格的区块存储。摄像机和快递员附近的区块由后台线程
+按需生成(或从目录中的 chunk_{cx}_{cy}.npy 读取)，主线程每帧只取回已经完成的区块，
+从不等待磁盘读取或生成；内存占用超过预算时按最近最少使用的顺序释放远处的区块。
+跨区块寻路需要的区块由寻路器固定(pin)，在查询完成(release)之前一直保留请求且不被释放。
+
+用法:
+    with ChunkedWorld(seed=1, chunks=(64, 64)) as world:
+        pathfinder = ChunkPathfinder(world)
+        # 每帧
+        world.update([(player.x, player.y)])
+        world.draw(screen, camera)
+
+查询接口(get_terrain_type、get_terrain_cost、is_walkable、grid_to_pixel、pixel_to_grid)
+与 Map 相同，坐标都是整个世界的坐标，跨区块边界无需特殊处理。尚未加载的区块视为不可通行。
+"""
+import logging
+import math
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .map import Map, render_terrain
+from .pathfinding import AStar
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 32   # 区块边长(格子数)
+BLOCK_SIZE = 8    # 街区边长(格子数)，道路沿街区边界铺设，CHUNK_SIZE 必须是它的整数倍
+
+
+def generate_chunk(seed, cx, cy, size=CHUNK_SIZE):
+    """
+    生成一个区块的地形(只依赖种子和区块坐标，任意顺序生成的结果都相同)
+
+    道路铺在全局坐标为 BLOCK_SIZE 整数倍的行和列上，因此跨区块连续；
+    每个街区内随机放置一座建筑物或一片水域，部分街区边上的道路格设为配送点。
+    世界坐标 (0, 0) 为快递站。
+    """
+    grid = np.full((size, size), Map.GRASS, dtype=np.int8)
+    x0, y0 = cx * size, cy * size
+    grid[(np.arange(y0, y0 + size) % BLOCK_SIZE) == 0, :] = Map.ROAD
+    grid[:, (np.arange(x0, x0 + size) % BLOCK_SIZE) == 0] = Map.ROAD
+
+    rng = np.random.default_rng((seed, cx, cy))
+    for top in range(0, size, BLOCK_SIZE):
+        for left in range(0, size, BLOCK_SIZE):
+            roll = rng.random()
+            if roll < 0.65:
+                terrain = Map.WATER if roll < 0.08 else Map.BUILDING
+                # 与街区边界的道路之间至少留一格草地
+                h, w = rng.integers(2, BLOCK_SIZE - 2, size=2)
+                r, c = rng.integers(2, BLOCK_SIZE - h), rng.integers(2, BLOCK_SIZE - w)
+                grid[top + r:top + r + h, left + c:left + c + w] = terrain
+            if rng.random() < 0.3:
+                # 街区上边的道路格
+                grid[top, left + rng.integers(1, BLOCK_SIZE)] = Map.DELIVERY_POINT
+
+    if cx == 0 and cy == 0:
+        grid[0, 0] = Map.START_POINT
+    return grid
+
+
+def render_chunk(grid, cell_size):
+    """
+    把区块地形渲染为surface，外观与 Map.draw 相同
+
+    在后台线程中调用: 只使用numpy和软件surface，不依赖显示窗口。
+    """
+    return render_terrain(grid, cell_size, grid_lines=True)
+
+
+class Chunk:
+    """一个已加载的区块"""
+    __slots__ = ("key", "grid", "delivery_points", "surface")
+
+    def __init__(self, key, grid, surface):
+        self.key = key
+        self.grid = grid
+        self.surface = surface
+        cx, cy = key
+        size = grid.shape[0]
+        ys, xs = np.nonzero(grid == Map.DELIVERY_POINT)
+        self.delivery_points = [(cx * size + int(x), cy * size + int(y)) for x, y in zip(xs, ys)]
+
+    @property
+    def nbytes(self):
+        """区块占用的内存(字节)"""
+        surface = self.surface
+        return self.grid.nbytes + surface.get_pitch() * surface.get_height()
+
+
+class ChunkedWorld:
+    """
+    按区块流式加载的世界
+
+    Args:
+        seed: 地形生成的随机种子
+        chunks: 世界大小 (横向区块数, 纵向区块数)
+        directory: 区块文件目录，存在 chunk_{cx}_{cy}.npy 时读取文件，否则生成
+        memory_budget: 已加载区块的内存预算(字节)
+        load_radius: 每个关注点周围需要加载的区块范围(区块数)
+        chunk_size: 区块边长(格子数)
+    """
+
+    def __init__(self, seed=0, chunks=(64, 64), directory=None, memory_budget=256 * 1024 * 1024,
+                 load_radius=1, chunk_size=CHUNK_SIZE):
+        if chunk_size % BLOCK_SIZE:
+            raise ValueError(f"区块边长必须是 {BLOCK_SIZE} 的整数倍")
+        self.seed = seed
+        self.chunks_x, self.chunks_y = chunks
+        self.chunk_size = chunk_size
+        self.cell_size = 30
+        self.width = self.chunks_x * chunk_size
+        self.height = self.chunks_y * chunk_size
+        self.start_point = (0, 0)
+        self.directory = directory
+        self.memory_budget = memory_budget
+        self.load_radius = load_radius
+
+        # 已加载的区块，按最近使用的顺序排列(最久未使用的在前)
+        self._chunks = OrderedDict()
+        self.memory_used = 0
+
+        # 已加载的区块集合改变时递增
+        self.version = 0
+        self._delivery_points = None
+
+        # 后台加载线程: 请求列表按距离排序，每帧整体替换，不再需要的请求自然被丢弃
+        self._condition = threading.Condition()
+        self._requests = []
+        self._loading = None
+        self._results = []
+        self._failed = set()
+        self._stopped = False
+        self._loader = None
+
+        # 查询固定的区块: 持有者 -> 区块列表，每帧与关注点附近的区块合并请求，release 之前不释放
+        self._pinned = {}
+
+        # 统计数据
+        self.loaded_count = 0
+        self.evicted_count = 0
+
+    # ---- 区块管理 ----
+
+    def chunk_key(self, grid_x, grid_y):
+        """网格坐标所在的区块坐标"""
+        return (grid_x // self.chunk_size, grid_y // self.chunk_size)
+
+    def _in_world(self, key):
+        return 0 <= key[0] < self.chunks_x and 0 <= key[1] < self.chunks_y
+
+    def _start_loader(self):
+        if self._loader is None:
+            self._loader = threading.Thread(target=self._load_loop, name="chunk-loader", daemon=True)
+            self._loader.start()
+
+    def _load_loop(self):
+        while True:
+            with self._condition:
+                while not self._requests and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                key = self._loading = self._requests.pop(0)
+            try:
+                chunk = self._load(key)
+            except Exception:
+                logger.exception("区块 %s 加载失败", key)
+                chunk = None
+            with self._condition:
+                self._results.append((key, chunk))
+                self._loading = None
+                self._condition.notify_all()
+
+    def _load(self, key):
+        """在后台线程中读取或生成一个区块"""
+        cx, cy = key
+        grid = None
+        if self.directory is not None:
+            path = os.path.join(self.directory, f"chunk_{cx}_{cy}.npy")
+            if os.path.exists(path):
+                grid = np.load(path).astype(np.int8)
+        if grid is None:
+            grid = generate_chunk(self.seed, cx, cy, self.chunk_size)
+        return Chunk(key, grid, render_chunk(grid, self.cell_size))
+
+    def save_chunk(self, key, directory=None):
+        """把一个已加载的区块写入区块文件目录(读取时优先于生成)"""
+        directory = directory or self.directory
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, f"chunk_{key[0]}_{key[1]}.npy"), self._chunks[key].grid)
+
+    def wanted_chunks(self, focus_points):
+        """关注点(像素坐标)周围需要加载的区块，按到最近关注点的距离排序"""
+        span = self.chunk_size * self.cell_size
+        distance = {}
+        for x, y in focus_points:
+            fx, fy = x / span, y / span
+            cx, cy = int(fx), int(fy)
+            for ky in range(cy - self.load_radius, cy + self.load_radius + 1):
+                for kx in range(cx - self.load_radius, cx + self.load_radius + 1):
+                    key = (kx, ky)
+                    if self._in_world(key):
+                        d = (kx + 0.5 - fx) ** 2 + (ky + 0.5 - fy) ** 2
+                        if d < distance.get(key, float("inf")):
+                            distance[key] = d
+        return sorted(distance, key=distance.get)
+
+    def request(self, keys, replace=True):
+        """
+        把需要加载的区块交给后台线程(不等待)
+
+        Args:
+            keys: 区块坐标列表，按加载的优先顺序排列
+            replace: 为True时替换之前尚未开始的请求，否则追加在后面
+
+        Returns:
+            pending: 尚未加载完成的区块数
+        """
+        with self._condition:
+            requests = list(keys) if replace else self._requests + [key for key in keys if key not in self._requests]
+            self._requests = [key for key in requests
+                              if key not in self._chunks and key not in self._failed and key != self._loading
+                              and self._in_world(key)]
+            pending = len(self._requests) + (self._loading is not None)
+            if self._requests:
+                self._start_loader()
+                self._condition.notify()
+        return pending
+
+    def pin(self, keys, owner):
+        """
+        为一次查询(例如 ChunkPathfinder 的跨区块寻路)固定需要的区块
+
+        缺少的区块立即请求加载，之后每帧的 update 都保留这些请求，已加载的区块也不会因为
+        超出内存预算被释放，直到调用 release(owner)。同一个持有者再次调用时替换之前的区块。
+
+        Returns:
+            pending: 尚未加载完成的区块数
+        """
+        keys = list(keys)
+        self._pinned[owner] = keys
+        return self.request(keys, replace=False)
+
+    def release(self, owner):
+        """取消 owner 固定的区块(查询完成时调用)"""
+        self._pinned.pop(owner, None)
+
+    def _collect(self):
+        """取回后台线程已完成的区块(不阻塞)"""
+        with self._condition:
+            results, self._results = self._results, []
+        for key, chunk in results:
+            if chunk is None:
+                self._failed.add(key)
+                continue
+            old = self._chunks.pop(key, None)
+            if old is not None:
+                self.memory_used -= old.nbytes
+            self._chunks[key] = chunk
+            self.memory_used += chunk.nbytes
+            self.loaded_count += 1
+        if results:
+            self._changed()
+        return len(results)
+
+    def _evict(self, keep):
+        """内存超过预算时释放最久未使用的区块(keep中的区块除外)"""
+        evicted = 0
+        for key in list(self._chunks):
+            if self.memory_used <= self.memory_budget:
+                break
+            if key in keep:
+                continue
+            self.memory_used -= self._chunks.pop(key).nbytes
+            evicted += 1
+        if evicted:
+            self.evicted_count += evicted
+            self._changed()
+            logger.debug("释放 %d 个区块，内存占用 %.1f MB", evicted, self.memory_used / 1e6)
+
+    def _changed(self):
+        self.version += 1
+        self._delivery_points = None
+
+    def update(self, focus_points):
+        """
+        每帧调用: 取回已完成的区块，请求关注点附近缺少的区块，并在超出内存预算时释放远处的区块
+
+        Args:
+            focus_points: 摄像机中心和各快递员的像素坐标
+
+        Returns:
+            pending: 关注点附近和查询固定的区块中尚未加载完成的区块数
+        """
+        self._collect()
+        wanted = self.wanted_chunks(focus_points)
+        for key in wanted:
+            if key in self._chunks:
+                self._chunks.move_to_end(key)
+        # 查询固定的区块排在关注点附近的区块之后
+        keep = dict.fromkeys(wanted)
+        for keys in self._pinned.values():
+            keep.update(dict.fromkeys(keys))
+        pending = self.request(list(keep))
+        self._evict(keep)
+        return pending
+
+    def wait(self, timeout=None):
+        """等待已请求的区块全部加载完成(只用于工具和测试，帧循环中不要调用)"""
+        with self._condition:
+            done = self._condition.wait_for(lambda: not self._requests and self._loading is None, timeout)
+        self._collect()
+        return done
+
+    def close(self):
+        """停止后台线程"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        if self._loader is not None:
+            self._loader.join()
+            self._loader = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def loaded_chunks(self):
+        return list(self._chunks)
+
+    def is_loaded(self, key):
+        return key in self._chunks
+
+    def is_failed(self, key):
+        """区块加载失败(不会再次请求，查询时按不可通行处理)"""
+        return key in self._failed
+
+    @property
+    def delivery_points(self):
+        """已加载区块中的配送点"""
+        if self._delivery_points is None:
+            self._delivery_points = [point for chunk in self._chunks.values() for point in chunk.delivery_points]
+        return self._delivery_points
+
+    # ---- 与 Map 相同的查询接口 ----
+
+    def cell_type(self, grid_x, grid_y):
+        """网格坐标的地形类型，超出世界或区块未加载时为-1"""
+        chunk = self._chunks.get((grid_x // self.chunk_size, grid_y // self.chunk_size))
+        if chunk is None or grid_x < 0 or grid_y < 0:
+            return -1
+        return int(chunk.grid[grid_y % self.chunk_size, grid_x % self.chunk_size])
+
+    def get_terrain_type(self, x, y):
+        """获取指定位置(像素坐标)的地形类型"""
+        return self.cell_type(int(x // self.cell_size), int(y // self.cell_size))
+
+    def get_terrain_cost(self, x, y):
+        """获取指定位置的通行成本"""
+        return Map.TERRAIN_COSTS.get(self.get_terrain_type(x, y), -1)
+
+    def is_walkable(self, x, y, radius=0):
+        """
+        检查以像素坐标 (x, y) 为中心、半径为radius的圆是否不与不可通行格子重叠
+
+        与 Map.is_walkable 的判定相同(距离从像素中心算起)，只检查圆的外接正方形覆盖的格子，
+        可以跨越区块边界。
+        """
+        if Map.TERRAIN_COSTS.get(self.get_terrain_type(x, y), -1) < 0:
+            return False
+        if radius <= 0:
+            return True
+        cell = self.cell_size
+        px, py = int(x) + 0.5, int(y) + 0.5
+        limit = radius * radius
+        for gy in range(math.ceil((py - radius) / cell) - 1, int((py + radius) // cell) + 1):
+            for gx in range(math.ceil((px - radius) / cell) - 1, int((px + radius) // cell) + 1):
+                if Map.TERRAIN_COSTS.get(self.cell_type(gx, gy), -1) >= 0:
+                    continue
+                dx = max(gx * cell - px, 0, px - (gx + 1) * cell)
+                dy = max(gy * cell - py, 0, py - (gy + 1) * cell)
+                if dx * dx + dy * dy <= limit:
+                    return False
+        return True
+
+    def grid_to_pixel(self, grid_x, grid_y):
+        """将网格坐标转换为像素坐标(中心点)"""
+        return (grid_x * self.cell_size + self.cell_size // 2,
+                grid_y * self.cell_size + self.cell_size // 2)
+
+    def pixel_to_grid(self, pixel_x, pixel_y):
+        """将像素坐标转换为网格坐标"""
+        return (pixel_x // self.cell_size, pixel_y // self.cell_size)
+
+    def window(self, cx0, cy0, cx1, cy1):
+        """
+        把区块范围 [cx0, cx1) x [cy0, cy1) 拼接为一个地形数组，未加载的区块填充为建筑物
+
+        Returns:
+            (grid, loaded): loaded 为范围内已加载区块的集合
+        """
+        size = self.chunk_size
+        grid = np.full(((cy1 - cy0) * size, (cx1 - cx0) * size), Map.BUILDING, dtype=int)
+        loaded = set()
+        for cy in range(cy0, cy1):
+            for cx in range(cx0, cx1):
+                chunk = self._chunks.get((cx, cy))
+                if chunk is not None:
+                    grid[(cy - cy0) * size:(cy - cy0 + 1) * size, (cx - cx0) * size:(cx - cx0 + 1) * size] = chunk.grid
+                    loaded.add((cx, cy))
+        return grid, frozenset(loaded)
+
+    # ---- 绘制 ----
+
+    def draw(self, screen, camera=(0, 0)):
+        """
+        绘制与屏幕相交的已加载区块(区块的surface在后台线程中已经渲染好)
+
+        Args:
+            screen: 目标surface
+            camera: 屏幕左上角的世界像素坐标
+        """
+        span = self.chunk_size * self.cell_size
+        left, top = camera
+        right, bottom = left + screen.get_width(), top + screen.get_height()
+        for cy in range(max(0, int(top // span)), min(self.chunks_y, int(bottom // span) + 1)):
+            for cx in range(max(0, int(left // span)), min(self.chunks_x, int(right // span) + 1)):
+                chunk = self._chunks.get((cx, cy))
+                if chunk is not None:
+                    screen.blit(chunk.surface, (cx * span - left, cy * span - top))
+
+
+class ChunkPathfinder:
+    """
+    分块世界上的寻路器，接口与 AStar.find_path 相同(坐标为世界网格坐标)
+
+    每次查询把覆盖起终点(外扩margin格)的已加载区块拼接为一张 Map，在上面运行 AStar。
+    拼接结果按区块范围和已加载区块集合缓存，范围内的后续查询直接复用(包括 AStar 的路径缓存)。
+    范围内缺少区块时用 ChunkedWorld.pin 固定范围内的区块并返回空路径，区块加载完成后再次
+    查询即可；加载失败的区块不算缺少，与未加载的区块一样按不可通行处理。找到路径或确定不可达时
+    release。找不到路径时扩大一次范围重试。
+    """
+
+    def __init__(self, world, margin=16, heuristic="octile"):
+        self.world = world
+        self.margin = margin
+        self.heuristic = heuristic
+        self.any_angle = False
+        self.radius = 0
+        self._window = None   # (区块范围, 已加载区块集合, AStar)
+        self.windows_built = 0
+
+    def _pathfinder(self, box):
+        """取得区块范围box对应的 AStar，范围或已加载的区块改变时重新拼接"""
+        cached = self._window
+        if cached is not None and cached[0] == box:
+            loaded = frozenset(key for key in self._keys(box) if self.world.is_loaded(key))
+            if loaded == cached[1]:
+                return cached[2]
+        grid, loaded = self.world.window(*box)
+        game_map = Map(grid.shape[1], grid.shape[0], generate=False)
+        game_map.cell_size = self.world.cell_size
+        size = self.world.chunk_size
+        origin = (box[0] * size, box[1] * size)
+        local = [(x - origin[0], y - origin[1]) for x, y in self.world.delivery_points]
+        game_map.set_grid(grid, (self.world.start_point[0] - origin[0], self.world.start_point[1] - origin[1]),
+                          [(x, y) for x, y in local if 0 <= x < grid.shape[1] and 0 <= y < grid.shape[0]])
+        pathfinder = AStar(game_map, self.heuristic)
+        self._window = (box, loaded, pathfinder)
+        self.windows_built += 1
+        return pathfinder
+
+    @staticmethod
+    def _keys(box):
+        cx0, cy0, cx1, cy1 = box
+        return {(cx, cy) for cy in range(cy0, cy1) for cx in range(cx0, cx1)}
+
+    def _box(self, start, end, margin):
+        world = self.world
+        size = world.chunk_size
+        cx0 = max(0, (min(start[0], end[0]) - margin) // size)
+        cy0 = max(0, (min(start[1], end[1]) - margin) // size)
+        cx1 = min(world.chunks_x, (max(start[0], end[0]) + margin) // size + 1)
+        cy1 = min(world.chunks_y, (max(start[1], end[1]) + margin) // size + 1)
+        return (int(cx0), int(cy0), int(cx1), int(cy1))
+
+    def find_path(self, start, end, any_angle=None, radius=None):
+        """
+        计算从start到end的路径(世界网格坐标)
+
+        Returns:
+            path: 网格坐标列表；范围内的区块尚未加载或不可达时返回空列表
+        """
+        if any_angle is None:
+            any_angle = self.any_angle
+        if radius is None:
+            radius = self.radius
+        start = (int(start[0]), int(start[1]))
+        end = (int(end[0]), int(end[1]))
+        if not (0 <= start[0] < self.world.width and 0 <= start[1] < self.world.height and
+                0 <= end[0] < self.world.width and 0 <= end[1] < self.world.height):
+            return []
+
+        path = []
+        for margin in (self.margin, self.margin * 4):
+            box = self._box(start, end, margin)
+            keys = self._keys(box)
+            missing = [key for key in keys if not self.world.is_loaded(key) and not self.world.is_failed(key)]
+            if missing:
+                self.world.pin(sorted(keys), self)
+            pathfinder = self._pathfinder(box)
+            ox, oy = box[0] * self.world.chunk_size, box[1] * self.world.chunk_size
+            path = pathfinder.find_path((start[0] - ox, start[1] - oy), (end[0] - ox, end[1] - oy),
+                                        any_angle, radius)
+            if path:
+                self.world.release(self)
+                return [(x + ox, y + oy) for x, y in path]
+            if missing:
+                return path  # 等区块加载完成后再扩大范围
+        self.world.release(self)
+        return path
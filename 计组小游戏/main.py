@@ -1,53 +1,204 @@
-import pygame
+import time
+_START_TIME = time.perf_counter()  # 进程启动时间，用于统计首帧耗时
+
+import argparse
+import json
+import logging
 import sys
 import os
-from game.game_manager import GameManager
 
-# 初始化Pygame
-pygame.init()
+_import_start = time.perf_counter()
+import pygame
+from game.profiler import profiler
+profiler.record_stage("import pygame", time.perf_counter() - _import_start)
 
 # 游戏设置
 SCREEN_WIDTH = 800
 SCREEN_HEIGHT = 600
 TITLE = "校园快递配送模拟器"
 
-# 创建游戏窗口
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-pygame.display.set_caption(TITLE)
+logger = logging.getLogger(__name__)
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description=TITLE)
+    parser.add_argument("--log-level", default="WARNING",
+                        help="日志级别: DEBUG, INFO, WARNING, ERROR")
+    parser.add_argument("--profile", action="store_true",
+                        help="开启每帧性能统计(F3键显示性能面板)")
+    parser.add_argument("--profile-out", metavar="FILE",
+                        help="退出时把最近帧的性能数据导出到FILE(.csv或.json)")
+    parser.add_argument("--seed", type=int,
+                        help="随机种子，相同种子和相同输入可复现整局游戏")
+    parser.add_argument("--record", metavar="FILE",
+                        help="把随机种子和输入事件录制到FILE")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="不显示窗口，以最快速度回放录制文件")
+    parser.add_argument("--replay-out", metavar="FILE",
+                        help="回放结束后把最终状态写入FILE(JSON)，便于比较不同版本")
+    parser.add_argument("--telemetry", metavar="DIR",
+                        help="把配送事件和快递员位置写入DIR下的遥测分块文件")
+    parser.add_argument("--no-idle", action="store_true",
+                        help="静止时也保持60帧，不降低帧率、不阻塞等待输入")
+    parser.add_argument("--orders", metavar="FILE",
+                        help="按订单日志(CSV或二进制)的到达时间生成包裹，代替随机生成")
+    parser.add_argument("--addresses", metavar="FILE",
+                        help="订单日志的地址表(CSV: address,x,y)，默认把地址散列到地图的配送点")
+    parser.add_argument("--memory-report", metavar="FILE",
+                        help="定期把各子系统的内存估计追加到FILE(每行一个JSON对象)")
+    parser.add_argument("--memory-interval", type=float, default=60.0, metavar="SEC",
+                        help="内存统计的间隔(游戏中经过的模拟时间，秒，默认60)")
+    parser.add_argument("--memory-budget", type=float, metavar="MB",
+                        help="全部子系统的内存预算，超出时释放缓存并归档已完成的包裹")
+    parser.add_argument("--archive", metavar="FILE",
+                        help="超出内存预算时把已完成的包裹追加到FILE(CSV)")
+    parser.add_argument("--trace-malloc", action="store_true",
+                        help="开启tracemalloc，每次内存统计时报告分配增长最多的代码位置")
+    return parser.parse_args()
+
+def _open_telemetry(args):
+    """按命令行参数创建遥测记录器"""
+    if not args.telemetry:
+        return None
+    from game.telemetry import Telemetry
+    return Telemetry(args.telemetry)
+
+def _memory_accountant(args):
+    """按命令行参数创建内存统计"""
+    from game.memory import MemoryAccountant, MB
+    budgets = {"total": args.memory_budget * MB} if args.memory_budget else None
+    return MemoryAccountant(interval=args.memory_interval, budgets=budgets,
+                            report_path=args.memory_report, trace=args.trace_malloc)
 
-# 确保assets目录存在
-os.makedirs("assets/images", exist_ok=True)
-os.makedirs("assets/sounds", exist_ok=True)
+def _open_orders(args):
+    """按命令行参数打开订单日志"""
+    if not args.orders:
+        return None
+    from game.map import Map
+    from game.orders import AddressIndex, OrderFeed, open_log
+    index = AddressIndex.from_csv(args.addresses) if args.addresses else AddressIndex.for_map(Map())
+    return OrderFeed(lambda: open_log(args.orders, index), index)   # 可以重新打开，读档时回到存档的位置
+
+def run_replay(args):
+    """无界面回放录制文件并输出最终状态"""
+    from game.replay import replay
+    telemetry = _open_telemetry(args)
+    memory = _memory_accountant(args)
+    game_manager = replay(args.replay, telemetry, memory, args.archive)
+    memory.sample()  # 回放结束时的内存统计
+    memory.close()
+    if telemetry:
+        telemetry.close()
+    summary = json.dumps(game_manager.state_summary(), ensure_ascii=False, indent=1)
+    if args.replay_out:
+        with open(args.replay_out, "w", encoding="utf-8") as f:
+            f.write(summary)
+    else:
+        print(summary)
 
 def main():
-    # 初始化游戏管理器
-    game_manager = GameManager(screen)
-    
-    # 游戏主循环
-    clock = pygame.time.Clock()
+    args = parse_args()
+    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.WARNING),
+                        format="%(levelname)s %(name)s: %(message)s")
+    if args.profile or args.profile_out:
+        profiler.enable(True)
+
+    if args.replay:
+        run_replay(args)
+        if args.profile_out:
+            profiler.export(args.profile_out)
+        return
+
+    # 分阶段启动，每个阶段的耗时记录在 profiler.startup 中
+    # 游戏模块(包括numpy)在这里才导入，以便单独统计导入耗时
+    with profiler.stage("import game"):
+        from game.game_manager import GameManager
+        from game.replay import InputRecorder
+        from game.frame_pacer import FramePacer
+
+    # 只初始化用到的显示和字体模块，不初始化音频等未使用的模块
+    with profiler.stage("pygame.init"):
+        pygame.display.init()
+        pygame.font.init()
+
+    # 创建游戏窗口
+    with profiler.stage("window"):
+        screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+        pygame.display.set_caption(TITLE)
+
+    # 确保assets目录存在
+    with profiler.stage("assets"):
+        os.makedirs("assets/images", exist_ok=True)
+        os.makedirs("assets/sounds", exist_ok=True)
+
+    # 初始化游戏管理器(字体、地图和初始包裹)
+    with profiler.stage("game manager"):
+        telemetry = _open_telemetry(args)
+        game_manager = GameManager(screen, seed=args.seed, telemetry=telemetry, orders=_open_orders(args),
+                                   memory=_memory_accountant(args), archive=args.archive)
+    recorder = None
+    if args.record:
+        recorder = InputRecorder(args.record, game_manager.seed, screen.get_size())
+
+    # 游戏主循环，静止时由 FramePacer 降低帧率并阻塞等待输入
+    pacer = FramePacer(fps=60, enabled=not args.no_idle)
+    pacer.start()
+    dt_ms = 0  # 上一帧的时间间隔(毫秒)，作为本帧的模拟时间步长
     running = True
-    
+
     while running:
+        profiler.begin_frame()
+
         # 处理事件
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-            game_manager.handle_event(event)
-        
+        with profiler.section("handle_event"):
+            for event in pacer.events():
+                if event.type == pygame.QUIT:
+                    running = False
+                    continue
+                if recorder:
+                    recorder.record_event(event)
+                game_manager.handle_event(event)
+
         # 更新游戏状态
-        game_manager.update()
-        
+        with profiler.section("update"):
+            if recorder:
+                recorder.record_frame(dt_ms)
+            game_manager.update(dt_ms / 1000.0)
+
         # 绘制游戏画面
-        screen.fill((255, 255, 255))  # 白色背景
-        game_manager.draw()
-        pygame.display.flip()
-        
+        with profiler.section("draw"):
+            screen.fill((255, 255, 255))  # 白色背景
+            game_manager.draw()
+            pygame.display.flip()
+
+        profiler.end_frame()
+
+        if profiler.time_to_first_frame is None:
+            profiler.time_to_first_frame = time.perf_counter() - _START_TIME
+            logger.info("启动耗时: %s", profiler.startup_report())
+
         # 控制帧率
-        clock.tick(60)
-    
+        dt_ms = pacer.tick(game_manager.is_idle(), game_manager.next_event_delay())
+        if pacer.woken:
+            # 空闲等待被输入打断: 先推进等待期间的时间，下一帧再处理输入，
+            # 避免输入后的第一帧以整个等待时间为步长移动
+            if recorder:
+                recorder.record_frame(dt_ms)
+            game_manager.update(dt_ms / 1000.0)
+            dt_ms = 0
+
+    logger.info("CPU占用: %s", pacer.report())
+    if recorder:
+        recorder.close()
+    if telemetry:
+        telemetry.close()
+    game_manager.memory.close()
+    if args.profile_out:
+        profiler.export(args.profile_out)
+
     # 退出游戏
     pygame.quit()
     sys.exit()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
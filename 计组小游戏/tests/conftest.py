@@ -0,0 +1,26 @@
+"""
+测试公用设置
+
+与 benchmarks/harness.py 相同: 无显示的机器上使用SDL的dummy驱动，并让测试可以直接导入 game 包。
+"""
+import os
+import sys
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import pygame
+import pytest
+
+
+@pytest.fixture
+def screen():
+    """初始化pygame并返回一个屏幕大小的离屏surface"""
+    pygame.display.init()
+    pygame.font.init()
+    pygame.display.set_mode((1, 1))
+    return pygame.Surface((800, 600))
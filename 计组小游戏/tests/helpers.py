@@ -0,0 +1,90 @@
+"""
+测试公用的地图、订单日志和参考实现
+
+参考实现只使用 Map 的地形和成本定义，不依赖 game.search_grid 的成本表，
+用来检查各种搜索结果的成本。make_order_feed 和 run_frames 也被 benchmarks/run_benchmarks.py 使用。
+"""
+import heapq
+import math
+
+import numpy as np
+
+from game.map import Map
+from game.orders import ORDER_DTYPE, AddressIndex, OrderFeed
+
+DIAGONAL = 1.414
+DIRECTIONS = [(0, -1), (1, 0), (0, 1), (-1, 0), (1, -1), (1, 1), (-1, 1), (-1, -1)]
+
+
+def random_map(width, height, density, seed):
+    """默认校园地图的草地上按density比例随机放置建筑物，道路、起点和配送点不变"""
+    game_map = Map(width, height)
+    rng = np.random.default_rng(seed)
+    obstacles = (rng.random((height, width)) < density) & (game_map.grid == Map.GRASS)
+    game_map.grid[obstacles] = Map.BUILDING
+    game_map.version += 1
+    return game_map
+
+
+def walkable_cells(game_map):
+    ys, xs = np.nonzero(game_map.get_cost_grid() >= 0)
+    return list(zip(xs.tolist(), ys.tolist()))
+
+
+def step_cost(game_map, a, b):
+    """从相邻格子a走到b的成本: b的地形成本，对角线乘以 DIAGONAL；不可通行为inf"""
+    cost = game_map.TERRAIN_COSTS[int(game_map.grid[b[1], b[0]])]
+    if cost < 0:
+        return math.inf
+    return cost * (DIAGONAL if a[0] != b[0] and a[1] != b[1] else 1.0)
+
+
+def path_cost(game_map, path):
+    """网格路径(相邻格子序列)的成本"""
+    for a, b in zip(path, path[1:]):
+        assert max(abs(a[0] - b[0]), abs(a[1] - b[1])) == 1, f"路径不连续: {a} -> {b}"
+    return sum(step_cost(game_map, a, b) for a, b in zip(path, path[1:]))
+
+
+def dijkstra(game_map, source):
+    """从source到每个格子的最短成本 {(x, y): 成本}，八方向移动，不切角限制"""
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    while heap:
+        d, (x, y) = heapq.heappop(heap)
+        if d > dist[(x, y)]:
+            continue
+        for dx, dy in DIRECTIONS:
+            neighbor = (x + dx, y + dy)
+            if not (0 <= neighbor[0] < game_map.width and 0 <= neighbor[1] < game_map.height):
+                continue
+            nd = d + step_cost(game_map, (x, y), neighbor)
+            if nd < dist.get(neighbor, math.inf):
+                dist[neighbor] = nd
+                heapq.heappush(heap, (nd, neighbor))
+    return dist
+
+
+def make_order_feed(game_map, count, seed, minutes, chunk_rows=64):
+    """
+    内存中的订单日志，返回可以重新打开的 OrderFeed
+
+    count 条订单均匀到达于开始后的 minutes 游戏分钟内(60帧为1秒真实时间，即1/60游戏分钟)，
+    一部分地址无法解析。
+    """
+    index = AddressIndex.for_map(game_map)
+    rng = np.random.default_rng(seed)
+    orders = np.zeros(count, dtype=ORDER_DTYPE)
+    orders["time"] = np.sort(rng.random(count) * minutes)
+    orders["order_id"] = np.arange(count) + 3_000_000_000   # 超出 int32 的编号
+    orders["address"] = rng.integers(0, len(index.cells) * 11 // 10 + 1, count)
+    orders["deadline"] = rng.integers(20, 120, count)
+    orders["value"] = rng.integers(10, 80, count)
+    return OrderFeed(lambda: (orders[i:i + chunk_rows] for i in range(0, count, chunk_rows)), index)
+
+
+def run_frames(game_manager, frames):
+    """按住右方向键，以固定帧时间(1/60秒)运行frames帧"""
+    for _ in range(frames):
+        game_manager.player.moving_right = True
+        game_manager.update(1 / 60)
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from game.game_manager import GameManager
+from game.map import Map
+from game.orders import ORDER_DTYPE, AddressIndex, OrderFeed
+
+
+def single_order_feed(arrival, deadline):
+    orders = np.zeros(1, dtype=ORDER_DTYPE)
+    orders["time"] = arrival
+    orders["deadline"] = deadline
+    orders["value"] = 50
+    return OrderFeed([orders], AddressIndex.for_map(Map()))
+
+
+def set_game_time(game_manager, minutes):
+    game_manager.time = 480 - minutes
+
+
+def test_not_idle_while_spawns_pending(screen):
+    game_manager = GameManager(screen, seed=11)
+    assert game_manager.player.is_idle()
+    assert game_manager.package_manager.spawns_pending()
+    assert not game_manager.is_idle()
+    while game_manager.package_manager.spawns_pending():
+        game_manager.scheduler.update()
+    assert game_manager.is_idle()
+
+
+def test_next_event_delay_wakes_for_order_arrival(screen):
+    # 订单在第3.505分钟(第210.3秒)到达，不在时钟跳秒的时刻
+    game_manager = GameManager(screen, seed=1, orders=single_order_feed(3.505, 20.25))
+    # 玩家不在快递站上，到达的包裹保持等待状态
+    game_manager.player.x, game_manager.player.y = game_manager.map.grid_to_pixel(3, 1)
+    set_game_time(game_manager, 3.5)
+    assert game_manager.next_event_delay() == pytest.approx(0.3 + 0.001, abs=1e-4)
+    
+    # 醒来后的一帧仍按更新前的游戏时间处理订单，下一帧立即处理
+    game_manager.update(0.301)
+    assert game_manager.next_event_delay() == pytest.approx(0.001)
+    game_manager.update(0.0)
+    package, = game_manager.package_manager.packages
+    assert package.status == "WAITING"
+    
+    # 订单到达后等待包裹的截止时间(第23.755分钟)成为下一个变化
+    assert package.deadline == pytest.approx(23.755, abs=1e-4)
+    set_game_time(game_manager, 23.75)
+    assert game_manager.next_event_delay() == pytest.approx(0.3 + 0.001, abs=1e-4)
+
+
+def test_next_event_delay_without_changes(screen):
+    game_manager = GameManager(screen, seed=1, orders=single_order_feed(600.0, 20.0))
+    game_manager.time = 470 - 0.25 / 60  # 剩余 469:59.75，0.75秒后时钟跳秒
+    assert game_manager.next_event_delay() == pytest.approx(0.75 + 0.001)
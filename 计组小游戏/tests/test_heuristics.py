@@ -0,0 +1,39 @@
+import random
+
+import pytest
+
+from game.heuristics import create
+from game.pathfinding import AStar
+
+from helpers import dijkstra, path_cost, random_map, walkable_cells
+
+
+@pytest.mark.parametrize("name", ["octile", "alt"])
+def test_path_cost_matches_dijkstra(name):
+    game_map = random_map(40, 30, 0.25, seed=6)
+    pathfinder = AStar(game_map, heuristic=name)
+    cells = walkable_cells(game_map)
+    rng = random.Random(1)
+    for start in rng.sample(cells, 5):
+        reference = dijkstra(game_map, start)
+        for end in rng.sample(cells, 10):
+            path = pathfinder.find_path(start, end)
+            if end not in reference:
+                assert path == []
+                continue
+            assert path[0] == start and path[-1] == end
+            assert path_cost(game_map, path) == pytest.approx(reference[end])
+
+
+@pytest.mark.parametrize("name", ["octile", "alt"])
+def test_heuristic_is_admissible(name):
+    game_map = random_map(30, 20, 0.25, seed=8)
+    heuristic = create(name, game_map)
+    cells = walkable_cells(game_map)
+    for goal in random.Random(2).sample(cells, 5):
+        estimate = heuristic.bind(goal)
+        # 启发式不超过从start到goal的最短成本
+        for start in random.Random(3).sample(cells, 10):
+            cost = dijkstra(game_map, start).get(goal)
+            if cost is not None:
+                assert estimate(start) <= cost + 1e-9
@@ -0,0 +1,42 @@
+import pygame
+
+from game.map import Map
+
+from helpers import random_map
+
+
+def old_draw(game_map):
+    """surfarray 渲染之前的 Map.draw: 逐格画矩形和网格线"""
+    surface = pygame.Surface((game_map.width * game_map.cell_size, game_map.height * game_map.cell_size))
+    for y in range(game_map.height):
+        for x in range(game_map.width):
+            color = game_map.TERRAIN_COLORS.get(game_map.grid[y, x], (0, 0, 0))
+            rect = pygame.Rect(x * game_map.cell_size, y * game_map.cell_size, game_map.cell_size, game_map.cell_size)
+            pygame.draw.rect(surface, color, rect)
+            pygame.draw.rect(surface, (200, 200, 200), rect, 1)
+    return surface
+
+
+def draw(game_map):
+    surface = pygame.Surface((game_map.width * game_map.cell_size, game_map.height * game_map.cell_size))
+    game_map.draw(surface)
+    return surface
+
+
+def assert_same_pixels(a, b):
+    assert a.get_size() == b.get_size()
+    assert pygame.image.tobytes(a, "RGB") == pygame.image.tobytes(b, "RGB")
+
+
+def test_terrain_matches_old_draw(screen):
+    game_map = random_map(40, 30, 0.2, seed=2)
+    assert_same_pixels(draw(game_map), old_draw(game_map))
+
+
+def test_set_terrain_matches_old_draw(screen):
+    """set_terrain 只重绘改变的格子，结果与整张重画相同"""
+    game_map = Map()
+    draw(game_map)
+    for x, y, terrain in [(0, 0, Map.WATER), (5, 4, Map.BUILDING), (game_map.width - 1, 3, Map.ROAD)]:
+        game_map.set_terrain(x, y, terrain)
+    assert_same_pixels(draw(game_map), old_draw(game_map))
@@ -0,0 +1,39 @@
+from game.game_manager import GameManager
+from game.memory import MemoryAccountant
+
+
+def test_update_samples_on_game_time():
+    accountant = MemoryAccountant(interval=10.0)
+    accountant.register("values", lambda: 100)
+    assert accountant.update(now=0.0) is not None
+    assert accountant.update(now=9.5) is None
+    report = accountant.update(now=10.0)
+    assert report is not None and report["elapsed"] == 10.0
+    assert accountant.samples == 2
+
+
+def test_update_restarts_when_time_goes_back():
+    accountant = MemoryAccountant(interval=10.0)
+    accountant.register("values", lambda: 100)
+    accountant.update(now=0.0)
+    accountant.update(now=25.0)
+    assert accountant.update(now=5.0) is not None   # 读档回到更早的时间
+    assert accountant.update(now=14.0) is None
+    assert accountant.samples == 3
+
+
+def test_budget_enforced_on_same_frames(screen):
+    def run():
+        released = []
+        accountant = MemoryAccountant(interval=1.0, budgets={"total": 1})
+        game_manager = GameManager(screen, seed=3, memory=accountant)
+        for frame in range(16):
+            game_manager.update(0.25)
+            if accountant.last_report["released"]:
+                released.append(frame)
+                accountant.last_report["released"] = []
+        return released, game_manager.state_summary()
+
+    released, summary = run()
+    assert released == [0, 4, 8, 12]
+    assert run() == (released, summary)
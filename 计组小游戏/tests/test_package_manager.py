@@ -0,0 +1,21 @@
+import random
+
+from game.event_bus import EventBus
+from game.map import Map
+from game.package_manager import PackageManager
+from game.player import Player
+
+
+def test_spawn_on_occupied_depot_is_picked_up():
+    """新包裹生成在玩家正站着的快递站上时，下一次update就被拾取(玩家不会再进入这个格子)"""
+    game_map = Map()
+    bus = EventBus()
+    manager = PackageManager(game_map, rng=random.Random(0), bus=bus)
+    player = Player(game_map, bus=bus)
+    player.update(0)                    # 发布 CELL_ENTERED，玩家站在主快递站上
+    manager.update(0, player, 0)
+    destination = game_map.delivery_points[0]
+    manager._spawn(game_map.start_point, destination, 200, 1, [game_map.start_point, destination])
+    manager.update(0, player, 1)
+    assert manager.packages[-1].status == "PICKED"
+    assert player.current_packages == 1
@@ -0,0 +1,32 @@
+from game.map import Map
+from game.path_scheduler import PathScheduler
+from game.pathfinding import AStar
+
+
+def test_search_finished_on_submit_calls_back():
+    """提交时搜索就已完成(命中路径缓存)的任意角度查询在下一次 update 中完成并调用回调"""
+    game_map = Map()
+    scheduler = PathScheduler(AStar(game_map))
+    paths = []
+    query = (game_map.start_point, game_map.delivery_points[0])
+    for _ in range(2):   # 第二次提交时路径已在缓存中
+        scheduler.submit(*query, callback=paths.append, any_angle=True)
+        while len(scheduler):
+            scheduler.update()
+    assert len(paths) == 2 and paths[0] == paths[1]
+
+
+def test_restart_discards_smoothing():
+    """平滑进行到一半时换成新的搜索，结果与直接平滑新路径相同"""
+    game_map = Map()
+    pathfinder = AStar(game_map)
+    start, end = game_map.start_point, game_map.delivery_points[-1]
+    request = PathScheduler(pathfinder).submit(start, end, any_angle=True)
+    while not request.search.done:
+        request.advance(pathfinder, 100)
+    request.advance(pathfinder, 1)    # 开始平滑，只做一次视线检测
+    assert not request.done
+    request.restart(pathfinder.start_search(end, start, 0))
+    while not request.done:
+        request.advance(pathfinder, 100)
+    assert request.path == pathfinder.find_path(end, start, any_angle=True)
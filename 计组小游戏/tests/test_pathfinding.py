@@ -0,0 +1,88 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from game.pathfinding import AStar
+
+from helpers import random_map, walkable_cells
+
+
+def touches_cell(a, b, cell):
+    """线段a-b(格子中心坐标)是否与cell的闭合正方形相交，包括只擦过角点"""
+    t0, t1 = 0.0, 1.0
+    for p, d, lo, hi in ((a[0], b[0] - a[0], cell[0] - 0.5, cell[0] + 0.5),
+                         (a[1], b[1] - a[1], cell[1] - 0.5, cell[1] + 0.5)):
+        if d == 0:
+            if not lo <= p <= hi:
+                return False
+            continue
+        s0, s1 = sorted(((lo - p) / d, (hi - p) / d))
+        t0, t1 = max(t0, s0), min(t1, s1)
+    return t0 <= t1
+
+
+def test_smoothed_segments_avoid_blocked_cells():
+    game_map = random_map(40, 30, 0.25, seed=4)
+    pathfinder = AStar(game_map)
+    blocked = list(zip(*np.nonzero(game_map.get_cost_grid() < 0)[::-1]))
+    cells = walkable_cells(game_map)
+    rng = random.Random(5)
+    segments = 0
+    for _ in range(200):
+        start, end = rng.sample(cells, 2)
+        path = pathfinder.find_path(start, end, any_angle=True)
+        if not path:
+            continue
+        assert path[0] == start and path[-1] == end
+        for a, b in zip(path, path[1:]):
+            if max(abs(a[0] - b[0]), abs(a[1] - b[1])) == 1:
+                continue  # 网格路径本身允许对角线擦过角点，只检查平滑产生的直线
+            segments += 1
+            hits = [cell for cell in blocked if touches_cell(a, b, cell)]
+            assert not hits, f"{a} -> {b} 穿过 {hits}"
+    assert segments > 30
+
+
+def wall_distance(game_map, a, b):
+    """
+    像素坐标线段a-b到不可通行格子(以及地图边界外)的最小距离
+
+    按不超过0.5像素的间隔采样，计算采样点到每个障碍正方形的精确距离。
+    """
+    cell = game_map.cell_size
+    ys, xs = np.nonzero(game_map.get_cost_grid() < 0)
+    # 地图外一圈也是障碍
+    xs = np.concatenate([xs, np.arange(-1, game_map.width + 1), np.arange(-1, game_map.width + 1),
+                         np.full(game_map.height, -1), np.full(game_map.height, game_map.width)])
+    ys = np.concatenate([ys, np.full(game_map.width + 2, -1), np.full(game_map.width + 2, game_map.height),
+                         np.arange(game_map.height), np.arange(game_map.height)])
+    t = np.linspace(0.0, 1.0, int(math.dist(a, b) * 2) + 2)[:, None]
+    px = a[0] + (b[0] - a[0]) * t
+    py = a[1] + (b[1] - a[1]) * t
+    dx = np.maximum(np.maximum(xs * cell - px, px - (xs + 1) * cell), 0)
+    dy = np.maximum(np.maximum(ys * cell - py, py - (ys + 1) * cell), 0)
+    return float(np.sqrt(dx * dx + dy * dy).min())
+
+
+@pytest.mark.parametrize("radius", [10, 20])
+@pytest.mark.parametrize("any_angle", [False, True])
+def test_radius_path_clears_walls(radius, any_angle):
+    game_map = random_map(40, 30, 0.12, seed=9)
+    pathfinder = AStar(game_map)
+    clearance = game_map.get_clearance()
+    cells = [cell for cell in walkable_cells(game_map) if clearance[cell[1], cell[0]] > radius]
+    rng = random.Random(radius)
+    found = 0
+    for _ in range(40):
+        start, end = rng.sample(cells, 2)
+        path = pathfinder.find_path(start, end, any_angle=any_angle, radius=radius)
+        if not path:
+            continue
+        found += 1
+        points = [game_map.grid_to_pixel(*cell) for cell in path]
+        for a, b in zip(points, points[1:]):
+            # 距离按像素中心计算(见 Map.clearance_at)，允许半个像素和采样的误差
+            assert wall_distance(game_map, a, b) >= radius - 1, (a, b)
+    assert found >= 20
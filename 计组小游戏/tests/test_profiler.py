@@ -0,0 +1,23 @@
+import subprocess
+import sys
+
+from conftest import ROOT
+from game.profiler import Profiler
+
+
+def test_import_does_not_load_ui():
+    code = "import sys, game.profiler; print('game.ui' in sys.modules)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert output.stdout.split()[-1] == "False"
+
+
+def test_draw_hud(screen):
+    profiler = Profiler()
+    profiler.toggle_hud()
+    for _ in range(3):
+        profiler.begin_frame()
+        with profiler.section("update"):
+            pass
+        profiler.end_frame()
+    profiler.draw_hud(screen)
+    assert profiler._hud_lines and profiler._hud_lines[0].value.startswith("frame")
@@ -0,0 +1,59 @@
+import pygame
+
+from game.game_manager import GameManager
+from game.replay import InputRecorder, read_recording, replay
+
+# SDL2中方向键和功能键的键码超过16位
+KEYS = [pygame.K_RIGHT, pygame.K_LEFT, pygame.K_UP, pygame.K_DOWN,
+        pygame.K_F3, pygame.K_F5, pygame.K_F9, pygame.K_SPACE, pygame.K_m]
+
+
+def test_keys_roundtrip(tmp_path):
+    path = tmp_path / "keys.rec"
+    recorder = InputRecorder(path, seed=1, screen_size=(800, 600))
+    for key in KEYS:
+        recorder.record_event(pygame.event.Event(pygame.KEYDOWN, key=key))
+        recorder.record_frame(16)
+        recorder.record_event(pygame.event.Event(pygame.KEYUP, key=key))
+    recorder.close()
+
+    _, records = read_recording(path)
+    events = [record[1] for record in records if record[0] == "event"]
+    assert [(event.type, event.key) for event in events] == \
+        [(event_type, key) for key in KEYS for event_type in (pygame.KEYDOWN, pygame.KEYUP)]
+
+
+def test_replay_matches_direct_run(tmp_path, screen):
+    path = tmp_path / "right.rec"
+    game_manager = GameManager(screen, seed=5)
+    recorder = InputRecorder(path, seed=5, screen_size=screen.get_size())
+    start_x = game_manager.player.x
+    for event_type in (pygame.KEYDOWN, None, pygame.KEYUP):
+        if event_type is None:
+            for _ in range(60):
+                recorder.record_frame(16)
+                game_manager.update(0.016)
+            continue
+        event = pygame.event.Event(event_type, key=pygame.K_RIGHT, mod=0, unicode="", scancode=0)
+        recorder.record_event(event)
+        game_manager.handle_event(event)
+    recorder.close()
+
+    assert game_manager.player.x > start_x
+    assert replay(path).state_summary() == game_manager.state_summary()
+
+
+def test_replay_does_not_touch_quicksave(tmp_path, monkeypatch):
+    quicksave = tmp_path / "quicksave.snap"
+    quicksave.write_bytes(b"player save")
+    monkeypatch.setattr(GameManager, "QUICKSAVE_PATH", str(quicksave))
+
+    path = tmp_path / "quicksave.rec"
+    recorder = InputRecorder(path, seed=5, screen_size=(800, 600))
+    for key in (pygame.K_F5, pygame.K_F9):
+        recorder.record_event(pygame.event.Event(pygame.KEYDOWN, key=key))
+        recorder.record_frame(16)
+    recorder.close()
+
+    replay(path)
+    assert quicksave.read_bytes() == b"player save"
@@ -0,0 +1,31 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from game.pathfinding import AStar
+from game.route_batch import batch_routes
+
+from helpers import path_cost, random_map, walkable_cells
+
+
+@pytest.mark.parametrize("workers,queue", [(0, "heapq"), (0, "bucket"), (2, "heapq")])
+def test_batch_matches_find_path(workers, queue):
+    game_map = random_map(40, 30, 0.25, seed=5)
+    cells = walkable_cells(game_map)
+    rng = random.Random(4)
+    pairs = [(source, target) for source in rng.sample(cells, 10) for target in rng.sample(cells, 6)]
+    ys, xs = np.nonzero(game_map.get_cost_grid() < 0)
+    pairs.append((pairs[0][0], (int(xs[0]), int(ys[0]))))   # 终点不可通行
+
+    result = batch_routes(game_map, pairs, paths=True, workers=workers, queue=queue)
+    pathfinder = AStar(game_map)
+    for (source, target), distance, path in zip(pairs, result.distances, result.paths):
+        expected = pathfinder.find_path(source, target)
+        if not expected:
+            assert math.isinf(distance) and path == []
+            continue
+        assert distance == pytest.approx(path_cost(game_map, expected), abs=1e-6)
+        assert path[0] == source and path[-1] == target
+        assert path_cost(game_map, path) == pytest.approx(distance, abs=1e-6)
@@ -0,0 +1,38 @@
+import random
+
+import numpy as np
+import pytest
+
+from game.pathfinding import AStar
+from game.search_grid import SCALE, distance_field
+
+from helpers import dijkstra, path_cost, random_map, walkable_cells
+
+
+@pytest.mark.parametrize("grass_cost", [3, 2.3])
+def test_bucket_matches_heapq(grass_cost):
+    game_map = random_map(40, 30, 0.25, seed=4)
+    game_map.TERRAIN_COSTS = {**type(game_map).TERRAIN_COSTS, game_map.GRASS: grass_cost}
+    heap, bucket = AStar(game_map), AStar(game_map, queue="bucket")
+    cells = walkable_cells(game_map)
+    rng = random.Random(0)
+    for _ in range(40):
+        start, end = rng.sample(cells, 2)
+        expected = heap.find_path(start, end)
+        path = bucket.find_path(start, end)
+        assert bool(path) == bool(expected)
+        if path:
+            # 整数成本每一步最多相差 0.5 / SCALE
+            assert path_cost(game_map, path) == pytest.approx(path_cost(game_map, expected),
+                                                              abs=len(path) / SCALE)
+
+
+def test_distance_field_matches_dijkstra():
+    game_map = random_map(30, 20, 0.25, seed=2)
+    source = game_map.start_point
+    reference = dijkstra(game_map, source)
+    expected = np.full((game_map.height, game_map.width), np.inf)
+    for (x, y), cost in reference.items():
+        expected[y, x] = cost
+    assert np.allclose(distance_field(game_map, source), expected)
+    assert np.allclose(distance_field(game_map, source, queue="bucket"), expected, atol=1e-9)
@@ -0,0 +1,120 @@
+import asyncio
+import json
+
+import pytest
+
+from game.server import SimulationServer
+
+
+class FakeTransport:
+    def __init__(self):
+        self.buffered = 0
+
+    def get_write_buffer_size(self):
+        return self.buffered
+
+
+class FakeWriter:
+    """记录写入消息的连接，发送缓冲大小可以由测试设置"""
+
+    def __init__(self):
+        self.transport = FakeTransport()
+        self.messages = []
+
+    def is_closing(self):
+        return False
+
+    def write(self, data):
+        self.messages.extend(json.loads(line) for line in data.splitlines())
+
+
+def create(server, writer, owned, n=1):
+    reply = server._handle_message({"op": "create", "n": n, "seed": 1}, writer, owned)
+    return reply["ids"]
+
+
+def test_action_batch_is_checked_before_applying():
+    server = SimulationServer()
+    owned = []
+    session_id, = create(server, FakeWriter(), owned)
+    player = server.sessions[session_id].player
+    with pytest.raises(ValueError):
+        server._handle_message({"op": "act", "a": [[session_id, "move", 1, 0], [session_id, "goto", 1.5, 2]]},
+                               None, owned)
+    assert not player.moving_right
+
+    reply = server._handle_message({"op": "act", "seq": 3, "a": [[session_id, "move", 1, 0]]}, None, owned)
+    assert reply == {"t": "ack", "seq": 3}
+    assert player.moving_right
+
+
+@pytest.mark.parametrize("message", [
+    {"op": "act", "a": [[1, "move", 1, 0]]},
+    {"op": "reset", "ids": [1]},
+    {"op": "close", "ids": [1]},
+])
+def test_other_connections_sessions_are_rejected(message):
+    server = SimulationServer()
+    owned_a = []
+    create(server, FakeWriter(), owned_a)
+    with pytest.raises(ValueError):
+        server._handle_message(message, FakeWriter(), [])
+    assert 1 in server.sessions and owned_a == [1]
+    assert not server.sessions[1].player.moving_right
+
+
+def test_close_own_sessions():
+    server = SimulationServer()
+    owned = []
+    ids = create(server, FakeWriter(), owned, n=2)
+    server._handle_message({"op": "close", "ids": [ids[0], ids[0]]}, None, owned)
+    assert owned == [ids[1]] and list(server.sessions) == [ids[1]]
+
+
+def test_deltas_paused_while_congested():
+    server = SimulationServer()
+    writer = FakeWriter()
+    session_id, = create(server, writer, [])
+    session = server.sessions[session_id]
+
+    def tick():
+        session.started -= 1.0   # 保证每一拍都有到期的帧
+        writer.messages.clear()
+        server.tick()
+        return writer.messages
+
+    first, = tick()
+    assert set(first["d"][str(session_id)]) == set(session.state())
+    assert session.delta() is None   # 没有变化时没有增量
+
+    # 发送缓冲已满时推迟增量，恢复后一起发送累积的变化
+    session.player.moving_right = True
+    x = session.player.x
+    writer.transport.buffered = server.max_write_buffer + 1
+    assert tick() == [] and server.skipped_deltas == 1
+    session.player.moving_right = False
+    writer.transport.buffered = 0
+    delta, = tick()
+    assert delta["d"][str(session_id)]["x"] > x
+
+
+def test_error_reply_keeps_connection_open():
+    async def run():
+        server = SimulationServer(port=0)
+        await server.start()
+        try:
+            reader, writer = await asyncio.open_connection(server.host, server.port)
+            replies = []
+            for line in (b"not json\n", b"[1, 2]\n", b'{"op": "act", "seq": 5, "a": 3}\n',
+                         b'{"op": "stats"}\n'):
+                writer.write(line)
+                await writer.drain()
+                replies.append(json.loads(await reader.readline()))
+            writer.close()
+            return replies
+        finally:
+            await server.stop()
+
+    replies = asyncio.run(run())
+    assert [reply["t"] for reply in replies] == ["error", "error", "error", "stats"]
+    assert replies[2]["seq"] == 5
@@ -0,0 +1,69 @@
+import pytest
+
+from game import snapshot
+from game.game_manager import GameManager
+from game.map import Map
+from game.snapshot import dump_snapshot, restore_snapshot
+
+from helpers import make_order_feed, run_frames
+
+
+def game_state(game_manager):
+    package_manager = game_manager.package_manager
+    feed = package_manager.order_feed
+    return (game_manager.state_summary(), package_manager.pending_spawns(),
+            None if feed is None else feed.state())
+
+
+def check_roundtrip(make_game, warmup, frames):
+    """存档后继续运行得到的状态，与读档(同一局和新的一局)后运行相同帧数得到的状态相同"""
+    game_manager = make_game()
+    run_frames(game_manager, warmup)
+    data = dump_snapshot(game_manager)
+    run_frames(game_manager, frames)
+    expected = game_state(game_manager)
+    for target in (game_manager, make_game()):
+        restore_snapshot(target, data)
+        run_frames(target, frames)
+        assert game_state(target) == expected
+
+
+def test_roundtrip_with_order_feed(screen):
+    # 存档时订单已经读到日志中间(跨越订单块和无法解析的地址)
+    check_roundtrip(lambda: GameManager(screen, seed=7, orders=make_order_feed(Map(), 400, seed=7, minutes=0.5)),
+                    600, 1200)
+
+
+def test_roundtrip_with_pending_spawns(screen):
+    # 开局的新包裹还在等待路径查询时存档
+    def fresh_game():
+        game_manager = GameManager(screen, seed=11)
+        assert game_manager.package_manager.pending_spawns()
+        return game_manager
+    check_roundtrip(fresh_game, 0, 120)
+
+
+def test_large_package_ids(screen):
+    game_manager = GameManager(screen, seed=7, orders=make_order_feed(Map(), 400, seed=7, minutes=0.5))
+    run_frames(game_manager, 600)
+    ids = [p.id for p in game_manager.package_manager.packages]
+    assert max(ids) >= 3_000_000_000
+    restore_snapshot(game_manager, dump_snapshot(game_manager))
+    assert [p.id for p in game_manager.package_manager.packages] == ids
+
+
+def test_day_and_elapsed_restored(screen):
+    game_manager = GameManager(screen, seed=1)
+    game_manager.start_game()
+    run_frames(game_manager, 30)
+    data = dump_snapshot(game_manager)
+    target = GameManager(screen, seed=1)
+    restore_snapshot(target, data)
+    assert (target.day, target.elapsed) == (2, game_manager.elapsed)
+
+
+def test_rejects_older_version(screen):
+    data = bytearray(dump_snapshot(GameManager(screen, seed=1)))
+    data[4] = snapshot.VERSION - 1
+    with pytest.raises(ValueError):
+        restore_snapshot(GameManager(screen, seed=1), bytes(data))
@@ -0,0 +1,51 @@
+import pygame
+
+from game.map import Map
+from game.package_manager import Package, PackageManager
+from game.player import Player
+from game.sprites import SpriteRenderer
+
+
+def old_draw(game_map, manager, player):
+    """精灵渲染之前的绘制方式: 每帧画地图、包裹和玩家"""
+    surface = pygame.Surface((game_map.width * game_map.cell_size, game_map.height * game_map.cell_size))
+    game_map.draw(surface)
+    manager.draw(surface)
+    player.draw(surface)
+    return surface
+
+
+def assert_same_pixels(a, b):
+    assert a.get_size() == b.get_size()
+    assert pygame.image.tobytes(a, "RGB") == pygame.image.tobytes(b, "RGB")
+
+
+def test_sprites_match_old_draw(screen):
+    game_map = Map()
+    manager = PackageManager(game_map)
+    waiting = Package(game_map.start_point, game_map.delivery_points[0], 200, 10, package_id=7)
+    manager.packages.append(waiting)
+    for i, destination in enumerate(game_map.delivery_points[1:4]):
+        package = Package(game_map.start_point, destination, 200, 10, package_id=100 + i)
+        package.pick_up(0)
+        manager.packages.append(package)
+        manager.active_packages.append(package)
+    player = Player(game_map)
+    player.x, player.y = game_map.grid_to_pixel(5, 3)
+
+    renderer = SpriteRenderer(game_map)
+    surface = pygame.Surface((game_map.width * game_map.cell_size, game_map.height * game_map.cell_size))
+    renderer.draw(surface, manager, [player])
+    assert_same_pixels(surface, old_draw(game_map, manager, player))
+
+    # 之后的帧只重绘改变的区域: 拾取等待的包裹、交付一个包裹、玩家移动
+    waiting.pick_up(1)
+    manager.active_packages.append(waiting)
+    delivered = manager.active_packages.pop(0)
+    delivered.deliver(1)
+    player.carrying_package = True
+    for step in range(5):
+        player.x += 7
+        player.y += 3
+        renderer.draw(surface, manager, [player])
+        assert_same_pixels(surface, old_draw(game_map, manager, player))
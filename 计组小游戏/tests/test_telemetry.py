@@ -0,0 +1,31 @@
+from game.telemetry import DELIVER, PICKUP, SPAWN, Telemetry, TelemetryStore
+
+
+def record_day(directory, x):
+    """一次运行: 第1天生成、拾取并配送一个包裹，快递员从x移动到x+30"""
+    telemetry = Telemetry(str(directory), chunk_size=4)
+    telemetry.start_day(1)
+    telemetry.record(SPAWN, 0.0, package=3_000_000_000, value=50, aux=90)
+    telemetry.sample_position(0.0, x, 0.0)
+    telemetry.record(PICKUP, 1.0, package=3_000_000_000)
+    telemetry.sample_position(2.0, x + 30.0, 0.0)
+    telemetry.record(DELIVER, 3.0, package=3_000_000_000, value=40, aux=2.0)
+    telemetry.close()
+    return telemetry.run
+
+
+def test_daily_aggregates(tmp_path):
+    run = record_day(tmp_path, 0.0)
+    assert TelemetryStore(str(tmp_path)).daily_aggregates() == {
+        (run, 1): {"spawned": 1, "picked": 1, "delivered": 1, "expired": 0, "score": 40,
+                   "distance_px": 30.0, "mean_delivery_minutes": 2.0},
+    }
+
+
+def test_runs_are_not_merged(tmp_path):
+    first = record_day(tmp_path, 0.0)
+    second = record_day(tmp_path, 1000.0)
+    assert first != second
+    aggregates = TelemetryStore(str(tmp_path)).daily_aggregates()
+    assert sorted(aggregates) == [(first, 1), (second, 1)]
+    assert [stats["distance_px"] for stats in aggregates.values()] == [30.0, 30.0]
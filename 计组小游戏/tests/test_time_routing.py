@@ -0,0 +1,30 @@
+import random
+
+import numpy as np
+import pytest
+
+from game.map import Map
+from game.time_routing import CostProfile, TimeDependentRouter
+
+from helpers import dijkstra, walkable_cells
+
+
+def test_uniform_profile_matches_dijkstra():
+    game_map = Map()
+    router = TimeDependentRouter(game_map, CostProfile.uniform(game_map), unit_minutes=1.0)
+    start = game_map.start_point
+    reference = dijkstra(game_map, start)
+    for end in random.Random(0).sample(walkable_cells(game_map), 20):
+        arrival, path = router.earliest_arrival(start, end, depart=30.0)
+        assert arrival - 30.0 == pytest.approx(reference[end])
+        assert path[0] == start and path[-1] == end
+
+
+def test_earliest_arrival_is_fifo():
+    """晚出发永远不会早到达，包括跨过课间拥挤时段的开始和结束"""
+    game_map = Map()
+    router = TimeDependentRouter(game_map, CostProfile.rush_hours(game_map), unit_minutes=1.0)
+    start = game_map.start_point
+    for end in random.Random(1).sample(walkable_cells(game_map), 5):
+        arrivals = [router.earliest_arrival(start, end, depart)[0] for depart in np.arange(60.0, 130.0, 0.5)]
+        assert all(b >= a - 1e-9 for a, b in zip(arrivals, arrivals[1:]))
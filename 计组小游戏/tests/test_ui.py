@@ -0,0 +1,46 @@
+from game.event_bus import SCORE_CHANGED, EventBus
+from game.ui import UI
+
+
+def count_renders(label):
+    """包装控件的渲染函数，返回记录每次渲染的值的列表"""
+    rendered = []
+    render = label.render
+
+    def counting(value):
+        rendered.append(value)
+        return render(value)
+    label.render = counting
+    return rendered
+
+
+def test_info_panel_renders_only_changed_text(screen):
+    ui = UI(screen)
+    labels = ui._info_view.labels
+    rendered = {name: count_renders(label) for name, label in labels.items()}
+
+    # 两秒真实时间(120帧)，得分和天气不变，时钟每秒跳一次
+    times = [300.0 - frame / 3600 for frame in range(120)]
+    for time in times:
+        ui.draw(screen, 150, time, "SUNNY")
+    assert rendered["score"] == [150]
+    assert rendered["weather"] == ["SUNNY"]
+    assert rendered["time"] == [(300, 0), (299, 59), (299, 58)]
+
+    ui.draw(screen, 175, times[-1], "RAINY")
+    assert rendered["score"] == [150, 175]
+    assert rendered["weather"] == ["SUNNY", "RAINY"]
+    assert len(rendered["time"]) == 3
+
+
+def test_score_follows_events(screen):
+    bus = EventBus()
+    ui = UI(screen, bus=bus)
+    rendered = count_renders(ui._info_view.labels["score"])
+    for _ in range(10):
+        ui.draw(screen, 0, 300.0, "SUNNY")   # 有事件总线时不使用传入的得分
+    assert rendered == []
+    bus.publish(SCORE_CHANGED, score=40)
+    bus.publish(SCORE_CHANGED, score=40)
+    ui.draw(screen, 0, 300.0, "SUNNY")
+    assert rendered == [40]
@@ -0,0 +1,51 @@
+import numpy as np
+
+from game.depots import assign_depot
+from game.map import Map
+from game.package_manager import Package
+from game.vector_env import DAY_MINUTES, DELIVERED, PICKED, WAITING, VectorEnv
+
+
+def test_packages_wait_at_assigned_depots():
+    """有多个快递站时，包裹在 assign_depot 的快递站等待，回到任意快递站都可以提前完成"""
+    game_map = Map()
+    depot = game_map.delivery_points[-1][0], game_map.delivery_points[-1][1] - 1
+    game_map.add_depot(*depot)
+    env = VectorEnv(1, maps=game_map, packages_per_env=32, seed=0, auto_reset=False)
+    starts = [tuple(start) for start in env.pkg_start[0].tolist()]
+    destinations = [tuple(destination) for destination in env.pkg_dest[0].tolist()]
+    assert starts == [assign_depot(game_map, destination) for destination in destinations]
+    assert tuple(depot) in starts
+
+    env.pkg_status[:] = DELIVERED
+    env.x[:], env.y[:] = game_map.grid_to_pixel(*depot)
+    _, _, done = env.step([0])
+    assert done[0] and env.completed[0]
+
+
+def test_delivery_reward_matches_package_deliver():
+    """每个环境在配送点上交付一个携带中的包裹，得分与 Package.deliver 相同(包括超时和小数时间)"""
+    game_map = Map()
+    destination = game_map.delivery_points[0]
+    n = 64
+    rng = np.random.default_rng(3)
+    env = VectorEnv(n, maps=game_map, packages_per_env=2, seed=0, auto_reset=False)
+    env.x[:], env.y[:] = game_map.grid_to_pixel(*destination)
+    env.time[:] = rng.uniform(0, DAY_MINUTES, n)
+    env.carrying[:] = 1
+    env.pkg_status[:, 0] = PICKED
+    env.pkg_dest[:, 0] = destination
+    env.pkg_deadline[:, 0] = rng.uniform(0, DAY_MINUTES + 100, n)
+    env.pkg_value[:, 0] = rng.integers(10, 80, n)
+    # 另一个包裹还在别处等待，避免提前完成的奖励
+    env.pkg_status[:, 1] = WAITING
+    env.pkg_start[:, 1] = game_map.start_point
+    env.pkg_deadline[:, 1] = 1e9
+
+    game_time = DAY_MINUTES - env.time
+    expected = [Package(game_map.start_point, destination, deadline, value).deliver(now)
+                for deadline, value, now in zip(env.pkg_deadline[:, 0].tolist(), env.pkg_value[:, 0].tolist(),
+                                                game_time.tolist())]
+    _, reward, done = env.step(np.zeros(n, dtype=np.int64))
+    assert reward.tolist() == expected
+    assert (env.pkg_status[:, 0] == DELIVERED).all() and not done.any()
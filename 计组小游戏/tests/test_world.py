@@ -0,0 +1,29 @@
+from game.world import ChunkedWorld, ChunkPathfinder
+
+
+def test_pinned_chunks_survive_updates_and_budget():
+    """寻路请求的区块不会被之后每帧 update 的请求替换，也不会因超出内存预算被释放"""
+    with ChunkedWorld(seed=1, chunks=(16, 16), memory_budget=1, load_radius=0) as world:
+        world.update([(15, 15)])
+        world.wait()
+        pathfinder = ChunkPathfinder(world)
+        assert pathfinder.find_path((0, 0), (120, 100)) == []   # 区块未加载
+        world.update([(15, 15)])   # 摄像机仍在起点附近
+        world.wait()
+        world.update([(15, 15)])   # 取回加载完成的区块，内存超出预算
+        assert pathfinder.find_path((0, 0), (120, 100))
+        assert not world._pinned
+
+
+def test_failed_chunk_is_blocked_not_pinned(tmp_path):
+    """加载失败的区块按不可通行处理，不会被一直固定等待加载"""
+    (tmp_path / "chunk_1_1.npy").write_bytes(b"not a chunk")
+    with ChunkedWorld(seed=1, chunks=(16, 16), directory=str(tmp_path), load_radius=0) as world:
+        pathfinder = ChunkPathfinder(world)
+        assert pathfinder.find_path((0, 0), (40, 40)) == []
+        world.wait()
+        assert world.is_failed((1, 1))
+        for _ in range(3):   # 第二次查询扩大范围，等扩大后的范围加载完成
+            assert pathfinder.find_path((0, 0), (40, 40)) == []
+            world.wait()
+        assert not world._pinned